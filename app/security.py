@@ -1,9 +1,8 @@
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from pydantic import ValidationError
-from jose import JWTError, jwt
 from datetime import datetime, timedelta, timezone
-from passlib.context import CryptContext
+from functools import lru_cache
 from .schemas.user import UserResponse # 👈 사용자 정보 DTO
 # TokenData는 현재 사용되지 않으므로 import 제거
 # from .schemas.auth import TokenData
@@ -17,7 +16,12 @@ ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24 # 1일
 REFRESH_TOKEN_EXPIRE_DAYS = 7 # 7일
 
 # 비밀번호 해싱을 위한 컨텍스트
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# (jose/passlib은 cryptography 백엔드 로딩 때문에 임포트가 느려서 처음 사용할 때 불러옵니다)
+@lru_cache(maxsize=1)
+def get_pwd_context():
+    from passlib.context import CryptContext
+
+    return CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 # (1-1) FastAPI가 "/api/auth/login"에서 토큰을 사용함을 알림 (지금은 사용 안함)
 # oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login")
@@ -30,14 +34,16 @@ oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 # --- (2) 비밀번호 검증 ---
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """평문 비밀번호와 해시된 비밀번호를 비교"""
-    return pwd_context.verify(plain_password, hashed_password)
+    return get_pwd_context().verify(plain_password, hashed_password)
 
 def get_password_hash(password: str) -> str:
     """비밀번호를 해시화"""
-    return pwd_context.hash(password)
+    return get_pwd_context().hash(password)
 
 # --- (3) 토큰 생성 (auth.py에서 사용) ---
 def create_access_token(data: dict):
+    from jose import jwt
+
     to_encode = data.copy()
     expire = datetime.now(timezone.utc) + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     to_encode.update({"exp": expire})
@@ -46,6 +52,8 @@ def create_access_token(data: dict):
     return encoded_jwt
 
 def create_refresh_token(data: dict):
+    from jose import jwt
+
     to_encode = data.copy()
     expire = datetime.now(timezone.utc) + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
     to_encode.update({"exp": expire})
@@ -94,6 +102,7 @@ async def get_current_user(token: str = Depends(oauth2_scheme)) -> UserResponse:
     이 함수가 /api/users/me 같은 보호된 엔드포인트에서
     'Depends()'에 의해 호출되어 토큰을 검증하고 사용자 정보를 반환합니다.
     """
+    from jose import JWTError, jwt
     
     # (3-1) 토큰 디코딩 시도
     try:
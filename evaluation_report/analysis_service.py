@@ -1,21 +1,66 @@
 import os
 import re
 import json
+import time
+import asyncio
+import hashlib
+import functools
 import logging
 import unicodedata
-from typing import Optional
+from typing import Callable, Optional
 from fastapi import UploadFile
 
+import app_config
 import file_utils
+import image_utils
 import db_utils
-from gemini_service import GeminiService
+import metrics
+import near_duplicates
+from tracing import tracer
+from gemini_service import (
+    IMAGE_TOKEN_COST,
+    DailyQuotaExhausted,
+    GeminiService,
+    estimate_contents_tokens,
+    estimate_prompt_tokens,
+    estimate_text_tokens,
+    format_local_time,
+)
+from event_bus import EventBus
+from key_pool import DeadlineExceeded
+from stream_json import IncrementalJSONParser
 
 logger = logging.getLogger(__name__)
 
+# 모델에 보내는 텍스트 최대 길이(넘으면 앞뒤만 전송)와 이미지 수
+MAX_TOTAL_CHARS = 25000
+MAX_IMAGES_TO_SEND = 3
+# 평가 결과에 표시하는 유사 보고서 최대 개수
+MAX_NEAR_DUPLICATES = 5
+
 
 class AnalysisService:
-    def __init__(self, gemini_service: GeminiService):
+    def __init__(
+        self,
+        gemini_service: GeminiService,
+        event_bus: Optional[EventBus] = None,
+        extraction_cache=None,
+    ):
         self.gemini_service = gemini_service
+        self.event_bus = event_bus
+        # 파일별 추출 결과 캐시 (ExtractionCache, 없으면 매번 파싱)
+        self.extraction_cache = extraction_cache
+        # 묶음(packing) 모드: 작은 쌍 여러 개를 한 번의 요청으로 평가 (RPM 제한 대응, 선택 사항)
+        self.packing_enabled = app_config.PACKING_ENABLED
+        self.packing_max_pairs = app_config.PACKING_MAX_PAIRS
+        self.packing_token_budget = app_config.PACKING_TOKEN_BUDGET
+        self.packing_small_pair_tokens = app_config.PACKING_SMALL_PAIR_TOKENS
+        self.packing_linger_seconds = app_config.PACKING_LINGER_SECONDS
+
+    def _emit(self, job_id: Optional[str], key: str, event_type: str, **payload):
+        """진행 이벤트를 이벤트 버스로 발행합니다. (버스가 없으면 무시)"""
+        if self.event_bus:
+            self.event_bus.publish(job_id, event_type, key=key, **payload)
 
     def extract_info_from_filename(self, filename: str) -> dict:
         """파일명에서 캠퍼스, 반, 작성자 정보를 추출합니다."""
@@ -74,33 +119,254 @@ class AnalysisService:
         plan_file: Optional[UploadFile],
         report_file: Optional[UploadFile],
         system_prompt: str,
+        job_id: Optional[str] = None,
     ):
+        """한 쌍을 추출 → 프롬프트 구성 → 모델 호출 → 저장 단계로 순서대로 처리합니다."""
+        extracted = await self.extract_pair(key, plan_file, report_file, job_id)
+        if extracted.get("status") == "error":
+            return extracted
+        review = await self.check_near_duplicates(key, extracted, job_id)
+        if review:
+            return review
+
+        prepared = self.prepare_api_contents(key, extracted, job_id)
+        try:
+            api_response_text = await self.call_model(
+                key, system_prompt, prepared["api_contents"], job_id
+            )
+        except Exception as e:
+            return self.build_error_result(
+                key, extracted["target_filename"], e, job_id, stage="model"
+            )
+        return await self.persist_result(key, extracted, api_response_text, job_id)
+
+    async def extract_pair(
+        self,
+        key: str,
+        plan_file: Optional[UploadFile],
+        report_file: Optional[UploadFile],
+        job_id: Optional[str] = None,
+    ) -> dict:
+        """[1단계] 파일을 한 번만 읽어 이미지와 텍스트를 추출합니다."""
         logger.info(f"[{key}] 쌍 처리 시작...")
+        self._emit(job_id, key, "extracting")
+        with tracer.span("extract", job_id, key):
+            return await self._extract_pair(key, plan_file, report_file, job_id)
+
+    async def _extract_pair(
+        self,
+        key: str,
+        plan_file: Optional[UploadFile],
+        report_file: Optional[UploadFile],
+        job_id: Optional[str],
+    ) -> dict:
+        target_filename = report_file.filename if report_file else plan_file.filename
+
+        # 1. 이미지 추출 (실제 개수 카운팅) 및 2. 텍스트 추출
+        image_entries = []
+        combined_text = ""
+        report_text = ""
+        for label, file in [("계획서", plan_file), ("결과보고서", report_file)]:
+            if not file:
+                continue
+            extraction = await self._extract_file(file)
+            image_entries.extend({**image, "source": label} for image in extraction["images"])
+            text = extraction["text"]
+            combined_text += f"# [{label} 데이터]\n{text}\n\n"
+            if label == "결과보고서":
+                report_text = text
 
-        # 1. 이미지 추출 (실제 개수 카운팅)
+        # 두 파일에 같이 붙은 사진과 로고/장식 이미지를 빼고 정보량 순으로 정렬
         extracted_images = []
-        for file in [plan_file, report_file]:
-            if file and file.filename.lower().endswith(".xlsx"):
-                await file.seek(0)
-                content = await file.read()
-                extracted_images.extend(file_utils.extract_images_from_excel(content))
-                await file.seek(0)
+        if image_entries:
+            with metrics.EXTRACTION_SECONDS.time(kind="dedupe"):
+                extracted_images, dedupe_stats = await asyncio.to_thread(
+                    image_utils.rank_photos, image_entries
+                )
+            if dedupe_stats["duplicates"] or dedupe_stats["low_information"]:
+                logger.info(
+                    f"[{key}] 이미지 {dedupe_stats['total']}장 중 중복 {dedupe_stats['duplicates']}장, "
+                    f"저정보(로고/장식) {dedupe_stats['low_information']}장 제외"
+                )
+        del image_entries
 
         actual_photo_count = len(extracted_images)
         logger.info(f"[{key}] 실제 감지된 이미지: {actual_photo_count}장")
 
-        # 2. 텍스트 추출
-        combined_text = ""
-        if plan_file:
-            combined_text += f"# [계획서 데이터]\n{await file_utils.read_upload_file_content(plan_file)}\n\n"
-        if report_file:
-            combined_text += f"# [결과보고서 데이터]\n{await file_utils.read_upload_file_content(report_file)}\n\n"
-
         if not combined_text:
+            metrics.ERRORS_TOTAL.inc(stage="extract", type="EmptyContent")
+            self._emit(job_id, key, "failed", error="내용 없음")
             return {"key": key, "status": "error", "error": "내용 없음"}
 
+        # 사진을 격자 콜라주로 묶어 같은 이미지 토큰 예산 안에서 모든 증빙 자료를 전달
+        collage_photos = None
+        if app_config.COLLAGE_ENABLED and extracted_images:
+            with metrics.EXTRACTION_SECONDS.time(kind="collage"):
+                extracted_images, collage_photos = await asyncio.to_thread(
+                    image_utils.build_collages, extracted_images
+                )
+
+        # 유사 보고서 탐지용 서명 (보고서가 없으면 계획서 텍스트 기준)
+        minhash = None
+        if app_config.NEAR_DUPLICATE_ENABLED:
+            with metrics.EXTRACTION_SECONDS.time(kind="minhash"):
+                minhash = await asyncio.to_thread(
+                    near_duplicates.text_signature, report_text or combined_text
+                )
+
+        return {
+            "key": key,
+            "target_filename": target_filename,
+            "images": extracted_images,
+            "photo_count": actual_photo_count,
+            "collage_photos": collage_photos,
+            "combined_text": combined_text,
+            "minhash": minhash,
+        }
+
+    async def _extract_file(self, file: UploadFile) -> dict:
+        """
+        파일 하나의 텍스트와 사진(축소본 + 특징)을 추출합니다. {"text", "images"}
+        같은 내용(SHA-256)의 파일을 이미 추출했으면 캐시에서 가져옴 (바뀌지 않은 계획서를 다시 올린 경우 등)
+        """
+        cache = self.extraction_cache
+        # 저장소 파일은 해시를 이미 알고 있으므로 파일을 읽지 않고 캐시를 확인
+        sha256 = getattr(file, "sha256", None)
+        if cache and sha256:
+            cached = await asyncio.to_thread(cache.get, sha256)
+            if cached is not None:
+                return cached
+
+        await file.seek(0)
+        content = await file.read()
+        if cache and not sha256:
+            sha256 = hashlib.sha256(content).hexdigest()
+            cached = await asyncio.to_thread(cache.get, sha256)
+            if cached is not None:
+                return cached
+
+        # pandas/PIL 파싱은 CPU 작업이므로 이벤트 루프를 막지 않도록 스레드에서 실행
+        images = []
+        if file.filename.lower().endswith(".xlsx"):
+            with metrics.EXTRACTION_SECONDS.time(kind="images"):
+                entries = await asyncio.to_thread(
+                    file_utils.extract_image_entries_from_excel, content
+                )
+                images = await asyncio.to_thread(image_utils.compact_photo_entries, entries)
+            del entries
+        with metrics.EXTRACTION_SECONDS.time(kind="text"):
+            text = await asyncio.to_thread(
+                file_utils.extract_text_from_bytes, file.filename, content
+            )
+        del content
+
+        extraction = {"text": text, "images": images}
+        if cache:
+            await asyncio.to_thread(cache.put, sha256, extraction)
+        return extraction
+
+    async def check_near_duplicates(
+        self,
+        key: str,
+        extracted: dict,
+        job_id: Optional[str] = None,
+        allow_review: bool = True,
+    ) -> Optional[dict]:
+        """
+        이전 결과 중 보고서 텍스트가 거의 같은 결과를 LSH 색인으로 찾아 extracted["near_duplicates"]에 기록합니다.
+        NEAR_DUPLICATE_ACTION이 "review"이면 모델을 호출하지 않도록 검토 대기 결과를 반환합니다.
+        (allow_review=False는 검토 후 승인된 쌍: 표시만 하고 평가 진행)
+        """
+        signature = extracted.get("minhash")
+        if signature is None:
+            return None
+        buckets = near_duplicates.band_buckets(signature)
+        extracted["minhash_buckets"] = buckets
+        candidates = await asyncio.to_thread(db_utils.find_minhash_candidates, buckets)
+
+        matches = []
+        for candidate in candidates:
+            # 재분석 중인 자기 자신의 이전 결과는 제외
+            if candidate["result_id"] == extracted.get("result_id"):
+                continue
+            score = near_duplicates.similarity(signature, candidate["signature"])
+            if score >= app_config.NEAR_DUPLICATE_THRESHOLD:
+                matches.append(
+                    {
+                        "result_id": candidate["result_id"],
+                        "filename": candidate["filename"],
+                        "total_score": candidate["total_score"],
+                        "created_at": candidate["created_at"],
+                        "similarity": round(score, 3),
+                    }
+                )
+        if not matches:
+            return None
+
+        matches.sort(key=lambda m: m["similarity"], reverse=True)
+        matches = matches[:MAX_NEAR_DUPLICATES]
+        extracted["near_duplicates"] = matches
+        logger.warning(
+            f"[{key}] 유사 보고서 {len(matches)}건 발견: "
+            + ", ".join(f"ID {m['result_id']}({m['similarity']:.0%})" for m in matches)
+        )
+        self._emit(job_id, key, "near_duplicate", near_duplicates=matches)
+
+        if not allow_review or app_config.NEAR_DUPLICATE_ACTION != "review":
+            return None
+        self._emit(job_id, key, "review", filename=extracted["target_filename"])
+        return {
+            "key": key,
+            "filename": extracted["target_filename"],
+            "status": "review",
+            "error": "이전 결과와 거의 같은 보고서입니다. 검토 후 승인하면 평가합니다.",
+            "near_duplicates": matches,
+        }
+
+    def prepare_api_contents(
+        self, key: str, extracted: dict, job_id: Optional[str] = None
+    ) -> dict:
+        """[2단계] 텍스트 요약, 이미지 선택, 프롬프트 구성을 수행합니다."""
+        with tracer.span("prepare", job_id, key):
+            return self._prepare_api_contents(key, extracted)
+
+    def _prepare_api_contents(self, key: str, extracted: dict) -> dict:
+        # 4. 이미지 전송 개수 제한
+        images_to_send = extracted["images"][:MAX_IMAGES_TO_SEND]
+        final_prompt_content = self._build_prompt_text(
+            key,
+            extracted["combined_text"],
+            extracted["photo_count"],
+            len(images_to_send),
+            extracted.get("collage_photos"),
+        )
+        api_contents = [final_prompt_content] + images_to_send
+
+        # 6. 디버그 저장
+        os.makedirs("debug", exist_ok=True)
+        with open(f"debug/debug_payload_{key}.txt", "w", encoding="utf-8") as f:
+            f.write(final_prompt_content)
+
+        return {
+            "api_contents": api_contents,
+            "estimated_tokens": estimate_contents_tokens(api_contents),
+            "payload_bytes": len(final_prompt_content.encode("utf-8"))
+            + sum(img.width * img.height * len(img.getbands()) for img in images_to_send),
+        }
+
+    def _build_prompt_text(
+        self,
+        key: str,
+        combined_text: str,
+        actual_photo_count: int,
+        images_sent: int,
+        collage_photos: Optional[int] = None,
+    ) -> str:
+        """
+        요약한 텍스트에 내부 참고 자료 헤더를 붙여 모델에 보낼 텍스트를 만듭니다.
+        collage_photos가 있으면 첨부 이미지는 사진 collage_photos장을 묶은 격자 콜라주입니다.
+        """
         # 3. 텍스트 스마트 요약
-        MAX_TOTAL_CHARS = 25000
         if len(combined_text) > MAX_TOTAL_CHARS:
             head_chars = 20000
             tail_chars = 5000
@@ -111,14 +377,14 @@ class AnalysisService:
             )
             logger.info(f"[{key}] 텍스트 과다로 앞뒤만 추출하여 전송")
 
-        # 4. 이미지 전송 개수 제한
-        MAX_IMAGES_TO_SEND = 3
-        images_to_send = extracted_images[:MAX_IMAGES_TO_SEND]
-
         # 5. 프롬프트 구성
+        if collage_photos:
+            evidence_note = f"파일 내부의 사진 총 **{actual_photo_count}장** 중 {collage_photos}장을 격자 콜라주 {images_sent}장으로 묶어 첨부함. 콜라주의 각 칸이 사진 한 장이므로, 모든 칸을 확인하여 증빙 자료의 양과 질을 평가할 것."
+        else:
+            evidence_note = f'기술적 제약으로 샘플 {images_sent}장만 보이지만, 실제 파일 내부에는 총 **{actual_photo_count}장**의 사진이 포함되어 있음. (평가 시 "풍부한 증빙 자료가 제출되었다"고 판단할 것)'
         context_header = f"""
         [분석가를 위한 내부 참고 자료 (절대 출력 금지)]
-        1. **실제 증빙 자료**: 기술적 제약으로 샘플 {len(images_to_send)}장만 보이지만, 실제 파일 내부에는 총 **{actual_photo_count}장**의 사진이 포함되어 있음. (평가 시 "풍부한 증빙 자료가 제출되었다"고 판단할 것)
+        1. **실제 증빙 자료**: {evidence_note}
         2. **텍스트 요약**: 내용이 길어 중간이 생략되었으나, 문맥을 통해 전체를 읽은 것처럼 평가할 것.
 
         [출력 시 주의사항]
@@ -126,29 +392,325 @@ class AnalysisService:
         - 마치 당신이 **{actual_photo_count}장의 사진을 모두 직접 눈으로 확인했고, 전체 글을 꼼꼼히 다 읽은 사람처럼** 자연스럽게 작성하십시오.
         --------------------------------------------------
         """
+        return context_header + combined_text
 
-        final_prompt_content = context_header + combined_text
-        api_contents = [final_prompt_content] + images_to_send
+    async def call_model(
+        self,
+        key: str,
+        system_prompt: str,
+        api_contents: list,
+        job_id: Optional[str] = None,
+        estimated_tokens: Optional[int] = None,
+        priority: str = "normal",
+        campus: str = "-",
+        uploader: str = "-",
+        deadline: Optional[float] = None,
+    ) -> str:
+        """
+        [3단계] Rate Limit 래퍼를 거쳐 모델을 호출하고 응답 텍스트를 반환합니다.
+        priority/campus/uploader는 호출 차례를 정하는 스케줄러에 전달됩니다.
+        deadline(time.monotonic 기준)까지 호출을 시작하지 못하면 DeadlineExceeded를 던집니다.
+        """
+        if estimated_tokens is None:
+            estimated_tokens = estimate_contents_tokens(api_contents)
 
-        # 6. 디버그 저장
-        os.makedirs("debug", exist_ok=True)
-        with open(f"debug/debug_payload_{key}.txt", "w", encoding="utf-8") as f:
-            f.write(final_prompt_content)
+        async def _call_api():
+            self._emit(job_id, key, "calling_model")
+            return await self.gemini_service.call_gemini_api_async(
+                system_prompt, api_contents, self._stream_consumer(job_id, [key])
+            )
 
-        # 7. API 호출 및 결과 처리 (Rate Limit 적용)
+        self._emit(
+            job_id,
+            key,
+            "waiting_for_quota",
+            position=self.gemini_service.pending_calls,
+            eta_seconds=self.gemini_service.estimate_wait_seconds(),
+        )
+
+        # GeminiService의 Rate Limit 래퍼 사용
+        with tracer.span("model", job_id, key):
+            return await self.gemini_service.process_with_rate_limit(
+                key,
+                _call_api,
+                estimated_tokens=estimated_tokens + estimate_prompt_tokens(system_prompt),
+                priority=priority,
+                campus=campus,
+                uploader=uploader,
+                deadline=deadline,
+            )
+
+    def _stream_consumer(
+        self, job_id: Optional[str], keys: list[str]
+    ) -> Optional[Callable[[str], None]]:
+        """
+        스트리밍 응답 조각을 점진적으로 파싱하는 콜백을 만듭니다. (스트리밍을 끄면 None)
+        완성된 필드마다 "partial" 진행 이벤트를 발행하고, 형식이 깨지면 StreamParseError로 점진적 파싱을 멈춥니다.
+        (응답은 끝까지 받아 일반 호출과 같이 전체로 파싱)
+        묶음 응답은 배열 항목이 완성될 때 pair_key에 해당하는 쌍의 이벤트로 발행합니다.
+        콜백은 모델 호출 스레드에서 실행되므로 이벤트는 이벤트 루프로 넘겨 발행합니다.
+        """
+        if not self.gemini_service.streaming_enabled:
+            return None
+        loop = asyncio.get_running_loop()
+        parser = IncrementalJSONParser(app_config.STREAM_MAX_PREAMBLE_CHARS)
+
+        def on_chunk(text: str):
+            for name, value in parser.feed(text):
+                if isinstance(name, int):
+                    # 최상위 배열 항목: 묶음 응답(pair_key로 구분) 또는 배열로 감싼 단일 응답
+                    if not isinstance(value, dict):
+                        continue
+                    key = value.get("pair_key") or (keys[0] if len(keys) == 1 else None)
+                    fields = [(k, v) for k, v in value.items() if k != "pair_key"]
+                else:
+                    key = keys[0] if len(keys) == 1 else None
+                    fields = [(name, value)]
+                if key not in keys:
+                    continue
+                for field, field_value in fields:
+                    loop.call_soon_threadsafe(
+                        functools.partial(
+                            self._emit, job_id, key, "partial", field=field, value=field_value
+                        )
+                    )
+
+        return on_chunk
+
+    # --- 드라이런 추정 (모델 호출 없음) ---
+    async def estimate_pair(
+        self,
+        key: str,
+        plan_file: Optional[UploadFile],
+        report_file: Optional[UploadFile],
+    ) -> dict:
+        """
+        추출과 프롬프트 구성까지만 수행하여 쌍의 입력 토큰 수와 이미지 수를 추정합니다.
+        이미지는 디코딩하지 않고 Excel 내부 미디어 항목 크기로만 셉니다. (중복 제거 전이므로 상한값)
+        """
         target_filename = report_file.filename if report_file else plan_file.filename
+        started = time.perf_counter()
+        photo_count, combined_text = 0, ""
+        for label, file in [("계획서", plan_file), ("결과보고서", report_file)]:
+            if not file:
+                continue
+            # 이미 추출해 둔 파일은 캐시의 텍스트와 사진 수를 사용
+            cache = self.extraction_cache
+            sha256 = getattr(file, "sha256", None)
+            cached = await asyncio.to_thread(cache.get, sha256) if cache and sha256 else None
+            if cached is not None:
+                photo_count += len(cached["images"])
+                combined_text += f"# [{label} 데이터]\n{cached['text']}\n\n"
+                continue
+            await file.seek(0)
+            content = await file.read()
+            if file.filename.lower().endswith(".xlsx"):
+                photo_count += await asyncio.to_thread(file_utils.count_images_in_excel, content)
+            text = await asyncio.to_thread(
+                file_utils.extract_text_from_bytes, file.filename, content
+            )
+            combined_text += f"# [{label} 데이터]\n{text}\n\n"
+            del content
+
+        if not combined_text:
+            return {"key": key, "filename": target_filename, "status": "error", "error": "내용 없음"}
+
+        collage_photos = None
+        if app_config.COLLAGE_ENABLED and photo_count:
+            layout = image_utils.plan_collages(photo_count)
+            images_to_send, collage_photos = len(layout), sum(layout)
+        else:
+            images_to_send = min(photo_count, MAX_IMAGES_TO_SEND)
+        prompt_text = self._build_prompt_text(
+            key, combined_text, photo_count, images_to_send, collage_photos
+        )
+        return {
+            "key": key,
+            "filename": target_filename,
+            "status": "ok",
+            "photo_count": photo_count,
+            "images_to_send": images_to_send,
+            "input_tokens": estimate_text_tokens(prompt_text) + images_to_send * IMAGE_TOKEN_COST,
+            "extraction_seconds": round(time.perf_counter() - started, 3),
+        }
+
+    def plan_requests(self, pair_tokens: list[int]) -> list[int]:
+        """
+        쌍별 입력 토큰 목록을 실제 요청 단위로 묶어 요청별 입력 토큰 목록을 반환합니다.
+        (묶음 모드에서는 모델 워커와 같은 규칙으로 작은 쌍을 모음)
+        """
+        if not self.packing_enabled:
+            return list(pair_tokens)
+        requests, batch_size, batch_tokens = [], 0, 0
+        for tokens in pair_tokens:
+            if tokens > self.packing_small_pair_tokens:
+                requests.append(tokens)
+                continue
+            if batch_size and (
+                batch_size >= self.packing_max_pairs
+                or batch_tokens + tokens > self.packing_token_budget
+            ):
+                requests.append(batch_tokens)
+                batch_size, batch_tokens = 0, 0
+            batch_size += 1
+            batch_tokens += tokens
+        if batch_size:
+            requests.append(batch_tokens)
+        return requests
+
+    async def estimate_batch(
+        self, pairs: list[tuple], system_prompt: str, concurrency: int = 1
+    ) -> dict:
+        """
+        모델을 호출하지 않고 배치 전체의 토큰, 요청 수, 비용, 소요 시간을 추정합니다.
+        로컬 단계(추출/프롬프트 구성)는 파이프라인의 추출 워커 수만큼 동시에 실행합니다.
+        """
+        semaphore = asyncio.Semaphore(max(1, concurrency))
+
+        async def estimate(pair):
+            async with semaphore:
+                try:
+                    return await self.estimate_pair(*pair)
+                except Exception as e:
+                    return {"key": pair[0], "status": "error", "error": str(e)}
+
+        started = time.perf_counter()
+        details = await asyncio.gather(*(estimate(pair) for pair in pairs))
+        local_seconds = time.perf_counter() - started
+
+        estimable = [d for d in details if d["status"] == "ok"]
+        request_tokens = self.plan_requests([d["input_tokens"] for d in estimable])
+        model = await self.gemini_service.estimate_requests(
+            request_tokens, len(estimable), system_prompt
+        )
+        # 로컬 단계와 모델 호출은 파이프라인에서 겹쳐 실행되므로 더 오래 걸리는 쪽이 전체 시간
+        wall_clock_seconds = max(model["model_seconds"], local_seconds)
+        return {
+            "dry_run": True,
+            "pair_count": len(pairs),
+            "estimable_pairs": len(estimable),
+            "failed_pairs": [d for d in details if d["status"] != "ok"],
+            "packing_enabled": self.packing_enabled,
+            "photo_count": sum(d["photo_count"] for d in estimable),
+            "images_to_send": sum(d["images_to_send"] for d in estimable),
+            "local_processing_seconds": round(local_seconds, 2),
+            **model,
+            "wall_clock_seconds": round(wall_clock_seconds, 1),
+            "expected_completion_at": model["expected_completion_at"]
+            or format_local_time(time.time() + wall_clock_seconds),
+            "pairs": details,
+        }
+
+    def build_packed_contents(self, items: list[tuple[str, list]]) -> list:
+        """
+        여러 쌍의 (key, api_contents)를 한 번의 호출용 contents로 묶습니다.
+        모델에게 pair_key가 붙은 JSON 배열로 답하도록 요청합니다.
+        """
+        keys = [key for key, _ in items]
+        packed = [
+            f"""
+        [다중 평가 요청]
+        아래에는 서로 독립적인 평가 대상 {len(keys)}건이 있습니다. 각 대상을 시스템 지침에 따라 **개별적으로** 평가하십시오.
+        - 출력은 반드시 JSON 배열 하나이며, 배열의 각 원소는 한 대상의 평가 JSON 객체입니다.
+        - 각 객체에는 "pair_key" 필드로 대상 키를 그대로 적으십시오.
+        - 대상 키 목록: {json.dumps(keys, ensure_ascii=False)}
+        --------------------------------------------------
+        """
+        ]
+        for key, api_contents in items:
+            text, images = api_contents[0], api_contents[1:]
+            packed.append(f"\n### 평가 대상 pair_key: {key}\n{text}")
+            if images:
+                packed.append(f"(아래 이미지 {len(images)}장은 평가 대상 {key}의 증빙 자료입니다.)")
+                packed.extend(images)
+        return packed
+
+    def split_packed_response(self, api_response_text: str, keys: list[str]) -> dict:
+        """
+        묶음 호출의 JSON 배열 응답을 pair_key별 응답 텍스트로 나눕니다.
+        키가 빠지거나 중복되는 등 하나라도 맞지 않으면 ValueError를 발생시킵니다.
+        """
+        start = api_response_text.find("[")
+        end = api_response_text.rfind("]")
+        if start == -1 or end == -1:
+            raise ValueError("묶음 응답에서 JSON 배열을 찾을 수 없습니다.")
+
+        data = json.loads(api_response_text[start : end + 1])
+        if not isinstance(data, list) or len(data) != len(keys):
+            raise ValueError("묶음 응답의 항목 수가 요청과 다릅니다.")
+
+        responses = {}
+        for item in data:
+            key = item.pop("pair_key", None) if isinstance(item, dict) else None
+            if key not in keys or key in responses:
+                raise ValueError(f"묶음 응답의 pair_key가 올바르지 않습니다: {key}")
+            responses[key] = json.dumps(item, ensure_ascii=False)
+        return responses
+
+    async def call_model_packed(
+        self,
+        keys: list[str],
+        system_prompt: str,
+        packed_contents: list,
+        job_id: Optional[str] = None,
+        priority: str = "normal",
+        campus: str = "-",
+        uploader: str = "-",
+        deadline: Optional[float] = None,
+    ) -> str:
+        """[3단계-묶음] 여러 쌍을 한 번의 요청으로 호출합니다. (Rate Limit 1회분만 사용)"""
 
         async def _call_api():
+            for key in keys:
+                self._emit(job_id, key, "calling_model", packed_with=len(keys))
             return await self.gemini_service.call_gemini_api_async(
-                system_prompt, api_contents
+                system_prompt, packed_contents, self._stream_consumer(job_id, keys)
             )
 
-        try:
-            # GeminiService의 Rate Limit 래퍼 사용
-            api_response_text = await self.gemini_service.process_with_rate_limit(
-                key, _call_api
+        for key in keys:
+            self._emit(
+                job_id,
+                key,
+                "waiting_for_quota",
+                position=self.gemini_service.pending_calls,
+                eta_seconds=self.gemini_service.estimate_wait_seconds(),
+            )
+
+        # 묶음 요청의 스팬은 "키1+키2+..." 형태의 묶음 키로 기록
+        batch_key = "+".join(keys)
+        with tracer.span("model", job_id, batch_key, packed_pairs=len(keys)):
+            return await self.gemini_service.process_with_rate_limit(
+                batch_key,
+                _call_api,
+                estimated_tokens=estimate_contents_tokens(packed_contents)
+                + estimate_prompt_tokens(system_prompt),
+                priority=priority,
+                campus=campus,
+                uploader=uploader,
+                deadline=deadline,
             )
 
+    async def persist_result(
+        self,
+        key: str,
+        extracted: dict,
+        api_response_text: str,
+        job_id: Optional[str] = None,
+    ) -> dict:
+        """[4단계] 모델 응답을 파싱하여 DB에 저장하고 결과를 반환합니다."""
+        with tracer.span("persist", job_id, key):
+            return await self._persist_result(key, extracted, api_response_text, job_id)
+
+    async def _persist_result(
+        self,
+        key: str,
+        extracted: dict,
+        api_response_text: str,
+        job_id: Optional[str],
+    ) -> dict:
+        target_filename = extracted["target_filename"]
+        actual_photo_count = extracted["photo_count"]
+        try:
             start = api_response_text.find("{")
             end = api_response_text.rfind("}")
             if start == -1 or end == -1:
@@ -160,35 +722,94 @@ class AnalysisService:
                 data = data[0]
 
             data["photo_count_detected"] = actual_photo_count
+            if extracted.get("near_duplicates"):
+                data["near_duplicates"] = extracted["near_duplicates"]
             info = self.extract_info_from_filename(target_filename)
 
-            # DB 저장 (비동기 실행을 위해 to_thread 사용 가능, 여기선 간단히 직접 호출하거나 to_thread)
-            # db_utils는 동기 함수이므로 to_thread 권장
-            import asyncio
-
-            await asyncio.to_thread(
-                db_utils.save_result_to_db,
-                os.path.splitext(target_filename)[0],
-                data.get("total", 0),
-                actual_photo_count,
-                json.dumps(data, ensure_ascii=False),
-                info.get("campus"),
-                info.get("class_name"),
-                info.get("author_name"),
+            # db_utils는 동기 함수이므로 to_thread 사용
+            if extracted.get("result_id"):
+                # 재분석: 기존 결과 행을 덮어써 결과 ID를 유지
+                result_id = await asyncio.to_thread(
+                    db_utils.update_result_in_db,
+                    extracted["result_id"],
+                    data.get("total", 0),
+                    actual_photo_count,
+                    json.dumps(data, ensure_ascii=False),
+                )
+            else:
+                result_id = await asyncio.to_thread(
+                    db_utils.save_result_to_db,
+                    os.path.splitext(target_filename)[0],
+                    data.get("total", 0),
+                    actual_photo_count,
+                    json.dumps(data, ensure_ascii=False),
+                    info.get("campus"),
+                    info.get("class_name"),
+                    info.get("author_name"),
+                )
+            if result_id and extracted.get("minhash") is not None:
+                await self._index_minhash(key, result_id, extracted)
+            self._emit(
+                job_id,
+                key,
+                "saved",
+                filename=target_filename,
+                result_id=result_id,
+                total=data.get("total", 0),
             )
 
             return {
                 "key": key,
                 "filename": target_filename,
                 "status": "success",
+                "result_id": result_id,
                 "analysis_result": json.dumps(data, ensure_ascii=False),
             }
 
         except Exception as e:
-            logger.error(f"[{key}] 오류: {e}")
+            return self.build_error_result(key, target_filename, e, job_id, stage="persist")
+
+    async def _index_minhash(self, key: str, result_id: int, extracted: dict):
+        """저장된 결과를 유사 보고서 색인에 추가합니다. (색인 실패는 결과 저장에 영향 없음)"""
+        signature = extracted["minhash"]
+        buckets = extracted.get("minhash_buckets") or near_duplicates.band_buckets(signature)
+        try:
+            await asyncio.to_thread(
+                db_utils.save_result_minhash, result_id, signature.tobytes(), buckets
+            )
+        except Exception as e:
+            logger.error(f"[{key}] 유사 보고서 색인 저장 실패: {e}")
+
+    def build_error_result(
+        self,
+        key: str,
+        target_filename: Optional[str],
+        error: Exception,
+        job_id: Optional[str] = None,
+        stage: str = "pipeline",
+    ) -> dict:
+        """오류를 기록하고 실패 결과 형식으로 변환합니다."""
+        if isinstance(error, DailyQuotaExhausted):
+            # 일일 한도 소진은 실패가 아니라 한도 초기화 이후로 미룸
+            scheduled_at = format_local_time(error.reset_at)
+            logger.warning(f"[{key}] {error}")
+            self._emit(job_id, key, "deferred", filename=target_filename, scheduled_at=scheduled_at)
             return {
                 "key": key,
                 "filename": target_filename,
-                "status": "error",
-                "error": str(e),
+                "status": "deferred",
+                "error": str(error),
+                "scheduled_at": scheduled_at,
             }
+        if isinstance(error, DeadlineExceeded):
+            # 기한이 지난 쌍은 모델을 호출하지 않고 버림 (실패 쌍 재처리로 다시 실행 가능)
+            metrics.DROPPED_PAIRS.inc(reason="deadline")
+        logger.error(f"[{key}] 오류: {error}")
+        metrics.ERRORS_TOTAL.inc(stage=stage, type=metrics.error_type(error))
+        self._emit(job_id, key, "failed", filename=target_filename, error=str(error))
+        return {
+            "key": key,
+            "filename": target_filename,
+            "status": "error",
+            "error": str(error),
+        }
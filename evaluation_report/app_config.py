@@ -23,12 +23,188 @@ API_MODEL = os.getenv(
     "GEMINI_MODEL", "gemini-2.5-flash"
 )  # 환경 변수에서 모델 로드 (없으면 기본값 사용)
 
-if not API_KEY:
-    # 환경 변수 로드 실패 시 예외 발생
-    raise ValueError(
-        "API_KEY(GOOGLE_API_KEY)가 환경 변수(.env 파일)에 설정되지 않았습니다."
-    )
+# 모델 백엔드: "google"(기본) 또는 "local"(API 키 없이 동작하는 로컬 대체 백엔드)
+GEMINI_BACKEND = os.getenv("GEMINI_BACKEND", "google").lower()
+LOCAL_GENAI_LATENCY = float(os.getenv("LOCAL_GENAI_LATENCY", "0"))
+
+# 스트리밍 응답: 조각이 도착하는 대로 JSON을 점진적으로 파싱 (형식이 깨진 응답은 끝까지 기다리지 않고 실패,
+# 완성된 필드는 진행 이벤트로 전달), 응답 앞부분 이 글자 수 안에 JSON이 시작되지 않으면 형식 오류
+STREAMING_ENABLED = os.getenv("STREAMING_ENABLED", "false").lower() == "true"
+STREAM_MAX_PREAMBLE_CHARS = int(os.getenv("STREAM_MAX_PREAMBLE_CHARS", "512"))
+
+# --- 다중 키/모델 풀 설정 (쉼표로 구분, 없으면 단일 키/모델 사용) ---
+API_KEYS = [
+    k.strip() for k in os.getenv("GOOGLE_API_KEYS", "").split(",") if k.strip()
+] or ([API_KEY] if API_KEY else [])
+API_MODELS = [
+    m.strip() for m in os.getenv("GEMINI_MODELS", "").split(",") if m.strip()
+] or [API_MODEL]
+FALLBACK_MODEL = os.getenv("GEMINI_FALLBACK_MODEL", "")  # 예: gemini-2.5-flash-lite
+GEMINI_RPM = int(os.getenv("GEMINI_RPM", "10"))  # 키/모델 슬롯당 분당 요청 수
+FALLBACK_RPM = int(os.getenv("GEMINI_FALLBACK_RPM", "15"))
+KEY_MAX_CONCURRENCY = int(os.getenv("KEY_MAX_CONCURRENCY", "1"))
+KEY_COOLDOWN_SECONDS = float(os.getenv("KEY_COOLDOWN_SECONDS", "60"))
+KEY_FAILURE_THRESHOLD = int(os.getenv("KEY_FAILURE_THRESHOLD", "3"))
+FALLBACK_OVERFLOW_WAIT_SECONDS = float(os.getenv("FALLBACK_OVERFLOW_WAIT_SECONDS", "10"))
+# 키/모델 슬롯당 분당 입력 토큰 수 (0이면 제한 없음)
+GEMINI_TPM = int(os.getenv("GEMINI_TPM", "0"))
+FALLBACK_TPM = int(os.getenv("GEMINI_FALLBACK_TPM", "0"))
+# 키/모델 슬롯당 하루 요청 수 (0이면 제한 없음), 한도를 넘는 쌍은 한도 초기화 이후로 미뤄 처리
+GEMINI_RPD = int(os.getenv("GEMINI_RPD", "0"))
+FALLBACK_RPD = int(os.getenv("GEMINI_FALLBACK_RPD", "0"))
+# Gemini 일일 한도는 태평양 시간 자정에 초기화됨
+QUOTA_RESET_TIMEZONE = os.getenv("QUOTA_RESET_TIMEZONE", "America/Los_Angeles")
+# 미뤄둔 쌍 중 예정 시각이 지난 쌍을 확인하는 주기(초)
+DEFERRED_POLL_SECONDS = float(os.getenv("DEFERRED_POLL_SECONDS", "60"))
+
+# 모델 호출 스케줄링: 같은 우선순위 안에서 캠퍼스별 가중치 ("서울=2,대전=1", 없는 캠퍼스는 1)
+SCHEDULER_CAMPUS_WEIGHTS = os.getenv("SCHEDULER_CAMPUS_WEIGHTS", "")
+
+# 헤지(중복) 호출: 호출이 비슷한 크기 호출 지연 시간의 HEDGE_PERCENTILE 백분위(최소 HEDGE_MIN_DELAY_SECONDS초)를
+# 넘기면 바로 쓸 수 있는 다른 키/모델 슬롯으로 같은 호출을 보내 먼저 끝난 결과를 사용
+# 헤지 요청은 전체 호출의 HEDGE_BUDGET_RATIO 비율 이내, 표본이 HEDGE_MIN_SAMPLES개 미만이면 헤지하지 않음
+HEDGE_ENABLED = os.getenv("HEDGE_ENABLED", "false").lower() == "true"
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", "95"))
+HEDGE_BUDGET_RATIO = float(os.getenv("HEDGE_BUDGET_RATIO", "0.05"))
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", "20"))
+HEDGE_MIN_DELAY_SECONDS = float(os.getenv("HEDGE_MIN_DELAY_SECONDS", "2"))
+
+# 모델 API 회로 차단기: 연속 장애(5xx/연결 오류) 횟수, 호출 중단 시간(초, 탐색 실패 시 두 배씩 최대까지)
+# 중단 중 동작: "pause"(복구될 때까지 대기열을 멈춤) 또는 "fail"(바로 실패, 실패 쌍 재처리로 다시 실행)
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+CIRCUIT_OPEN_SECONDS = float(os.getenv("CIRCUIT_OPEN_SECONDS", "30"))
+CIRCUIT_MAX_OPEN_SECONDS = float(os.getenv("CIRCUIT_MAX_OPEN_SECONDS", "300"))
+CIRCUIT_OPEN_ACTION = os.getenv("CIRCUIT_OPEN_ACTION", "pause").lower()
+
+# 쌍 처리 기한(초): 파이프라인에 들어온 뒤 이 시간 안에 모델 호출을 시작하지 못하면 호출하지 않고 실패 처리 (0이면 없음)
+PAIR_DEADLINE_SECONDS = float(os.getenv("PAIR_DEADLINE_SECONDS", "1800"))
+# 업로드/재분석 요청의 클라이언트 연결이 끊기면 처리 중인 쌍을 취소 (취소된 쌍은 실패 쌍 재처리로 다시 실행)
+CANCEL_ON_DISCONNECT = os.getenv("CANCEL_ON_DISCONNECT", "true").lower() == "true"
+
+# 속도 제한 상태 저장 위치: "local"(프로세스별) 또는 "sqlite"(같은 호스트의 워커 프로세스끼리 공유)
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "local").lower()
+RATE_LIMIT_DB_PATH = os.getenv(
+    "RATE_LIMIT_DB_PATH", os.path.join(PROJECT_ROOT, "rate_limit.db")
+)
+
+
+
+def validate_api_settings():
+    """API 키 설정을 확인합니다. (임포트 시점이 아니라 서버/CLI 시작 시 호출)"""
+    if not API_KEYS and GEMINI_BACKEND != "local":
+        # 환경 변수 로드 실패 시 예외 발생
+        raise ValueError(
+            "API_KEY(GOOGLE_API_KEY)가 환경 변수(.env 파일)에 설정되지 않았습니다."
+        )
 
 # --- 파일 검색 및 기본값 설정 ---
 TARGET_FILE_KEYWORDS = ["9월", "스터디", "이용호"]
 DEFAULT_CONTENT = "한국에 대해 알려줘"
+
+# --- 평가 파이프라인 설정 (단계별 동시성, 큐 크기, 메모리 예산) ---
+PIPELINE_EXTRACT_WORKERS = int(os.getenv("PIPELINE_EXTRACT_WORKERS", "2"))
+PIPELINE_PREPARE_WORKERS = int(os.getenv("PIPELINE_PREPARE_WORKERS", "1"))
+PIPELINE_MODEL_WORKERS = int(os.getenv("PIPELINE_MODEL_WORKERS", "2"))
+PIPELINE_PERSIST_WORKERS = int(os.getenv("PIPELINE_PERSIST_WORKERS", "1"))
+PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", "4"))
+PIPELINE_MEMORY_BUDGET_MB = int(os.getenv("PIPELINE_MEMORY_BUDGET_MB", "256"))
+
+# --- 업로드 파일 보관 설정 (실패 쌍 재처리용, 해시 기반 저장소) ---
+UPLOAD_STORE_PATH = os.getenv(
+    "UPLOAD_STORE_PATH", os.path.join(PROJECT_ROOT, "upload_store")
+)
+UPLOAD_RETENTION_DAYS = int(os.getenv("UPLOAD_RETENTION_DAYS", "14"))
+UPLOAD_STORE_MAX_MB = int(os.getenv("UPLOAD_STORE_MAX_MB", "2048"))
+
+# --- 시스템 프롬프트 컨텍스트 캐시 설정 ---
+CONTEXT_CACHE_ENABLED = os.getenv("CONTEXT_CACHE_ENABLED", "true").lower() == "true"
+CONTEXT_CACHE_TTL_SECONDS = int(os.getenv("CONTEXT_CACHE_TTL_SECONDS", "3600"))
+
+# --- 묶음(packing) 모드 설정: 작은 쌍 여러 개를 한 요청으로 평가 ---
+PACKING_ENABLED = os.getenv("PACKING_ENABLED", "false").lower() == "true"
+PACKING_MAX_PAIRS = int(os.getenv("PACKING_MAX_PAIRS", "4"))
+PACKING_TOKEN_BUDGET = int(os.getenv("PACKING_TOKEN_BUDGET", "16000"))
+PACKING_SMALL_PAIR_TOKENS = int(os.getenv("PACKING_SMALL_PAIR_TOKENS", "5000"))
+PACKING_LINGER_SECONDS = float(os.getenv("PACKING_LINGER_SECONDS", "0.5"))
+
+# --- 증빙 사진 콜라주: 추출한 사진을 격자 이미지 1~2장으로 묶어 모든 사진을 모델에 전달 ---
+COLLAGE_ENABLED = os.getenv("COLLAGE_ENABLED", "true").lower() == "true"
+# Gemini는 768px 이하 이미지를 타일 하나(258토큰)로 계산하므로 기본값을 768로 둠
+COLLAGE_SIZE = int(os.getenv("COLLAGE_SIZE", "768"))
+COLLAGE_MAX_IMAGES = int(os.getenv("COLLAGE_MAX_IMAGES", "2"))
+# 콜라주 한 장에 넣는 최대 사진 수 (넘으면 정보량 순위가 높은 사진만 포함)
+COLLAGE_MAX_PHOTOS = int(os.getenv("COLLAGE_MAX_PHOTOS", "16"))
+# 계획서/보고서 사이 중복 사진 판정: dHash(64비트) 해밍 거리 이하이면 같은 사진
+IMAGE_DEDUPE_DISTANCE = int(os.getenv("IMAGE_DEDUPE_DISTANCE", "6"))
+# 흑백 엔트로피(비트)가 이보다 낮은 이미지(로고, 양식 장식)는 증빙 사진에서 제외
+IMAGE_MIN_ENTROPY = float(os.getenv("IMAGE_MIN_ENTROPY", "3.0"))
+
+# --- 파일별 추출 캐시: 같은 내용(SHA-256)의 파일은 다시 파싱하지 않음 (메모리 LRU + 디스크) ---
+EXTRACTION_CACHE_ENABLED = os.getenv("EXTRACTION_CACHE_ENABLED", "true").lower() == "true"
+EXTRACTION_CACHE_PATH = os.getenv(
+    "EXTRACTION_CACHE_PATH", os.path.join(PROJECT_ROOT, "extraction_cache")
+)
+EXTRACTION_CACHE_MEMORY_MB = int(os.getenv("EXTRACTION_CACHE_MEMORY_MB", "128"))
+EXTRACTION_CACHE_MAX_MB = int(os.getenv("EXTRACTION_CACHE_MAX_MB", "1024"))
+# 추출한 사진의 긴 변 최대 픽셀 (더 크면 줄여서 보관/전송, 0이면 원본 유지)
+EXTRACTION_IMAGE_MAX_SIDE = int(os.getenv("EXTRACTION_IMAGE_MAX_SIDE", "1536"))
+
+# --- 유사 보고서 탐지 (MinHash/LSH): 이전 결과와 거의 같은 보고서 표시 ---
+NEAR_DUPLICATE_ENABLED = os.getenv("NEAR_DUPLICATE_ENABLED", "true").lower() == "true"
+# 추정 자카드 유사도(글자 5-gram 기준)가 이 값 이상이면 유사 보고서로 봄
+NEAR_DUPLICATE_THRESHOLD = float(os.getenv("NEAR_DUPLICATE_THRESHOLD", "0.8"))
+# "flag": 평가 결과에 유사 보고서 표시, "review": 모델 호출 없이 검토 대기(review) 상태로 둠
+NEAR_DUPLICATE_ACTION = os.getenv("NEAR_DUPLICATE_ACTION", "flag").lower()
+# 서명 길이/밴드 수를 바꾸면 기존 색인과 비교되지 않으므로 운영 중에는 바꾸지 않음
+MINHASH_NUM_PERM = int(os.getenv("MINHASH_NUM_PERM", "128"))
+MINHASH_BANDS = int(os.getenv("MINHASH_BANDS", "16"))
+MINHASH_SHINGLE_SIZE = int(os.getenv("MINHASH_SHINGLE_SIZE", "5"))
+
+# --- Gemini 프록시 (/proxy/generate, study-plan-page용) ---
+PROXY_CACHE_TTL_SECONDS = int(os.getenv("PROXY_CACHE_TTL_SECONDS", "3600"))
+PROXY_CACHE_MAX_ENTRIES = int(os.getenv("PROXY_CACHE_MAX_ENTRIES", "1024"))
+PROXY_MAX_PROMPT_CHARS = int(os.getenv("PROXY_MAX_PROMPT_CHARS", "50000"))
+# 클라이언트(IP)별 분당 모델 호출 수 (캐시 응답은 제외, 0이면 제한 없음)
+PROXY_RPM_PER_CLIENT = int(os.getenv("PROXY_RPM_PER_CLIENT", "10"))
+# 설정하면 X-Proxy-Token 헤더가 같은 요청만 허용
+PROXY_TOKEN = os.getenv("PROXY_TOKEN", "")
+# 클라이언트 구분에 쓸 헤더 (리버스 프록시 뒤라면 X-Forwarded-For / X-Real-IP 등, 비우면 접속 IP)
+PROXY_CLIENT_HEADER = os.getenv("PROXY_CLIENT_HEADER", "")
+# 프록시가 허용하는 시스템 프롬프트: prompt_id -> 서버의 프롬프트 파일 (클라이언트는 ID만 보냄)
+PROXY_PROMPT_PATHS = {
+    "evaluation": SYSTEM_PROMPT_PATH,
+    "study_plan": os.path.join(PROJECT_ROOT, "prompts/study_plan_prompt.txt"),
+}
+
+# --- ZIP 업로드 한도 (압축 폭탄 방지) ---
+ZIP_MAX_UNCOMPRESSED_MB = int(os.getenv("ZIP_MAX_UNCOMPRESSED_MB", "2048"))
+ZIP_MAX_ENTRIES = int(os.getenv("ZIP_MAX_ENTRIES", "2000"))
+
+# --- 관측(트레이스) 설정: 쌍 단위 처리 구간 기록 (/traces) ---
+TRACE_ENABLED = os.getenv("TRACE_ENABLED", "false").lower() == "true"
+TRACE_BUFFER_SIZE = int(os.getenv("TRACE_BUFFER_SIZE", "5000"))
+
+# --- 관리자 기능 (프로파일링) ---
+# 설정하지 않으면 관리자 API는 비활성화됨 (요청 헤더 X-Admin-Token으로 인증)
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+PROFILE_OUTPUT_PATH = os.getenv(
+    "PROFILE_OUTPUT_PATH", os.path.join(PROJECT_ROOT, "profiles")
+)
+PROFILE_SAMPLE_INTERVAL = float(os.getenv("PROFILE_SAMPLE_INTERVAL", "0.005"))
+PROFILE_TOP_ALLOCATIONS = int(os.getenv("PROFILE_TOP_ALLOCATIONS", "30"))
+
+# --- 감시 폴더 데몬 (python main.py --watch) ---
+WATCH_FOLDER_PATH = os.getenv("WATCH_FOLDER_PATH", os.path.join(PROJECT_ROOT, "watch_inbox"))
+# 파일 크기/수정 시각이 이 시간 동안 그대로여야 쓰기가 끝난 것으로 봄
+WATCH_SETTLE_SECONDS = float(os.getenv("WATCH_SETTLE_SECONDS", "3"))
+# 짝(계획서/보고서)을 기다리는 최대 시간, 지나면 한쪽만으로 평가
+WATCH_PAIR_TIMEOUT_SECONDS = float(os.getenv("WATCH_PAIR_TIMEOUT_SECONDS", "300"))
+
+# --- 사전 비용/시간 추정 (/estimate): 백만 토큰당 USD 단가 ---
+GEMINI_INPUT_PRICE_PER_MTOK = float(os.getenv("GEMINI_INPUT_PRICE_PER_MTOK", "0.30"))
+GEMINI_CACHED_INPUT_PRICE_PER_MTOK = float(
+    os.getenv("GEMINI_CACHED_INPUT_PRICE_PER_MTOK", "0.075")
+)
+GEMINI_OUTPUT_PRICE_PER_MTOK = float(os.getenv("GEMINI_OUTPUT_PRICE_PER_MTOK", "2.50"))
+# 실제 호출 기록이 없을 때 쓰는 쌍당 응답 토큰 수
+ESTIMATE_OUTPUT_TOKENS_PER_PAIR = int(os.getenv("ESTIMATE_OUTPUT_TOKENS_PER_PAIR", "1500"))
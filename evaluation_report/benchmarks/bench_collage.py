@@ -0,0 +1,110 @@
+# bench_collage.py
+"""
+사진이 많은 보고서(기본 50장)에서 증빙 사진 콜라주 생성 비용을 측정하는 벤치마크입니다.
+JPEG 축소 디코딩(draft) + reducing_gap 축소와, 원본을 모두 디코딩한 뒤 줄이는 방식을 비교합니다.
+
+실행: python benchmarks/bench_collage.py --photos 50 --width 4032 --height 3024
+"""
+import os
+import io
+import sys
+import time
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def make_photos(count: int, width: int, height: int) -> list[bytes]:
+    """카메라 사진 크기의 JPEG를 메모리에서 만듭니다. (사진마다 색/무늬가 다름)"""
+    from PIL import Image, ImageDraw
+
+    photos = []
+    for i in range(count):
+        image = Image.new("RGB", (width, height), ((i * 37) % 256, (i * 91) % 256, (i * 53) % 256))
+        draw = ImageDraw.Draw(image)
+        for j in range(0, width, max(1, width // 12)):
+            draw.line([(j, 0), (width - j, height)], fill=(255, 255, 255), width=8)
+        buffer = io.BytesIO()
+        image.save(buffer, "JPEG", quality=85)
+        photos.append(buffer.getvalue())
+    return photos
+
+
+def open_all(photos: list[bytes]):
+    from PIL import Image
+
+    return [Image.open(io.BytesIO(data)) for data in photos]
+
+
+def naive_collages(images, size: int, max_collages: int, max_photos: int):
+    """비교용: 원본 해상도로 디코딩한 뒤 고품질 리샘플링으로 줄이는 방식"""
+    from PIL import Image
+
+    import image_utils
+
+    layout = image_utils.plan_collages(len(images), max_collages, max_photos)
+    selected = images[: sum(layout)]
+    collages, start = [], 0
+    for n in layout:
+        cols, rows = image_utils._grid(n)
+        tile_w, tile_h = size // cols, size // rows
+        canvas = Image.new("RGB", (tile_w * cols, tile_h * rows))
+        for index, image in enumerate(selected[start : start + n]):
+            tile = image.convert("RGB")
+            tile.thumbnail((tile_w, tile_h), Image.Resampling.LANCZOS, reducing_gap=None)
+            canvas.paste(tile, ((index % cols) * tile_w, (index // cols) * tile_h))
+        collages.append(canvas)
+        start += n
+    return collages
+
+
+def measure(fn, photos, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        images = open_all(photos)
+        started = time.perf_counter()
+        fn(images)
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--photos", type=int, default=50)
+    parser.add_argument("--width", type=int, default=4032)
+    parser.add_argument("--height", type=int, default=3024)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    import app_config
+    import image_utils
+
+    photos = make_photos(args.photos, args.width, args.height)
+    size, max_collages, max_photos = (
+        app_config.COLLAGE_SIZE,
+        app_config.COLLAGE_MAX_IMAGES,
+        app_config.COLLAGE_MAX_PHOTOS,
+    )
+    collages, included = image_utils.build_collages(open_all(photos), size, max_collages, max_photos)
+    print(
+        f"사진 {args.photos}장 ({args.width}x{args.height}) → 콜라주 {len(collages)}장 "
+        f"{[c.size for c in collages]}, 포함 사진 {included}장"
+    )
+
+    fast = measure(
+        lambda images: image_utils.build_collages(images, size, max_collages, max_photos),
+        photos,
+        args.repeat,
+    )
+    naive = measure(
+        lambda images: naive_collages(images, size, max_collages, max_photos),
+        photos,
+        args.repeat,
+    )
+    print(f"축소 디코딩 + reducing_gap: {fast * 1000:.0f} ms")
+    print(f"원본 디코딩 + LANCZOS:      {naive * 1000:.0f} ms  ({naive / fast:.1f}배)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+# bench_packing.py
+"""
+고정 RPM 제한에서 묶음(packing) 모드 on/off의 분당 처리 쌍 수를 비교하는 벤치마크입니다.
+로컬 대체 백엔드(GEMINI_BACKEND=local)로 실행하므로 API 키나 비용이 들지 않습니다.
+
+실행: python benchmarks/bench_packing.py --pairs 24 --rpm 120 --latency 0.2
+"""
+import os
+import io
+import sys
+import time
+import asyncio
+import argparse
+import tempfile
+
+os.environ["GEMINI_BACKEND"] = "local"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def make_small_workbook(index: int) -> bytes:
+    """작은 계획서/보고서 형태의 xlsx를 메모리에서 만듭니다."""
+    from openpyxl import Workbook
+
+    wb = Workbook()
+    ws = wb.active
+    ws.append(["항목", "내용"])
+    ws.append(["스터디명", f"알고리즘 스터디 {index}"])
+    ws.append(["목표", "주 3회 문제 풀이 및 코드 리뷰"])
+    ws.append(["활동 내용", "백준 문제 풀이, 풀이 공유, 회고 작성"])
+    buffer = io.BytesIO()
+    wb.save(buffer)
+    return buffer.getvalue()
+
+
+async def run_once(pairs: int, rpm: int, latency: float, packing: bool) -> dict:
+    from starlette.datastructures import UploadFile
+
+    import db_utils
+    import app_config
+    from gemini_service import GeminiService
+    from key_pool import KeyPool, KeySlot
+    from analysis_service import AnalysisService
+    from pipeline import EvaluationPipeline
+
+    # 단일 키/모델 슬롯에 RPM 상한을 고정
+    gemini_service = GeminiService(
+        KeyPool([KeySlot("bench", None, app_config.API_MODEL, rpm)])
+    )
+    gemini_service.get_client().models.latency_seconds = latency
+    analysis_service = AnalysisService(gemini_service)
+    analysis_service.packing_enabled = packing
+    analysis_service.packing_linger_seconds = 0.05
+    pipeline = EvaluationPipeline(analysis_service)
+
+    inputs = []
+    for i in range(pairs):
+        data = make_small_workbook(i)
+        key = f"서울_{i + 1}반_벤치"
+        inputs.append(
+            (
+                key,
+                UploadFile(io.BytesIO(data), size=len(data), filename=f"계획서_{key}.xlsx"),
+                UploadFile(io.BytesIO(data), size=len(data), filename=f"보고서_{key}.xlsx"),
+            )
+        )
+
+    db_utils.init_db()
+    started = time.perf_counter()
+    results = await pipeline.run(inputs, "벤치마크용 시스템 프롬프트")
+    elapsed = time.perf_counter() - started
+
+    succeeded = sum(1 for r in results if r["status"] == "success")
+    requests = gemini_service.get_usage_stats()["calls"]
+    return {
+        "packing": packing,
+        "pairs": succeeded,
+        "requests": requests,
+        "seconds": round(elapsed, 2),
+        "pairs_per_minute": round(succeeded / elapsed * 60, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--pairs", type=int, default=24)
+    parser.add_argument("--rpm", type=int, default=120, help="고정 RPM 상한")
+    parser.add_argument("--latency", type=float, default=0.2, help="모델 호출 지연(초)")
+    args = parser.parse_args()
+
+    import logging
+
+    logging.basicConfig(level=logging.WARNING)
+    os.chdir(tempfile.mkdtemp(prefix="bench_packing_"))
+
+    print(f"pairs={args.pairs}, rpm cap={args.rpm}, latency={args.latency}s")
+    for packing in (False, True):
+        result = asyncio.run(run_once(args.pairs, args.rpm, args.latency, packing))
+        print(
+            f"packing={'on ' if result['packing'] else 'off'} | "
+            f"requests={result['requests']:3d} | {result['seconds']:6.2f}s | "
+            f"{result['pairs_per_minute']:7.1f} pairs/min"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+# bench_startup.py
+"""
+서버 모듈의 콜드 스타트 임포트 시간을 측정하는 벤치마크입니다.
+매 회 새 파이썬 프로세스에서 `python -X importtime`으로 임포트하여
+전체 임포트 시간(중앙값)과 가장 무거운 하위 모듈, 무거운 라이브러리의 조기 로딩 여부를 출력합니다.
+
+실행: python benchmarks/bench_startup.py --runs 5
+"""
+import os
+import sys
+import argparse
+import statistics
+import subprocess
+
+EVALUATION_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+REPO_ROOT = os.path.dirname(EVALUATION_DIR)
+
+# (이름, 작업 디렉터리, 임포트할 모듈)
+TARGETS = [
+    ("evaluation_report/server.py", EVALUATION_DIR, "server"),
+    ("app.main", REPO_ROOT, "app.main"),
+]
+
+# 첫 사용 시점까지 임포트를 미뤄야 하는 무거운 라이브러리
+HEAVY_MODULES = ["pandas", "numpy", "PIL", "openpyxl", "google.genai", "jose", "passlib"]
+
+
+def import_once(cwd: str, module: str) -> tuple[float, list[tuple[int, str]], list[str]]:
+    """새 프로세스에서 모듈을 임포트하고 (전체 ms, [(누적 us, 모듈)], 로딩된 무거운 모듈)을 반환합니다."""
+    code = (
+        f"import sys, {module}; "
+        f"print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    )
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=cwd,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        try:
+            _, cumulative, name = line[len("import time:") :].split("|")
+            rows.append((int(cumulative), name.rstrip()))
+        except ValueError:
+            continue  # 헤더 줄
+    total_us = next(us for us, name in rows if name.strip() == module)
+    loaded = [m for m in proc.stdout.strip().split(",") if m]
+    return total_us / 1000, rows, loaded
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=8, help="출력할 무거운 하위 모듈 수")
+    args = parser.parse_args()
+
+    for label, cwd, module in TARGETS:
+        times, rows, loaded = [], [], []
+        for _ in range(args.runs):
+            total_ms, rows, loaded = import_once(cwd, module)
+            times.append(total_ms)
+
+        print(
+            f"{label}: median {statistics.median(times):.0f} ms "
+            f"(min {min(times):.0f}, max {max(times):.0f}, runs={args.runs})"
+        )
+        print(f"  조기 로딩된 무거운 모듈: {', '.join(loaded) or '없음'}")
+        # importtime은 하위 모듈을 부모보다 먼저 출력하므로,
+        # 직전 최상위 모듈 이후의 한 단계 들여쓰기 항목이 대상 모듈의 직접 임포트
+        direct, pending = [], []
+        for us, name in rows:
+            depth = (len(name) - len(name.lstrip()) - 1) // 2
+            if depth == 0:
+                if name.strip() == module:
+                    direct = pending
+                pending = []
+            elif depth == 1:
+                pending.append((us, name.strip()))
+        for us, name in sorted(direct, reverse=True)[: args.top]:
+            print(f"  {us / 1000:8.1f} ms  {name}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+# bench_streaming.py
+"""
+일반 호출(generate_content)과 스트리밍 호출(generate_content_stream + 점진적 JSON 파싱)의
+첫 응답까지의 시간(TTFB), 첫 필드 완성 시간, 전체 응답 시간을 비교하는 벤치마크입니다.
+기본은 로컬 대체 백엔드(지연 시간의 20%가 첫 조각 전, 나머지는 조각마다 나눠 도착)이고,
+--backend google이면 .env의 실제 키로 호출합니다. (호출 수만큼 요청/비용 발생)
+
+실행: python benchmarks/bench_streaming.py --calls 5 --latency 2.0
+"""
+import os
+import sys
+import time
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def run_mode(gemini_service, system_prompt: str, contents: list, calls: int, stream: bool) -> dict:
+    import app_config
+    from stream_json import IncrementalJSONParser
+
+    gemini_service.streaming_enabled = stream
+    first_bytes, first_fields, totals = [], [], []
+    for _ in range(calls):
+        parser = IncrementalJSONParser(app_config.STREAM_MAX_PREAMBLE_CHARS)
+        marks = {}
+
+        def on_chunk(text: str):
+            now = time.perf_counter()
+            marks.setdefault("first_byte", now)
+            if parser.feed(text):
+                marks.setdefault("first_field", now)
+
+        started = time.perf_counter()
+        gemini_service.call_gemini_api(system_prompt, contents, on_chunk)
+        finished = time.perf_counter()
+        # 일반 호출은 응답 전체가 한 번에 도착하므로 TTFB = 전체 시간
+        first_bytes.append(marks.get("first_byte", finished) - started)
+        first_fields.append(marks.get("first_field", finished) - started)
+        totals.append(finished - started)
+    return {
+        "ttfb": statistics.median(first_bytes),
+        "first_field": statistics.median(first_fields),
+        "total": statistics.median(totals),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=5)
+    parser.add_argument("--latency", type=float, default=2.0, help="로컬 백엔드 응답 지연(초)")
+    parser.add_argument("--backend", choices=("local", "google"), default="local")
+    args = parser.parse_args()
+
+    os.environ["GEMINI_BACKEND"] = args.backend
+    os.environ["CONTEXT_CACHE_ENABLED"] = "false"
+    from gemini_service import GeminiService
+
+    gemini_service = GeminiService()
+    if args.backend == "local":
+        gemini_service.get_client().models.latency_seconds = args.latency
+    system_prompt = "스터디 계획서와 결과보고서를 평가하여 JSON으로만 응답하세요."
+    contents = ["# [계획서 데이터]\n주 3회 알고리즘 문제 풀이\n\n# [결과보고서 데이터]\n12회 진행, 문제 40개 풀이"]
+
+    print(f"backend={args.backend} | calls={args.calls} (중앙값)")
+    for stream in (False, True):
+        result = run_mode(gemini_service, system_prompt, contents, args.calls, stream)
+        print(
+            f"{'stream' if stream else 'unary ':6} | TTFB {result['ttfb']:6.2f}s"
+            f" | 첫 필드 {result['first_field']:6.2f}s | 전체 {result['total']:6.2f}s"
+        )
+
+
+if __name__ == "__main__":
+    main()
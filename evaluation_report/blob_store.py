@@ -0,0 +1,123 @@
+# blob_store.py
+import os
+import time
+import asyncio
+import hashlib
+import logging
+import tempfile
+from typing import BinaryIO, Collection, Optional
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1024 * 1024
+# 저장 중인 임시 파일(.part)은 이 시간이 지나야 중단된 업로드의 잔여물로 보고 정리
+PART_GRACE_SECONDS = 3600
+
+
+class BlobStore:
+    """
+    업로드 파일을 SHA-256 해시 기준으로 로컬 디스크에 저장하는 저장소입니다.
+    같은 내용의 파일은 한 번만 저장되며, 보관 기간/용량 정책에 따라 오래된 파일을 정리합니다.
+    """
+
+    def __init__(self, root: str, retention_days: int, max_total_mb: int):
+        self.root = root
+        self.retention_seconds = retention_days * 24 * 3600
+        self.max_total_bytes = max_total_mb * 1024 * 1024
+        os.makedirs(self.root, exist_ok=True)
+
+    def path_for(self, sha256: str) -> str:
+        return os.path.join(self.root, sha256[:2], sha256)
+
+    def exists(self, sha256: Optional[str]) -> bool:
+        return bool(sha256) and os.path.exists(self.path_for(sha256))
+
+    def put_stream(self, stream: BinaryIO) -> tuple[str, int]:
+        """스트림을 청크 단위로 해시하며 저장하고 (sha256, 크기)를 반환합니다."""
+        digest = hashlib.sha256()
+        size = 0
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as out:
+                while chunk := stream.read(CHUNK_SIZE):
+                    digest.update(chunk)
+                    out.write(chunk)
+                    size += len(chunk)
+
+            sha256 = digest.hexdigest()
+            final_path = self.path_for(sha256)
+            if os.path.exists(final_path):
+                # 이미 저장된 내용이면 보관 기간만 갱신
+                os.utime(final_path)
+                os.remove(tmp_path)
+            else:
+                os.makedirs(os.path.dirname(final_path), exist_ok=True)
+                os.replace(tmp_path, final_path)
+            return sha256, size
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def read(self, sha256: str) -> bytes:
+        with open(self.path_for(sha256), "rb") as f:
+            return f.read()
+
+    def sweep(self, keep: Collection[str] = ()) -> int:
+        """
+        보관 기간이 지났거나 용량을 초과한 파일을 오래된 순으로 삭제하고 삭제 개수를 반환합니다.
+        keep의 해시(처리 대기 중인 쌍의 입력)는 용량 초과로는 삭제하지 않습니다.
+        """
+        entries = []
+        for dirpath, _, filenames in os.walk(self.root):
+            for name in filenames:
+                path = os.path.join(dirpath, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+
+        entries.sort()
+        now = time.time()
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for mtime, size, path in entries:
+            expired = now - mtime > self.retention_seconds
+            if not expired and total <= self.max_total_bytes:
+                break
+            if path.endswith(".part"):
+                # 다른 스레드가 아직 쓰고 있을 수 있는 임시 파일
+                if now - mtime < PART_GRACE_SECONDS:
+                    continue
+            elif not expired and os.path.basename(path) in keep:
+                continue
+            try:
+                os.remove(path)
+                total -= size
+                removed += 1
+            except FileNotFoundError:
+                continue
+
+        if removed:
+            logger.info(f"업로드 저장소 정리: {removed}개 파일 삭제")
+        return removed
+
+
+class StoredFile:
+    """
+    저장소에 보관된 파일을 UploadFile처럼(filename, size, seek, read) 다룰 수 있게 하는 래퍼입니다.
+    분석 파이프라인은 업로드 직후와 재분석 시 모두 이 객체를 입력으로 받습니다.
+    """
+
+    def __init__(self, store: BlobStore, filename: str, sha256: str, size: int = 0):
+        self.store = store
+        self.filename = filename
+        self.sha256 = sha256
+        self.size = size
+
+    async def seek(self, offset: int):
+        return None
+
+    async def read(self) -> bytes:
+        return await asyncio.to_thread(self.store.read, self.sha256)
@@ -0,0 +1,166 @@
+# circuit_breaker.py
+import time
+import asyncio
+import logging
+from typing import Optional
+
+import app_config
+import metrics
+from key_pool import DeadlineExceeded, is_failover_error
+
+logger = logging.getLogger(__name__)
+
+# 상태별 게이지 값
+_STATE_VALUES = {"closed": 0, "half_open": 1, "open": 2}
+
+
+class CircuitOpen(Exception):
+    """모델 API 장애로 회로가 열려 있어 호출하지 않고 바로 실패시킴 (CIRCUIT_OPEN_ACTION=fail)"""
+
+    def __init__(self, retry_after: float):
+        self.retry_after = retry_after
+        super().__init__(
+            f"모델 API 장애로 호출을 일시 중단했습니다. {retry_after:.0f}초 후 다시 시도해주세요."
+        )
+
+
+def is_backend_failure(error: BaseException) -> bool:
+    """
+    모델 API 자체의 장애로 볼 오류인지 판단합니다. (5xx, 연결/시간 초과)
+    429는 할당량 문제이므로 키 풀의 슬롯 쿨다운에 맡기고 여기서는 세지 않습니다.
+    """
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    if is_failover_error(error):
+        return getattr(error, "code", None) != 429
+    import httpx
+
+    return isinstance(error, httpx.TransportError)
+
+
+class CircuitBreaker:
+    """
+    모델 API 앞의 회로 차단기입니다.
+
+    - closed: 정상. 연속 장애가 failure_threshold회에 이르면 open
+    - open: open_seconds 동안 호출하지 않음. action이 "pause"면 대기열을 멈추고(호출이 기다림),
+      "fail"이면 CircuitOpen으로 바로 실패 (재시도 대기 없이 쌍이 빠르게 실패 처리됨)
+    - half_open: open 시간이 지나면 호출 하나만 탐색(probe)으로 보내고, 성공하면 closed,
+      실패하면 open 시간을 두 배로 늘려(최대 max_open_seconds) 다시 open
+    """
+
+    def __init__(
+        self,
+        failure_threshold: int = 5,
+        open_seconds: float = 30.0,
+        max_open_seconds: float = 300.0,
+        action: str = "pause",
+    ):
+        self.failure_threshold = max(1, failure_threshold)
+        self.open_seconds = open_seconds
+        self.max_open_seconds = max(open_seconds, max_open_seconds)
+        self.action = action
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.opened_count = 0
+        self.open_until = 0.0
+        self._current_open_seconds = open_seconds
+        self._probing = False
+        self._cond = asyncio.Condition()
+        metrics.CIRCUIT_STATE.set(0)
+
+    @classmethod
+    def from_config(cls) -> "CircuitBreaker":
+        return cls(
+            failure_threshold=app_config.CIRCUIT_FAILURE_THRESHOLD,
+            open_seconds=app_config.CIRCUIT_OPEN_SECONDS,
+            max_open_seconds=app_config.CIRCUIT_MAX_OPEN_SECONDS,
+            action=app_config.CIRCUIT_OPEN_ACTION,
+        )
+
+    def _set_state(self, state: str):
+        if state != self.state:
+            logger.warning(f"모델 API 회로 상태 변경: {self.state} -> {state}")
+            self.state = state
+            metrics.CIRCUIT_STATE.set(_STATE_VALUES[state])
+
+    async def before_call(self, deadline: Optional[float] = None) -> bool:
+        """
+        호출해도 되는지 확인합니다. 회로가 열려 있으면 action에 따라 기다리거나 CircuitOpen을 던집니다.
+        deadline(time.monotonic 기준)까지 회로가 닫히지 않으면 DeadlineExceeded를 던집니다.
+        반환값: 이 호출이 복구 확인(탐색) 호출인지 여부
+        """
+        async with self._cond:
+            while True:
+                now = time.monotonic()
+                if self.state == "closed":
+                    return False
+                if self.state == "open" and now >= self.open_until:
+                    self._set_state("half_open")
+                if self.state == "half_open" and not self._probing:
+                    # 복구 확인용 호출 하나만 통과
+                    self._probing = True
+                    logger.info("모델 API 복구 확인 호출을 보냅니다.")
+                    return True
+                if self.action == "fail":
+                    metrics.CIRCUIT_REJECTED.inc()
+                    raise CircuitOpen(max(0.0, self.open_until - now))
+                wake_at = self.open_until if self.state == "open" else now + 1.0
+                if deadline is not None:
+                    if deadline <= now:
+                        raise DeadlineExceeded("모델 API 복구를 기다리는 중 처리 기한이 지났습니다.")
+                    wake_at = min(wake_at, deadline)
+                try:
+                    async with asyncio.timeout(max(0.05, wake_at - now)):
+                        await self._cond.wait()
+                except TimeoutError:
+                    pass
+
+    async def record(self, error: Optional[BaseException] = None, probe: bool = False):
+        """호출 결과를 반영합니다. (장애가 아닌 오류는 API가 응답한 것이므로 성공으로 봄)"""
+        async with self._cond:
+            if probe:
+                self._probing = False
+            if error is None or not is_backend_failure(error):
+                if self.state != "closed":
+                    logger.info("모델 API가 복구되어 호출을 재개합니다.")
+                self.consecutive_failures = 0
+                self._current_open_seconds = self.open_seconds
+                self._set_state("closed")
+            else:
+                self.consecutive_failures += 1
+                if probe or (
+                    self.state == "closed" and self.consecutive_failures >= self.failure_threshold
+                ):
+                    if probe:
+                        self._current_open_seconds = min(
+                            self._current_open_seconds * 2, self.max_open_seconds
+                        )
+                    self._open()
+            self._cond.notify_all()
+
+    async def cancel_probe(self):
+        """탐색 호출이 결과 없이 취소됨: 다음 호출이 탐색하도록 넘김"""
+        async with self._cond:
+            self._probing = False
+            self._cond.notify_all()
+
+    def _open(self):
+        self.open_until = time.monotonic() + self._current_open_seconds
+        self.opened_count += 1
+        self._set_state("open")
+        logger.warning(
+            f"모델 API 연속 장애 {self.consecutive_failures}회, "
+            f"{self._current_open_seconds:.0f}초 동안 호출 중단 ({self.action})"
+        )
+
+    def stats(self) -> dict:
+        return {
+            "state": self.state,
+            "action": self.action,
+            "consecutive_failures": self.consecutive_failures,
+            "opened_count": self.opened_count,
+            "open_remaining": round(max(0.0, self.open_until - time.monotonic()), 1)
+            if self.state == "open"
+            else 0.0,
+        }
@@ -2,8 +2,11 @@
 import sqlite3
 import logging
 import json
+import functools
 from typing import Optional
 
+import metrics
+
 # 로컬 모듈 임포트
 # app_config에서 DB 경로를 관리하는 경우 여기에 포함시키거나, server.py에서와 같이 직접 정의합니다.
 # 여기서는 server.py에서 정의한 DATABASE_URL을 재정의합니다.
@@ -12,6 +15,17 @@ DATABASE_URL = "analysis_results.db"
 logger = logging.getLogger(__name__)
 
 
+def _timed(func):
+    """DB 함수 실행 시간을 지표(evaluation_db_latency_seconds)로 기록합니다."""
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with metrics.DB_LATENCY.time(operation=func.__name__):
+            return func(*args, **kwargs)
+
+    return wrapper
+
+
 # --- DB 설정 및 초기화 (server.py에서 이동) ---
 def init_db():
     """DB 테이블을 확인하고, 새 컬럼(campus, class_name, author_name)을 추가합니다."""
@@ -44,12 +58,113 @@ def init_db():
         cursor.execute("ALTER TABLE analysis_results ADD COLUMN author_name TEXT")
         logger.info("DB 스키마 변경: 'author_name' 컬럼 추가")
 
+    # 업로드 작업(job)과 쌍(pair)별 입력 파일/처리 상태 (실패 쌍 재처리용)
+    cursor.execute(
+        """
+    CREATE TABLE IF NOT EXISTS jobs (
+        id TEXT PRIMARY KEY,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    );
+    """
+    )
+    cursor.execute(
+        """
+    CREATE TABLE IF NOT EXISTS job_pairs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        job_id TEXT NOT NULL,
+        pair_key TEXT NOT NULL,
+        plan_filename TEXT,
+        plan_sha256 TEXT,
+        plan_size INTEGER,
+        report_filename TEXT,
+        report_sha256 TEXT,
+        report_size INTEGER,
+        status TEXT NOT NULL DEFAULT 'queued',
+        result_id INTEGER,
+        error TEXT,
+        updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        UNIQUE (job_id, pair_key)
+    );
+    """
+    )
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_job_pairs_result_id ON job_pairs (result_id)"
+    )
+    cursor.execute("PRAGMA table_info(job_pairs)")
+    if "scheduled_at" not in [row[1] for row in cursor.fetchall()]:
+        # 일일 한도 초과로 미룬 쌍의 처리 예정 시각 (UTC, CURRENT_TIMESTAMP 형식)
+        cursor.execute("ALTER TABLE job_pairs ADD COLUMN scheduled_at DATETIME")
+        logger.info("DB 스키마 변경: job_pairs 'scheduled_at' 컬럼 추가")
+
+    # 키/모델 슬롯별 일일 요청 사용량 (워커 프로세스/재시작과 무관하게 집계)
+    cursor.execute(
+        """
+    CREATE TABLE IF NOT EXISTS daily_quota_usage (
+        quota_day TEXT NOT NULL,
+        slot_id TEXT NOT NULL,
+        used INTEGER NOT NULL DEFAULT 0,
+        exhausted INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (quota_day, slot_id)
+    );
+    """
+    )
+
+    # 유사 보고서 탐지용 MinHash 서명과 LSH 밴드 버킷 (버킷 조회는 기본 키 색인으로 처리)
+    cursor.execute(
+        """
+    CREATE TABLE IF NOT EXISTS result_minhash (
+        result_id INTEGER PRIMARY KEY,
+        signature BLOB NOT NULL
+    );
+    """
+    )
+    cursor.execute(
+        """
+    CREATE TABLE IF NOT EXISTS result_lsh_bands (
+        band INTEGER NOT NULL,
+        bucket INTEGER NOT NULL,
+        result_id INTEGER NOT NULL,
+        PRIMARY KEY (band, bucket, result_id)
+    ) WITHOUT ROWID;
+    """
+    )
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_result_lsh_bands_result_id ON result_lsh_bands (result_id)"
+    )
+
+    # 감시 폴더 체크포인트: 파일별 해시(변경 없는 파일은 다시 해시하지 않음)와 쌍별 처리 결과
+    cursor.execute(
+        """
+    CREATE TABLE IF NOT EXISTS watch_files (
+        path TEXT PRIMARY KEY,
+        size INTEGER NOT NULL,
+        mtime_ns INTEGER NOT NULL,
+        sha256 TEXT NOT NULL,
+        updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    );
+    """
+    )
+    cursor.execute(
+        """
+    CREATE TABLE IF NOT EXISTS watch_pairs (
+        pair_key TEXT PRIMARY KEY,
+        plan_sha256 TEXT,
+        report_sha256 TEXT,
+        status TEXT NOT NULL,
+        result_id INTEGER,
+        job_id TEXT,
+        updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    );
+    """
+    )
+
     conn.commit()
     conn.close()
     logger.info("데이터베이스 테이블 확인/업데이트 완료.")
 
 
 # --- DB 저장 함수 (server.py에서 이동) ---
+@_timed
 def save_result_to_db(
     filename: str,
     total_score: int,
@@ -59,7 +174,7 @@ def save_result_to_db(
     class_name: Optional[str],
     author_name: Optional[str],
 ):
-    """분석 결과를 DB에 저장 (신규 컬럼 포함)"""
+    """분석 결과를 DB에 저장 (신규 컬럼 포함)하고, 저장된 행의 ID를 반환합니다."""
     try:
         conn = sqlite3.connect(DATABASE_URL)
         cursor = conn.cursor()
@@ -79,16 +194,20 @@ def save_result_to_db(
                 author_name,
             ),
         )
+        result_id = cursor.lastrowid
         conn.commit()
         conn.close()
         logger.info(
             f"[{filename}] 결과를 DB에 저장했습니다. (정보: {campus}, {class_name}, {author_name})"
         )
+        return result_id
     except Exception as e:
         logger.error(f"[{filename}] DB 저장 실패: {e}")
+        return None
 
 
 # --- 결과 목록 조회 함수 (server.py에서 이동) ---
+@_timed
 def get_all_results(
     campus: Optional[str],
     class_name: Optional[str],
@@ -134,6 +253,7 @@ def get_all_results(
 
 
 # --- 필터 옵션 조회 함수 (server.py에서 이동) ---
+@_timed
 def get_filter_options() -> dict:
     """필터링 드롭다운에 사용할 캠퍼스 및 반 목록을 반환합니다."""
     conn = sqlite3.connect(DATABASE_URL)
@@ -155,6 +275,7 @@ def get_filter_options() -> dict:
 
 
 # --- 세부 내용 조회 함수 (server.py에서 이동) ---
+@_timed
 def get_result_detail(result_id: int) -> dict:
     """특정 분석 결과의 상세 내용(JSON 데이터)을 반환합니다."""
     conn = sqlite3.connect(DATABASE_URL)
@@ -178,3 +299,389 @@ def get_result_detail(result_id: int) -> dict:
     else:
         # 이 함수를 server.py에서 호출할 때 HTTPException으로 래핑됩니다.
         raise FileNotFoundError(f"결과 ID {result_id}를 찾을 수 없습니다.")
+
+
+# --- 결과 갱신 함수 (재분석 시 기존 결과 ID 유지) ---
+@_timed
+def update_result_in_db(
+    result_id: int, total_score: int, photo_count: int, analysis_json: str
+):
+    """기존 분석 결과를 새 분석 내용으로 덮어쓰고, 결과 ID를 그대로 반환합니다."""
+    try:
+        conn = sqlite3.connect(DATABASE_URL)
+        cursor = conn.cursor()
+        cursor.execute(
+            """
+            UPDATE analysis_results
+            SET total_score = ?, photo_count = ?, analysis_json = ?
+            WHERE id = ?
+            """,
+            (total_score, photo_count, analysis_json, result_id),
+        )
+        conn.commit()
+        conn.close()
+        logger.info(f"결과 ID {result_id}를 재분석 결과로 갱신했습니다.")
+        return result_id
+    except Exception as e:
+        logger.error(f"결과 ID {result_id} 갱신 실패: {e}")
+        return None
+
+
+# --- 유사 보고서 색인 (MinHash/LSH) ---
+@_timed
+def save_result_minhash(result_id: int, signature: bytes, buckets: list[int]):
+    """결과의 MinHash 서명과 밴드 버킷을 저장합니다. (재분석 시 기존 색인을 교체)"""
+    conn = sqlite3.connect(DATABASE_URL)
+    with conn:
+        conn.execute("DELETE FROM result_lsh_bands WHERE result_id = ?", (result_id,))
+        conn.execute(
+            "INSERT OR REPLACE INTO result_minhash (result_id, signature) VALUES (?, ?)",
+            (result_id, signature),
+        )
+        conn.executemany(
+            "INSERT OR IGNORE INTO result_lsh_bands (band, bucket, result_id) VALUES (?, ?, ?)",
+            [(band, bucket, result_id) for band, bucket in enumerate(buckets)],
+        )
+    conn.close()
+
+
+@_timed
+def find_minhash_candidates(buckets: list[int]) -> list[dict]:
+    """밴드 버킷이 하나라도 같은 결과들의 서명과 파일명을 반환합니다. (밴드별 색인 조회)"""
+    if not buckets:
+        return []
+    conn = sqlite3.connect(DATABASE_URL)
+    conn.row_factory = sqlite3.Row
+    values = ", ".join("(?, ?)" for _ in buckets)
+    params = [value for band, bucket in enumerate(buckets) for value in (band, bucket)]
+    rows = conn.execute(
+        f"""
+        WITH query (band, bucket) AS (VALUES {values})
+        SELECT m.result_id, m.signature, r.filename, r.total_score, r.created_at
+        FROM result_minhash m
+        JOIN analysis_results r ON r.id = m.result_id
+        WHERE m.result_id IN (
+            SELECT b.result_id FROM query q
+            JOIN result_lsh_bands b ON b.band = q.band AND b.bucket = q.bucket
+        )
+        """,
+        params,
+    ).fetchall()
+    conn.close()
+    return [dict(row) for row in rows]
+
+
+# --- 작업(job) 관련 함수 ---
+@_timed
+def create_job(job_id: str, pairs: list[dict]) -> list[dict]:
+    """
+    작업과 쌍별 입력 파일 정보를 저장하고, 저장된 쌍 목록을 반환합니다.
+    같은 job_id로 다시 올리면(페이지 재시도 등) 기존 쌍 행의 id와 result_id는 유지하고
+    입력 파일 정보와 상태만 갱신합니다. (이후 실패 쌍 재처리/재분석이 이전 결과와 이어지도록)
+    """
+    conn = sqlite3.connect(DATABASE_URL)
+    cursor = conn.cursor()
+    cursor.execute("INSERT OR IGNORE INTO jobs (id) VALUES (?)", (job_id,))
+    cursor.executemany(
+        """
+        INSERT INTO job_pairs
+        (job_id, pair_key, plan_filename, plan_sha256, plan_size,
+         report_filename, report_sha256, report_size, status)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, 'queued')
+        ON CONFLICT (job_id, pair_key) DO UPDATE SET
+            plan_filename = excluded.plan_filename,
+            plan_sha256 = excluded.plan_sha256,
+            plan_size = excluded.plan_size,
+            report_filename = excluded.report_filename,
+            report_sha256 = excluded.report_sha256,
+            report_size = excluded.report_size,
+            status = 'queued',
+            error = NULL,
+            updated_at = CURRENT_TIMESTAMP
+        """,
+        [
+            (
+                job_id,
+                pair["pair_key"],
+                pair.get("plan_filename"),
+                pair.get("plan_sha256"),
+                pair.get("plan_size"),
+                pair.get("report_filename"),
+                pair.get("report_sha256"),
+                pair.get("report_size"),
+            )
+            for pair in pairs
+        ],
+    )
+    conn.commit()
+    conn.close()
+    return get_job_pairs(job_id)
+
+
+@_timed
+def get_job_pairs(job_id: str, statuses: Optional[list[str]] = None) -> list[dict]:
+    """작업에 속한 쌍 목록을 (상태로 필터링하여) 반환합니다."""
+    conn = sqlite3.connect(DATABASE_URL)
+    conn.row_factory = sqlite3.Row
+    cursor = conn.cursor()
+
+    query = "SELECT * FROM job_pairs WHERE job_id = ?"
+    params: list = [job_id]
+    if statuses:
+        query += f" AND status IN ({', '.join('?' for _ in statuses)})"
+        params.extend(statuses)
+    query += " ORDER BY id"
+
+    cursor.execute(query, params)
+    rows = [dict(row) for row in cursor.fetchall()]
+    conn.close()
+    return rows
+
+
+@_timed
+def get_job_pair_by_result(result_id: int) -> Optional[dict]:
+    """분석 결과 ID로 해당 결과를 만든 쌍의 입력 정보를 찾습니다."""
+    conn = sqlite3.connect(DATABASE_URL)
+    conn.row_factory = sqlite3.Row
+    cursor = conn.cursor()
+    cursor.execute(
+        "SELECT * FROM job_pairs WHERE result_id = ? ORDER BY id DESC LIMIT 1",
+        (result_id,),
+    )
+    row = cursor.fetchone()
+    conn.close()
+    return dict(row) if row else None
+
+
+@_timed
+def update_job_pair(
+    pair_id: int,
+    status: str,
+    result_id: Optional[int] = None,
+    error: Optional[str] = None,
+    scheduled_at: Optional[str] = None,
+):
+    """쌍의 처리 상태를 갱신합니다. (result_id는 값이 있을 때만 덮어씀)"""
+    conn = sqlite3.connect(DATABASE_URL)
+    cursor = conn.cursor()
+    cursor.execute(
+        """
+        UPDATE job_pairs
+        SET status = ?, result_id = COALESCE(?, result_id), error = ?,
+            scheduled_at = ?, updated_at = CURRENT_TIMESTAMP
+        WHERE id = ?
+        """,
+        (status, result_id, error, scheduled_at, pair_id),
+    )
+    conn.commit()
+    conn.close()
+
+
+@_timed
+def defer_job_pairs(schedules: list[tuple[int, str]], reason: str):
+    """쌍들을 'deferred' 상태로 바꾸고 처리 예정 시각(UTC)을 기록합니다. [(쌍 ID, 예정 시각), ...]"""
+    conn = sqlite3.connect(DATABASE_URL)
+    cursor = conn.cursor()
+    cursor.executemany(
+        """
+        UPDATE job_pairs
+        SET status = 'deferred', error = ?, scheduled_at = ?, updated_at = CURRENT_TIMESTAMP
+        WHERE id = ?
+        """,
+        [(reason, scheduled_at, pair_id) for pair_id, scheduled_at in schedules],
+    )
+    conn.commit()
+    conn.close()
+
+
+@_timed
+def cancel_job_pairs(pair_ids: list[int]):
+    """처리가 취소된 쌍들을 'cancelled' 상태로 바꿉니다. (실패 쌍 재처리 대상)"""
+    conn = sqlite3.connect(DATABASE_URL)
+    cursor = conn.cursor()
+    cursor.executemany(
+        """
+        UPDATE job_pairs
+        SET status = 'cancelled', error = '요청이 취소되어 처리를 중단했습니다.',
+            updated_at = CURRENT_TIMESTAMP
+        WHERE id = ?
+        """,
+        [(pair_id,) for pair_id in pair_ids],
+    )
+    conn.commit()
+    conn.close()
+
+
+@_timed
+def count_deferred_pairs() -> int:
+    """한도 초기화 이후로 미뤄져 대기 중인 쌍 수"""
+    conn = sqlite3.connect(DATABASE_URL)
+    cursor = conn.cursor()
+    cursor.execute("SELECT COUNT(*) FROM job_pairs WHERE status = 'deferred'")
+    count = cursor.fetchone()[0]
+    conn.close()
+    return count
+
+
+@_timed
+def get_pending_blob_hashes() -> set[str]:
+    """아직 처리되지 않은('queued'/'deferred') 쌍이 참조하는 입력 파일 해시"""
+    conn = sqlite3.connect(DATABASE_URL)
+    cursor = conn.cursor()
+    cursor.execute(
+        """
+        SELECT plan_sha256, report_sha256 FROM job_pairs
+        WHERE status IN ('queued', 'deferred')
+        """
+    )
+    hashes = {sha256 for row in cursor.fetchall() for sha256 in row if sha256}
+    conn.close()
+    return hashes
+
+
+@_timed
+def claim_due_deferred_pairs(now: str) -> list[dict]:
+    """
+    예정 시각(now, UTC)이 지난 미뤄둔 쌍을 'queued'로 바꾸고 반환합니다.
+    (한 번의 UPDATE로 가져가므로 여러 워커 프로세스가 같은 쌍을 중복 처리하지 않음)
+    """
+    conn = sqlite3.connect(DATABASE_URL)
+    conn.row_factory = sqlite3.Row
+    cursor = conn.cursor()
+    cursor.execute(
+        """
+        UPDATE job_pairs
+        SET status = 'queued', updated_at = CURRENT_TIMESTAMP
+        WHERE status = 'deferred' AND scheduled_at <= ?
+        RETURNING *
+        """,
+        (now,),
+    )
+    rows = [dict(row) for row in cursor.fetchall()]
+    conn.commit()
+    conn.close()
+    return sorted(rows, key=lambda row: row["id"])
+
+
+# --- 일일 요청 한도 사용량 ---
+@_timed
+def get_daily_quota_usage(quota_day: str) -> dict[str, dict]:
+    """해당 날짜의 슬롯별 사용량 {slot_id: {"used", "exhausted"}}"""
+    conn = sqlite3.connect(DATABASE_URL)
+    cursor = conn.cursor()
+    cursor.execute(
+        "SELECT slot_id, used, exhausted FROM daily_quota_usage WHERE quota_day = ?",
+        (quota_day,),
+    )
+    usage = {
+        slot_id: {"used": used, "exhausted": bool(exhausted)}
+        for slot_id, used, exhausted in cursor.fetchall()
+    }
+    conn.close()
+    return usage
+
+
+@_timed
+def add_daily_quota_usage(quota_day: str, slot_id: str, count: int = 1) -> int:
+    """슬롯의 일일 사용량을 늘리고 누적 사용량을 반환합니다."""
+    conn = sqlite3.connect(DATABASE_URL)
+    cursor = conn.cursor()
+    cursor.execute(
+        """
+        INSERT INTO daily_quota_usage (quota_day, slot_id, used) VALUES (?, ?, ?)
+        ON CONFLICT(quota_day, slot_id) DO UPDATE SET used = used + excluded.used
+        RETURNING used
+        """,
+        (quota_day, slot_id, count),
+    )
+    used = cursor.fetchone()[0]
+    conn.commit()
+    conn.close()
+    return used
+
+
+@_timed
+def mark_daily_quota_exhausted(quota_day: str, slot_id: str):
+    """API가 일일 한도 소진(429)을 알린 슬롯을 그날 사용하지 않도록 기록합니다."""
+    conn = sqlite3.connect(DATABASE_URL)
+    cursor = conn.cursor()
+    cursor.execute(
+        """
+        INSERT INTO daily_quota_usage (quota_day, slot_id, exhausted) VALUES (?, ?, 1)
+        ON CONFLICT(quota_day, slot_id) DO UPDATE SET exhausted = 1
+        """,
+        (quota_day, slot_id),
+    )
+    conn.commit()
+    conn.close()
+
+
+# --- 감시 폴더 체크포인트 ---
+@_timed
+def get_watch_file(path: str) -> Optional[dict]:
+    conn = sqlite3.connect(DATABASE_URL)
+    conn.row_factory = sqlite3.Row
+    cursor = conn.cursor()
+    cursor.execute("SELECT * FROM watch_files WHERE path = ?", (path,))
+    row = cursor.fetchone()
+    conn.close()
+    return dict(row) if row else None
+
+
+@_timed
+def save_watch_file(path: str, size: int, mtime_ns: int, sha256: str):
+    conn = sqlite3.connect(DATABASE_URL)
+    cursor = conn.cursor()
+    cursor.execute(
+        """
+        INSERT INTO watch_files (path, size, mtime_ns, sha256) VALUES (?, ?, ?, ?)
+        ON CONFLICT(path) DO UPDATE SET
+            size = excluded.size, mtime_ns = excluded.mtime_ns,
+            sha256 = excluded.sha256, updated_at = CURRENT_TIMESTAMP
+        """,
+        (path, size, mtime_ns, sha256),
+    )
+    conn.commit()
+    conn.close()
+
+
+@_timed
+def get_watch_pair(pair_key: str) -> Optional[dict]:
+    conn = sqlite3.connect(DATABASE_URL)
+    conn.row_factory = sqlite3.Row
+    cursor = conn.cursor()
+    cursor.execute("SELECT * FROM watch_pairs WHERE pair_key = ?", (pair_key,))
+    row = cursor.fetchone()
+    conn.close()
+    return dict(row) if row else None
+
+
+@_timed
+def save_watch_pair(
+    pair_key: str,
+    plan_sha256: Optional[str],
+    report_sha256: Optional[str],
+    status: str,
+    result_id: Optional[int],
+    job_id: str,
+):
+    """쌍의 처리 결과를 기록합니다. (result_id는 값이 있을 때만 덮어씀)"""
+    conn = sqlite3.connect(DATABASE_URL)
+    cursor = conn.cursor()
+    cursor.execute(
+        """
+        INSERT INTO watch_pairs
+            (pair_key, plan_sha256, report_sha256, status, result_id, job_id)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT(pair_key) DO UPDATE SET
+            plan_sha256 = excluded.plan_sha256,
+            report_sha256 = excluded.report_sha256,
+            status = excluded.status,
+            result_id = COALESCE(excluded.result_id, watch_pairs.result_id),
+            job_id = excluded.job_id,
+            updated_at = CURRENT_TIMESTAMP
+        """,
+        (pair_key, plan_sha256, report_sha256, status, result_id, job_id),
+    )
+    conn.commit()
+    conn.close()
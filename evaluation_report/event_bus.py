@@ -0,0 +1,92 @@
+# event_bus.py
+import asyncio
+import logging
+import time
+from collections import defaultdict, deque
+from typing import AsyncIterator, Optional
+
+logger = logging.getLogger(__name__)
+
+# 작업 시작/종료를 알리는 이벤트 타입 (구독 스트림은 종료 이벤트(완료/취소) 후 끝남)
+START_EVENT = "job_started"
+TERMINAL_EVENTS = frozenset({"job_completed", "job_cancelled"})
+
+
+class EventBus:
+    """
+    작업(job) 단위로 진행 이벤트를 발행/구독하는 인프로세스 이벤트 버스입니다.
+    분석 파이프라인이 이벤트를 발행하고, SSE 엔드포인트가 이를 구독합니다.
+    늦게 접속한 구독자도 놓친 이벤트를 받을 수 있도록 작업별 이력을 보관합니다.
+    """
+
+    def __init__(self, history_size: int = 2000, retention_seconds: int = 1800):
+        self.history_size = history_size
+        self.retention_seconds = retention_seconds
+        self._history: dict[str, deque] = {}
+        self._subscribers: dict[str, set[asyncio.Queue]] = defaultdict(set)
+        self._finished_at: dict[str, float] = {}
+
+    def publish(self, job_id: Optional[str], event_type: str, **payload):
+        """이벤트를 이력에 남기고 현재 구독자들에게 전달합니다."""
+        if not job_id:
+            return
+
+        event = {"job_id": job_id, "type": event_type, "ts": time.time(), **payload}
+        if event_type == START_EVENT:
+            # 같은 job_id로 재처리(실패 쌍 재시도 등)를 시작하면 이전 실행 이력은 비움
+            self._history.pop(job_id, None)
+            self._finished_at.pop(job_id, None)
+        history = self._history.setdefault(job_id, deque(maxlen=self.history_size))
+        history.append(event)
+
+        for queue in list(self._subscribers.get(job_id, ())):
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                # 느린 구독자 때문에 파이프라인이 막히지 않도록 이벤트를 버립니다.
+                logger.warning(f"[{job_id}] 구독자 큐가 가득 차 이벤트를 버립니다.")
+
+        if event_type in TERMINAL_EVENTS:
+            self._finished_at[job_id] = time.time()
+        self._prune()
+
+    async def subscribe(
+        self, job_id: str, heartbeat_seconds: Optional[float] = None
+    ) -> AsyncIterator[Optional[dict]]:
+        """
+        지난 이벤트를 먼저 재생한 뒤, 작업이 끝날 때까지 새 이벤트를 전달합니다.
+        heartbeat_seconds 동안 새 이벤트가 없으면 None을 전달합니다. (연결 유지용)
+        """
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.history_size)
+        self._subscribers[job_id].add(queue)
+        try:
+            for event in list(self._history.get(job_id, ())):
+                yield event
+                if event["type"] in TERMINAL_EVENTS:
+                    return
+
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), heartbeat_seconds)
+                except asyncio.TimeoutError:
+                    yield None
+                    continue
+                yield event
+                if event["type"] in TERMINAL_EVENTS:
+                    return
+        finally:
+            self._subscribers[job_id].discard(queue)
+            if not self._subscribers[job_id]:
+                del self._subscribers[job_id]
+
+    def _prune(self):
+        """보관 기간이 지난 완료 작업의 이력을 정리합니다."""
+        now = time.time()
+        expired = [
+            job_id
+            for job_id, finished in self._finished_at.items()
+            if now - finished > self.retention_seconds
+        ]
+        for job_id in expired:
+            self._history.pop(job_id, None)
+            self._finished_at.pop(job_id, None)
@@ -0,0 +1,189 @@
+# extraction_cache.py
+import os
+import json
+import struct
+import hashlib
+import logging
+import tempfile
+import threading
+from typing import Optional
+
+from cachetools import LRUCache
+
+import app_config
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# 추출 방식(텍스트/사진 추출, 사진 축소/특징)을 바꾸면 올림: 이전 버전 캐시는 쓰이지 않고 용량 정리 때 지워짐
+EXTRACTOR_VERSION = 1
+
+_HEADER_LENGTH = struct.Struct(">I")
+
+
+def extractor_version() -> str:
+    """캐시 키에 넣는 추출기 버전: 코드 버전 + 추출 결과에 영향을 주는 설정(사진 축소 크기)"""
+    digest = hashlib.sha256()
+    digest.update(f"{EXTRACTOR_VERSION}|{app_config.EXTRACTION_IMAGE_MAX_SIDE}".encode())
+    return digest.hexdigest()[:12]
+
+
+def _encode(entry: dict) -> bytes:
+    """[헤더 길이(4바이트)][JSON 헤더: 텍스트, 사진 메타데이터][사진 바이트를 이어 붙인 본문]"""
+    header = {
+        "text": entry["text"],
+        "images": [
+            {**{k: v for k, v in image.items() if k != "data"}, "length": len(image["data"])}
+            for image in entry["images"]
+        ],
+    }
+    header_bytes = json.dumps(header, ensure_ascii=False).encode("utf-8")
+    return b"".join(
+        [_HEADER_LENGTH.pack(len(header_bytes)), header_bytes]
+        + [image["data"] for image in entry["images"]]
+    )
+
+
+def _decode(raw: bytes) -> dict:
+    (header_length,) = _HEADER_LENGTH.unpack_from(raw)
+    offset = _HEADER_LENGTH.size + header_length
+    header = json.loads(raw[_HEADER_LENGTH.size : offset].decode("utf-8"))
+    images = []
+    for image in header["images"]:
+        length = image.pop("length")
+        images.append({**image, "data": raw[offset : offset + length]})
+        offset += length
+    return {"text": header["text"], "images": images}
+
+
+class ExtractionCache:
+    """
+    파일별 추출 결과(압축 텍스트, 축소한 사진 바이트와 사진 특징)를 파일 SHA-256 + 추출기 버전으로
+    보관하는 캐시입니다. 메모리 LRU(바이트 한도)를 먼저 보고, 없으면 디스크에서 읽어 메모리로 올립니다.
+    디스크는 BlobStore와 같이 해시 앞 두 글자 폴더에 저장하고, 용량을 넘으면 오래 안 쓴 순으로 지웁니다.
+    (계획서는 보통 바뀌지 않은 채 새 보고서와 함께 다시 올라오므로, 바뀐 파일만 파싱하게 됨)
+    """
+
+    def __init__(self, root: str, memory_mb: int, max_disk_mb: int):
+        self.root = root
+        self.max_disk_bytes = max_disk_mb * 1024 * 1024
+        self.version = extractor_version()
+        self._memory: LRUCache = LRUCache(
+            maxsize=max(1, memory_mb * 1024 * 1024), getsizeof=lambda item: item[1]
+        )
+        self._lock = threading.Lock()
+        # 디스크 사용량 (처음 저장할 때 한 번 집계한 뒤 저장/삭제 시 갱신)
+        self._disk_bytes: Optional[int] = None
+        os.makedirs(self.root, exist_ok=True)
+
+    @classmethod
+    def from_config(cls) -> Optional["ExtractionCache"]:
+        """설정으로 캐시를 만듭니다. (EXTRACTION_CACHE_ENABLED=false면 None)"""
+        if not app_config.EXTRACTION_CACHE_ENABLED:
+            return None
+        return cls(
+            app_config.EXTRACTION_CACHE_PATH,
+            app_config.EXTRACTION_CACHE_MEMORY_MB,
+            app_config.EXTRACTION_CACHE_MAX_MB,
+        )
+
+    def path_for(self, sha256: str) -> str:
+        return os.path.join(self.root, sha256[:2], f"{sha256}.{self.version}")
+
+    def get(self, sha256: str) -> Optional[dict]:
+        """캐시된 추출 결과 {"text", "images": [{"data", "name", "sheet", "features"}]} (없으면 None)"""
+        with self._lock:
+            item = self._memory.get(sha256)
+        if item is not None:
+            metrics.EXTRACTION_CACHE.inc(outcome="memory_hit")
+            return item[0]
+
+        path = self.path_for(sha256)
+        try:
+            with open(path, "rb") as f:
+                raw = f.read()
+            entry = _decode(raw)
+        except FileNotFoundError:
+            metrics.EXTRACTION_CACHE.inc(outcome="miss")
+            return None
+        except (OSError, ValueError, struct.error) as e:
+            logger.warning(f"추출 캐시 파일이 손상되어 무시합니다 ({path}): {e}")
+            metrics.EXTRACTION_CACHE.inc(outcome="miss")
+            return None
+        # 최근 사용 시각 갱신 (디스크 정리 순서)
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        with self._lock:
+            self._memory[sha256] = (entry, len(raw))
+        metrics.EXTRACTION_CACHE.inc(outcome="disk_hit")
+        return entry
+
+    def put(self, sha256: str, entry: dict):
+        """추출 결과를 메모리와 디스크에 저장합니다. (디스크 저장 실패는 기록만 하고 무시)"""
+        raw = _encode(entry)
+        with self._lock:
+            self._memory[sha256] = (entry, len(raw))
+
+        path = self.path_for(sha256)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=self.root, suffix=".part")
+            with os.fdopen(fd, "wb") as out:
+                out.write(raw)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"추출 캐시를 디스크에 저장하지 못했습니다: {e}")
+            return
+
+        with self._lock:
+            if self._disk_bytes is None:
+                self._disk_bytes = self._total_disk_bytes()
+            else:
+                self._disk_bytes += len(raw)
+            over_limit = self._disk_bytes > self.max_disk_bytes
+        if over_limit:
+            self.sweep()
+
+    def _total_disk_bytes(self) -> int:
+        total = 0
+        for dirpath, _, filenames in os.walk(self.root):
+            for name in filenames:
+                try:
+                    total += os.stat(os.path.join(dirpath, name)).st_size
+                except FileNotFoundError:
+                    continue
+        return total
+
+    def sweep(self) -> int:
+        """디스크 용량을 넘으면 오래 안 쓴 순으로 삭제하고 삭제 개수를 반환합니다. (용량의 90%까지 비움)"""
+        entries = []
+        for dirpath, _, filenames in os.walk(self.root):
+            for name in filenames:
+                path = os.path.join(dirpath, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+
+        entries.sort()
+        total = sum(size for _, size, _ in entries)
+        target = self.max_disk_bytes * 0.9
+        removed = 0
+        for _, size, path in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+                total -= size
+                removed += 1
+            except FileNotFoundError:
+                continue
+
+        with self._lock:
+            self._disk_bytes = total
+        if removed:
+            logger.info(f"추출 캐시 정리: {removed}개 파일 삭제")
+        return removed
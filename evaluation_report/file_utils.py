@@ -1,23 +1,23 @@
 # file_utils.py
 import os
 import logging
+import importlib.util
+from typing import TYPE_CHECKING
 
-# Excel 파일 읽기 라이브러리 임포트 시도
-try:
-    import pandas as pd
+# Excel 파일 읽기 라이브러리 확인
+# (pandas는 임포트에 수백 ms가 걸리므로 설치 여부만 확인하고, 실제 임포트는 처음 사용할 때 수행)
+HAS_PANDAS = importlib.util.find_spec("pandas") is not None
+HAS_OPENPYXL = importlib.util.find_spec("openpyxl") is not None
 
-    HAS_PANDAS = True
-except ImportError:
-    HAS_PANDAS = False
-    try:
-        import openpyxl
-
-        HAS_OPENPYXL = True
-    except ImportError:
-        HAS_OPENPYXL = False
+if TYPE_CHECKING:
+    from PIL import Image
+    from fastapi import UploadFile
 
 logger = logging.getLogger(__name__)
 
+# 이보다 작은 이미지(아이콘, 도형 등)는 증빙 사진으로 보지 않음
+MIN_IMAGE_SIZE = 15000
+
 
 def read_file_with_encoding(file_path: str) -> str:
     """파일을 읽어서 반환 (여러 인코딩 시도)"""
@@ -39,6 +39,8 @@ def read_file_with_encoding(file_path: str) -> str:
 def read_excel_file(file_path: str) -> str:
     """Excel 파일을 읽어서 텍스트로 반환"""
     if HAS_PANDAS:
+        import pandas as pd
+
         try:
             excel_file = pd.ExcelFile(file_path)
             content_parts = []
@@ -81,15 +83,8 @@ def read_excel_file(file_path: str) -> str:
 
 
 def load_system_prompt(file_path: str) -> str:
-    """시스템 프롬프트 파일을 읽고, UTF-8로 다시 저장 (원본 기능 유지)"""
-    content = read_file_with_encoding(file_path)  # FileNotFoundError 여기서 발생 가능
-    try:
-        # UTF-8로 다시 저장하여 다음번에는 UTF-8로 읽을 수 있도록 함
-        with open(file_path, "w", encoding="utf-8") as f_out:
-            f_out.write(content)
-    except Exception as e:
-        logger.warning(f"시스템 프롬프트를 UTF-8로 다시 저장하는 데 실패했습니다: {e}")
-    return content
+    """시스템 프롬프트 파일을 읽습니다. (인코딩은 자동 판별, 파일은 다시 쓰지 않음)"""
+    return read_file_with_encoding(file_path)  # FileNotFoundError 여기서 발생 가능
 
 
 def find_file_by_keywords(search_path: str, keywords: list[str]) -> str | None:
@@ -125,48 +120,134 @@ def get_file_content(file_path: str) -> str:
 
 import io
 import zipfile
-from PIL import Image
-from fastapi import UploadFile
+import posixpath
+import unicodedata
+import xml.etree.ElementTree as ET
 
+_NS_MAIN = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+_NS_REL = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+_NS_PKG_REL = "{http://schemas.openxmlformats.org/package/2006/relationships}"
 
-def extract_images_from_excel(file_bytes: bytes) -> list[Image.Image]:
-    """Excel 파일(ZIP 구조)에서 이미지를 추출합니다."""
-    images = []
-    MIN_IMAGE_SIZE = 15000  # 15KB 미만 무시
 
+def _read_rels(z: zipfile.ZipFile, part: str) -> dict[str, str]:
+    """파트(part)의 관계 파일을 읽어 {관계 ID: 대상 파트 경로}를 반환합니다."""
+    rels_path = posixpath.join(
+        posixpath.dirname(part), "_rels", posixpath.basename(part) + ".rels"
+    )
     try:
-        with zipfile.ZipFile(io.BytesIO(file_bytes)) as z:
-            media_files = [
-                f
-                for f in z.namelist()
-                if f.startswith("xl/media/") and not f.endswith("/")
-            ]
+        root = ET.fromstring(z.read(rels_path))
+    except (KeyError, ET.ParseError):
+        return {}
+    targets = {}
+    for rel in root.iter(f"{_NS_PKG_REL}Relationship"):
+        target = rel.get("Target", "")
+        if rel.get("TargetMode") == "External":
+            continue
+        if target.startswith("/"):
+            targets[rel.get("Id")] = target.lstrip("/")
+        else:
+            targets[rel.get("Id")] = posixpath.normpath(
+                posixpath.join(posixpath.dirname(part), target)
+            )
+    return targets
 
-            for file_name in media_files:
+
+def _media_sheet_map(z: zipfile.ZipFile) -> dict[str, str]:
+    """xl/media 항목 경로 → 이미지가 배치된 시트 이름 (시트 → 그리기 → 이미지 관계를 따라감)"""
+    try:
+        workbook = ET.fromstring(z.read("xl/workbook.xml"))
+    except (KeyError, ET.ParseError):
+        return {}
+    workbook_rels = _read_rels(z, "xl/workbook.xml")
+    media_sheets = {}
+    for sheet in workbook.iter(f"{_NS_MAIN}sheet"):
+        sheet_part = workbook_rels.get(sheet.get(f"{_NS_REL}id"))
+        if not sheet_part:
+            continue
+        for drawing_part in _read_rels(z, sheet_part).values():
+            if not drawing_part.startswith("xl/drawings/"):
+                continue
+            for media in _read_rels(z, drawing_part).values():
+                media_sheets.setdefault(media, sheet.get("name"))
+    return media_sheets
+
+
+def extract_image_entries_from_excel(file_bytes: bytes, source: str = "") -> list[dict]:
+    """
+    Excel 파일(ZIP 구조)에서 이미지 원본 바이트와 배치된 시트 이름을 추출합니다. (디코딩하지 않음)
+    반환값: [{"data": bytes, "name": 미디어 경로, "sheet": 시트 이름 또는 None, "source": source}]
+    """
+    entries = []
+    try:
+        with zipfile.ZipFile(io.BytesIO(file_bytes)) as z:
+            media_sheets = _media_sheet_map(z)
+            for info in z.infolist():
+                if not info.filename.startswith("xl/media/") or info.is_dir():
+                    continue
+                if info.file_size < MIN_IMAGE_SIZE:
+                    continue
                 try:
-                    img_data = z.read(file_name)
-                    if len(img_data) < MIN_IMAGE_SIZE:
-                        continue
-                    img = Image.open(io.BytesIO(img_data))
-                    images.append(img)
+                    data = z.read(info)
                 except Exception:
                     continue
-
-            return images
+                entries.append(
+                    {
+                        "data": data,
+                        "name": info.filename,
+                        "sheet": media_sheets.get(info.filename),
+                        "source": source,
+                    }
+                )
     except Exception:
         return []
+    return entries
 
 
-async def read_upload_file_content(file: UploadFile) -> str:
+def extract_images_from_excel(file_bytes: bytes) -> list["Image.Image"]:
+    """Excel 파일(ZIP 구조)에서 이미지를 추출합니다."""
+    from PIL import Image
+
+    images = []
+    for entry in extract_image_entries_from_excel(file_bytes):
+        try:
+            images.append(Image.open(io.BytesIO(entry["data"])))
+        except Exception:
+            continue
+    return images
+
+
+def count_images_in_excel(file_bytes: bytes) -> int:
+    """이미지를 디코딩하지 않고 Excel 내부 미디어 항목 크기만으로 사진 수를 셉니다. (추정용)"""
+    try:
+        with zipfile.ZipFile(io.BytesIO(file_bytes)) as z:
+            return sum(
+                1
+                for info in z.infolist()
+                if info.filename.startswith("xl/media/")
+                and not info.is_dir()
+                and info.file_size >= MIN_IMAGE_SIZE
+            )
+    except Exception:
+        return 0
+
+
+async def read_upload_file_content(file: "UploadFile") -> str:
     """FastAPI UploadFile 객체에서 텍스트 내용을 읽어옵니다."""
     await file.seek(0)
     content_bytes = await file.read()
-    filename_lower = file.filename.lower()
+    return extract_text_from_bytes(file.filename, content_bytes)
+
+
+def extract_text_from_bytes(filename: str, content_bytes: bytes) -> str:
+    """파일 바이트에서 텍스트 내용을 추출합니다. (동기 함수, 스레드에서 실행 권장)"""
+    filename_lower = filename.lower()
 
     if filename_lower.endswith(".xlsx"):
         file_stream = io.BytesIO(content_bytes)
         # pandas 의존성 확인
         if HAS_PANDAS:
+            import pandas as pd
+
             try:
                 excel_data = pd.read_excel(
                     file_stream, sheet_name=None, engine="openpyxl"
@@ -209,3 +290,73 @@ async def read_upload_file_content(file: UploadFile) -> str:
             return content_bytes.decode("cp949", errors="ignore")
     else:
         return content_bytes.decode("utf-8", errors="ignore")
+
+
+# --- ZIP 업로드 처리 ---
+
+SUPPORTED_UPLOAD_EXTENSIONS = (".xlsx", ".txt", ".csv")
+
+
+def is_analysis_candidate(basename: str) -> bool:
+    """분석 대상 파일명인지 확인합니다. (숨김/Office 임시 파일, 지원하지 않는 확장자 제외)"""
+    return not basename.startswith((".", "~$")) and basename.lower().endswith(
+        SUPPORTED_UPLOAD_EXTENSIONS
+    )
+
+
+def decode_zip_filename(info: zipfile.ZipInfo) -> str:
+    """
+    ZIP 항목 이름을 올바르게 디코딩합니다.
+    UTF-8 플래그(bit 11)가 없으면 zipfile이 cp437로 읽으므로, 원래 바이트로 되돌려
+    UTF-8 → CP949 순으로 다시 디코딩합니다. (Windows 기본 압축기는 CP949 사용)
+    """
+    name = info.filename
+    if not info.flag_bits & 0x800:
+        raw = name.encode("cp437", errors="replace")
+        try:
+            name = raw.decode("utf-8")
+        except UnicodeDecodeError:
+            name = raw.decode("cp949", errors="replace")
+    # macOS에서 만든 압축은 한글이 자모 분리(NFD) 형태이므로 NFC로 정규화
+    return unicodedata.normalize("NFC", name)
+
+
+def classify_upload_name(path: str) -> str | None:
+    """경로(파일명 우선, 없으면 폴더명)의 키워드로 계획서/보고서를 구분합니다."""
+    parts = path.replace("\\", "/").split("/")
+    for part in [parts[-1]] + list(reversed(parts[:-1])):
+        if "계획서" in part:
+            return "plan"
+        if "보고서" in part:
+            return "report"
+    return None
+
+
+def iter_zip_members(
+    zip_file: zipfile.ZipFile, max_total_bytes: int, max_entries: int
+):
+    """
+    분석 대상 ZIP 항목을 (디코딩된 경로, ZipInfo)로 하나씩 돌려줍니다.
+    폴더, macOS 메타데이터, 지원하지 않는 확장자는 건너뛰며,
+    압축 해제 크기/항목 수가 한도를 넘으면 ValueError를 발생시킵니다. (압축 폭탄 방지)
+    """
+    total_bytes = 0
+    count = 0
+    for info in zip_file.infolist():
+        if info.is_dir():
+            continue
+        path = decode_zip_filename(info)
+        if path.startswith("__MACOSX/") or not is_analysis_candidate(
+            os.path.basename(path)
+        ):
+            continue
+
+        count += 1
+        total_bytes += info.file_size
+        if count > max_entries:
+            raise ValueError(f"ZIP 항목 수가 한도({max_entries}개)를 초과했습니다.")
+        if total_bytes > max_total_bytes:
+            raise ValueError(
+                f"ZIP 압축 해제 크기가 한도({max_total_bytes // (1024 * 1024)}MB)를 초과했습니다."
+            )
+        yield path, info
@@ -0,0 +1,148 @@
+# gemini_proxy.py
+import asyncio
+import hashlib
+import logging
+import threading
+import time
+from typing import Optional
+
+from cachetools import TTLCache
+
+import app_config
+import metrics
+from gemini_service import (
+    GeminiService,
+    estimate_prompt_tokens,
+    estimate_text_tokens,
+    prompt_version,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class ProxyRateLimited(Exception):
+    """클라이언트별 프록시 호출 한도(PROXY_RPM_PER_CLIENT)를 넘음"""
+
+    def __init__(self, retry_after: float):
+        self.retry_after = retry_after
+        super().__init__(f"프록시 호출 한도를 넘었습니다. {retry_after:.0f}초 후 다시 시도해주세요.")
+
+
+class ClientRateLimiter:
+    """
+    클라이언트별 토큰 버킷 (분당 rpm개 적립, 최대 rpm개까지 연속 호출 가능)
+    1분 동안 호출이 없던 클라이언트의 버킷은 어차피 가득 차 있으므로 TTL 캐시에서 지워도 같음
+    """
+
+    def __init__(self, rpm: int, max_clients: int = 10000):
+        self.rpm = rpm
+        # 클라이언트 -> (남은 토큰, 마지막 갱신 시각)
+        self._buckets: TTLCache = TTLCache(maxsize=max_clients, ttl=60)
+        self._lock = threading.Lock()
+
+    def try_acquire(self, client: str) -> Optional[float]:
+        """토큰 하나를 쓰고 None을, 토큰이 없으면 다음 토큰까지 기다릴 시간(초)을 반환합니다."""
+        if self.rpm <= 0:
+            return None
+        now = time.monotonic()
+        rate = self.rpm / 60
+        with self._lock:
+            tokens, updated = self._buckets.get(client, (float(self.rpm), now))
+            tokens = min(float(self.rpm), tokens + (now - updated) * rate)
+            if tokens < 1.0:
+                self._buckets[client] = (tokens, now)
+                return (1.0 - tokens) / rate
+            self._buckets[client] = (tokens - 1.0, now)
+            return None
+
+
+class GeminiProxy:
+    """
+    브라우저(study-plan-page)의 Gemini 호출을 서버에서 대신 처리하는 프록시입니다.
+
+    - 같은 (시스템 프롬프트, 프롬프트) 응답은 TTL 캐시에서 바로 반환
+    - 같은 요청이 동시에 들어오면 모델은 한 번만 호출하고 응답을 함께 받음 (single-flight)
+    - 호출은 평가 파이프라인과 같은 GeminiService를 거치므로 클라이언트 재사용,
+      키 풀 속도 제한/일일 한도를 그대로 공유
+    - 인증 없이 열린 엔드포인트이므로 모델 호출(캐시 응답 제외)은 클라이언트별 rpm_per_client로 제한하고,
+      bulk 차례(캠퍼스 "study-plan-page")로 처리
+    - 시스템 프롬프트는 서버에 등록된 것만 받으므로(PROXY_PROMPT_PATHS) 컨텍스트 캐시도 그대로 사용
+    """
+
+    def __init__(
+        self,
+        gemini_service: GeminiService,
+        cache_ttl_seconds: int = app_config.PROXY_CACHE_TTL_SECONDS,
+        cache_max_entries: int = app_config.PROXY_CACHE_MAX_ENTRIES,
+        rpm_per_client: int = app_config.PROXY_RPM_PER_CLIENT,
+    ):
+        self.gemini_service = gemini_service
+        self.rate_limiter = ClientRateLimiter(rpm_per_client)
+        self._cache: TTLCache = TTLCache(maxsize=cache_max_entries, ttl=cache_ttl_seconds)
+        # TTLCache는 스레드 안전하지 않음 (/metrics 등 다른 스레드에서 읽을 수 있으므로 잠금)
+        self._cache_lock = threading.Lock()
+        # 호출 중인 요청: 캐시 키 -> 모델 호출 태스크
+        self._in_flight: dict[str, asyncio.Task] = {}
+
+    @staticmethod
+    def cache_key(system_prompt: str, prompt: str) -> str:
+        digest = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+        return f"{prompt_version(system_prompt)}:{digest}"
+
+    async def generate(self, system_prompt: str, prompt: str, client: str = "-") -> dict:
+        """
+        프롬프트 응답을 반환합니다. 반환값: {"text", "cached", "coalesced"}
+        새로 모델을 호출해야 하는데 client의 호출 한도를 넘었으면 ProxyRateLimited를 던집니다.
+        """
+        key = self.cache_key(system_prompt, prompt)
+        with self._cache_lock:
+            text = self._cache.get(key)
+        if text is not None:
+            metrics.PROXY_REQUESTS.inc(outcome="hit")
+            return {"text": text, "cached": True, "coalesced": False}
+
+        task = self._in_flight.get(key)
+        coalesced = task is not None
+        if task is None:
+            retry_after = self.rate_limiter.try_acquire(client)
+            if retry_after is not None:
+                metrics.PROXY_REQUESTS.inc(outcome="rate_limited")
+                raise ProxyRateLimited(retry_after)
+            task = asyncio.create_task(self._fetch(key, system_prompt, prompt))
+            self._in_flight[key] = task
+            task.add_done_callback(lambda t: self._in_flight.pop(key, None))
+            # 기다리던 클라이언트가 모두 끊겨도 "예외를 가져가지 않음" 경고가 나지 않도록 소비
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        metrics.PROXY_REQUESTS.inc(outcome="coalesced" if coalesced else "miss")
+
+        # 요청한 클라이언트가 연결을 끊어도 같은 요청을 기다리는 다른 클라이언트를 위해 호출은 계속 진행
+        text = await asyncio.shield(task)
+        return {"text": text, "cached": False, "coalesced": coalesced}
+
+    async def _fetch(self, key: str, system_prompt: str, prompt: str) -> str:
+        try:
+            text = await self.gemini_service.process_with_rate_limit(
+                f"proxy-{key[-8:]}",
+                self.gemini_service.call_gemini_api_async,
+                system_prompt,
+                [prompt],
+                estimated_tokens=estimate_text_tokens(prompt)
+                + estimate_prompt_tokens(system_prompt),
+                # 인증 없는 호출이 평가 작업을 앞지르지 않도록 bulk 차례
+                # (별도 캠퍼스로 공정 분배, 비중은 SCHEDULER_CAMPUS_WEIGHTS의 study-plan-page로 조정)
+                priority="bulk",
+                campus="study-plan-page",
+                uploader="proxy",
+            )
+        except Exception:
+            metrics.PROXY_REQUESTS.inc(outcome="error")
+            raise
+        # 실패한 응답은 캐시하지 않음
+        with self._cache_lock:
+            self._cache[key] = text
+        return text
+
+    def stats(self) -> dict:
+        with self._cache_lock:
+            cached_entries = len(self._cache)
+        return {"cached_entries": cached_entries, "in_flight": len(self._in_flight)}
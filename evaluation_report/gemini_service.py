@@ -1,64 +1,813 @@
+import sys
 import logging
 import asyncio
-from typing import List, Union
-from PIL import Image
-from google import genai
-from google.genai import types
+import contextvars
+import time
+import hashlib
+import datetime
+import functools
+import threading
+from typing import TYPE_CHECKING, Callable, List, Optional, Union
+from zoneinfo import ZoneInfo
 import app_config
+import db_utils
+import metrics
+from tracing import tracer
+from key_pool import DeadlineExceeded, KeyPool, KeySlot, current_slot, is_failover_error
+from scheduler import FairScheduler, parse_weights
+from circuit_breaker import CircuitBreaker
+from hedging import HedgePolicy
+from stream_json import StreamParseError
+
+# google-genai/PIL은 임포트 비용이 커서(1초 가까이) 실제로 사용하는 함수 안에서 임포트함
+if TYPE_CHECKING:
+    from PIL import Image
 
 logger = logging.getLogger(__name__)
 
+# Gemini는 이미지 한 장을 고정 토큰(258)으로 계산
+IMAGE_TOKEN_COST = 258
+
+
+def estimate_text_tokens(text: str) -> int:
+    """토크나이저 호출 없이 텍스트 토큰 수를 대략 추정합니다. (ASCII 4자, 그 외 1.5자당 1토큰)"""
+    ascii_chars = sum(1 for ch in text if ord(ch) < 128)
+    return int(ascii_chars / 4 + (len(text) - ascii_chars) / 1.5) + 1
+
+
+@functools.lru_cache(maxsize=8)
+def estimate_prompt_tokens(system_prompt: str) -> int:
+    """시스템 프롬프트 토큰 수 (같은 프롬프트는 한 번만 계산)"""
+    return estimate_text_tokens(system_prompt)
+
+
+def is_image(item) -> bool:
+    """PIL 이미지인지 확인합니다. (PIL이 아직 임포트되지 않았다면 이미지일 수 없음)"""
+    pil_image = sys.modules.get("PIL.Image")
+    return pil_image is not None and isinstance(item, pil_image.Image)
+
+
+def estimate_contents_tokens(contents) -> int:
+    """텍스트/이미지가 섞인 contents의 입력 토큰 수를 추정합니다."""
+    if isinstance(contents, str):
+        return estimate_text_tokens(contents)
+    return sum(
+        IMAGE_TOKEN_COST if is_image(item) else estimate_text_tokens(str(item))
+        for item in contents
+    )
+
+
+def quota_day(now: Optional[float] = None) -> str:
+    """일일 요청 한도 집계 기준 날짜 (한도 초기화 시간대 기준)"""
+    tz = ZoneInfo(app_config.QUOTA_RESET_TIMEZONE)
+    return datetime.datetime.fromtimestamp(now or time.time(), tz).date().isoformat()
+
+
+def next_quota_reset(now: Optional[float] = None) -> float:
+    """다음 일일 한도 초기화 시각 (epoch 초)"""
+    tz = ZoneInfo(app_config.QUOTA_RESET_TIMEZONE)
+    today = datetime.datetime.fromtimestamp(now or time.time(), tz).date()
+    midnight = datetime.datetime.combine(
+        today + datetime.timedelta(days=1), datetime.time(0), tzinfo=tz
+    )
+    return midnight.timestamp()
+
+
+def format_local_time(timestamp: float) -> str:
+    """epoch 초를 서버 시간대의 ISO 8601 문자열로 변환합니다."""
+    return (
+        datetime.datetime.fromtimestamp(timestamp).astimezone().isoformat(timespec="seconds")
+    )
+
+
+def is_daily_quota_error(error: Exception) -> bool:
+    """일일 요청 한도 소진으로 인한 429인지 판단합니다. (할당량 ID에 PerDay 포함)"""
+    return getattr(error, "code", None) == 429 and "PerDay" in str(error)
+
+
+class DailyQuotaExhausted(Exception):
+    """모든 키/모델 슬롯의 일일 요청 한도가 소진되어 한도 초기화 이후로 미뤄야 함"""
+
+    def __init__(self, reset_at: float):
+        self.reset_at = reset_at
+        super().__init__(
+            f"일일 요청 한도가 소진되어 {format_local_time(reset_at)} 이후로 미뤘습니다."
+        )
+
+
+class CallAbandoned(Exception):
+    """호출한 쪽이 취소하여 스트리밍 응답을 더 받지 않고 연결을 닫음 (헤지에서 진 호출 등)"""
+
+
+# 취소된 호출의 실제 결과를 받을 곳: call_gemini_api_async가 모델 호출이 끝나면 {"error": 예외 또는 None}을 기록
+# (취소된 태스크는 CancelledError로 끝나므로, 헤지에서 버린 원래 호출의 결과를 회로/지연 표본에 반영하는 데 사용)
+call_outcome: contextvars.ContextVar[Optional[dict]] = contextvars.ContextVar(
+    "call_outcome", default=None
+)
+
+
+def prompt_version(system_prompt: str) -> str:
+    """시스템 프롬프트 내용으로 버전 식별자(해시 앞 12자리)를 만듭니다."""
+    return hashlib.sha256(system_prompt.encode("utf-8")).hexdigest()[:12]
+
 
 class GeminiService:
-    def __init__(self):
-        self.api_semaphore = asyncio.Semaphore(1)
-        self.sleep_time = 6
+    def __init__(self, key_pool: Optional[KeyPool] = None):
+        # API 키/모델별 속도 제한 슬롯 풀 (키 하나 + 모델 하나면 기존 단일 키 동작과 같음)
+        self.key_pool = key_pool or KeyPool.from_config()
+        # 키 풀에 동시에 들어가는 호출 수를 제한하고 우선순위/공정 분배로 다음 호출을 고름
+        self.scheduler = FairScheduler(
+            self.key_pool.capacity, parse_weights(app_config.SCHEDULER_CAMPUS_WEIGHTS)
+        )
+        # 모델 API 장애가 이어지면 대기열을 멈추거나 바로 실패시키고, 복구를 확인한 뒤 재개
+        self.breaker = CircuitBreaker.from_config()
+        # 느린 호출을 다른 슬롯으로 한 번 더 보내는 헤지 정책 (HEDGE_ENABLED=false면 None)
+        self.hedge_policy = HedgePolicy.from_config()
+        # 헤지 후 버린 원래 호출이 실제로 끝나면 슬롯을 반납하는 태스크 (참조 유지)
+        self._settling: set[asyncio.Task] = set()
+        # 스트리밍 응답 사용 여부 (조각 단위 점진적 파싱)
+        self.streaming_enabled = app_config.STREAMING_ENABLED
+        # ETA 추정용: 대기/진행 중인 호출 수와 호출 소요 시간의 지수 이동 평균
+        self.pending_calls = 0
+        self.avg_call_seconds = 10.0
+        # 일일 요청 한도를 소진한 슬롯 이름 -> 한도 초기화 시각 (epoch 초)
+        self._quota_exhausted: dict[str, float] = {}
+
+        # 클라이언트는 API 키별로 한 번만 만들어 재사용 (호출마다 생성하지 않음)
+        self._clients: dict[Optional[str], object] = {}
+        self._client_lock = threading.Lock()
+
+        # 시스템 프롬프트 컨텍스트 캐시: (슬롯, 프롬프트 버전) -> {"name", "expires_at"}
+        self.context_cache_enabled = app_config.CONTEXT_CACHE_ENABLED
+        self.cache_ttl_seconds = app_config.CONTEXT_CACHE_TTL_SECONDS
+        self.cache_refresh_margin_seconds = min(300, self.cache_ttl_seconds // 4)
+        self._prompt_caches: dict[tuple[str, str], dict] = {}
+        self._cache_lock = threading.Lock()
+        # 캐시 생성이 실패한 (슬롯, 프롬프트 버전)은 잠시 캐시 없이 호출
+        self._cache_retry_after: dict[tuple[str, str], float] = {}
+        # 연장/생성 API를 호출 중인 (슬롯, 프롬프트 버전) (같은 캐시를 여러 호출이 동시에 만들지 않도록)
+        self._cache_in_progress: set[tuple[str, str]] = set()
+
+        # 토큰 사용량 집계 (캐시 절감량 확인용)
+        self._usage_lock = threading.Lock()
+        self.usage_stats = {
+            "calls": 0,
+            "prompt_tokens": 0,
+            "cached_tokens": 0,
+            "output_tokens": 0,
+            "cache_creates": 0,
+            "cache_refreshes": 0,
+            "cache_misses": 0,
+        }
+
+    def get_client(self, api_key: Optional[str] = None):
+        """설정된 백엔드(google/local)의 API 키별 클라이언트를 지연 생성하여 반환합니다."""
+        if api_key is None:
+            api_key = self.key_pool.default_slot.api_key
+        with self._client_lock:
+            if api_key not in self._clients:
+                if app_config.GEMINI_BACKEND == "local":
+                    from local_genai import LocalGenAIClient
+
+                    self._clients[api_key] = LocalGenAIClient(
+                        app_config.LOCAL_GENAI_LATENCY
+                    )
+                else:
+                    from google import genai
+
+                    self._clients[api_key] = genai.Client(api_key=api_key)
+            return self._clients[api_key]
 
     def call_gemini_api(
-        self, system_prompt: str, contents: List[Union[str, Image.Image]]
+        self,
+        system_prompt: str,
+        contents: List[Union[str, "Image.Image"]],
+        on_chunk: Optional[Callable[[str], None]] = None,
     ) -> str:
-        """Google GenAI API를 호출합니다."""
+        """
+        Google GenAI API를 호출합니다. (가능하면 시스템 프롬프트 캐시 사용)
+        스트리밍이 켜져 있고 on_chunk가 있으면 응답 조각이 도착할 때마다 on_chunk(조각)를 호출합니다.
+        """
+        from google.genai import errors, types
+
         if system_prompt == "ERROR: PROMPT NOT LOADED":
             raise ValueError("시스템 프롬프트가 올바르게 로드되지 않았습니다.")
 
-        img_count = sum(1 for i in contents if isinstance(i, Image.Image))
+        img_count = sum(1 for i in contents if is_image(i))
         logger.info(f"Google AI API 호출 중... (텍스트 + 이미지 {img_count}장)")
 
+        # process_with_rate_limit가 배정한 슬롯(키/모델)을 사용, 래퍼 밖 호출이면 기본 슬롯
+        slot = current_slot.get() or self.key_pool.default_slot
+        client = self.get_client(slot.api_key)
+        model = slot.model
+        cache_name = self._get_prompt_cache(client, slot, system_prompt)
         try:
-            client = genai.Client(api_key=app_config.API_KEY)
-            response = client.models.generate_content(
-                model=app_config.API_MODEL,
-                config=types.GenerateContentConfig(system_instruction=system_prompt),
-                contents=contents,
+            if cache_name:
+                try:
+                    return self._generate(
+                        client,
+                        model,
+                        types.GenerateContentConfig(cached_content=cache_name),
+                        contents,
+                        on_chunk,
+                    )
+                except errors.ClientError as e:
+                    if e.code not in (403, 404):
+                        raise
+                    # 캐시가 만료/삭제된 경우: 캐시를 버리고 시스템 프롬프트를 직접 보내 재시도
+                    logger.warning(f"컨텍스트 캐시 미스({cache_name}), 캐시 없이 재시도: {e}")
+                    self._invalidate_prompt_cache(slot, system_prompt, cache_name)
+                    self._record_usage(None, cache_miss=True)
+            return self._generate(
+                client,
+                model,
+                types.GenerateContentConfig(system_instruction=system_prompt),
+                contents,
+                on_chunk,
             )
-            return response.text
+        except CallAbandoned:
+            raise
         except Exception as e:
             logger.error(f"API 호출 실패: {e}")
             raise
 
+    def _generate(self, client, model: str, config, contents, on_chunk) -> str:
+        """
+        모델을 한 번 호출하고 응답 텍스트를 반환합니다. (토큰 사용량과 첫 응답까지의 시간 기록)
+        스트리밍 호출에서 on_chunk가 StreamParseError를 던지면 점진적 파싱만 멈추고 나머지 응답을 받아
+        전체 텍스트를 반환합니다. (일반 호출과 같이 응답 전체로 파싱, 다른 예외는 연결을 닫고 전파)
+        """
+        started = time.monotonic()
+        if not (self.streaming_enabled and on_chunk):
+            response = client.models.generate_content(
+                model=model, config=config, contents=contents
+            )
+            metrics.MODEL_FIRST_BYTE.observe(time.monotonic() - started, model=model, mode="unary")
+            self._record_usage(response.usage_metadata)
+            return response.text
+
+        parts, usage_metadata = [], None
+        stream = client.models.generate_content_stream(
+            model=model, config=config, contents=contents
+        )
+        try:
+            for chunk in stream:
+                # 사용량은 마지막 조각에 누적값으로 들어옴
+                if chunk.usage_metadata is not None:
+                    usage_metadata = chunk.usage_metadata
+                text = chunk.text
+                if not text:
+                    continue
+                if not parts:
+                    metrics.MODEL_FIRST_BYTE.observe(
+                        time.monotonic() - started, model=model, mode="stream"
+                    )
+                parts.append(text)
+                if on_chunk is None:
+                    continue
+                try:
+                    on_chunk(text)
+                except StreamParseError as e:
+                    metrics.STREAM_ABORTS.inc(model=model)
+                    logger.warning(
+                        f"스트리밍 응답을 점진적으로 파싱할 수 없어 전체 응답으로 처리 "
+                        f"({sum(map(len, parts))}자 수신): {e}"
+                    )
+                    on_chunk = None
+        finally:
+            stream.close()
+        self._record_usage(usage_metadata)
+        return "".join(parts)
+
+    def _get_prompt_cache(
+        self, client, slot: KeySlot, system_prompt: str
+    ) -> Optional[str]:
+        """
+        (슬롯, 프롬프트 버전)에 대한 캐시 이름을 반환합니다. (캐시는 키/모델별로 따로 존재)
+        만료가 가까우면 TTL을 연장하고, 없거나 연장에 실패하면 새로 만듭니다.
+        캐시를 쓸 수 없으면 None을 반환하여 시스템 프롬프트를 직접 보내도록 합니다.
+        """
+        if not self.context_cache_enabled:
+            return None
+
+        model = slot.model
+        cache_key = (slot.name, prompt_version(system_prompt))
+        # 잠금은 항목 확인/선점에만 쓰고, 캐시 API 호출(네트워크)은 잠금 밖에서 수행
+        # (느린 캐시 API 때문에 다른 슬롯/프롬프트의 모델 호출이 줄줄이 막히지 않도록)
+        with self._cache_lock:
+            now = time.time()
+            if self._cache_retry_after.get(cache_key, 0) > now:
+                return None
+            entry = self._prompt_caches.get(cache_key)
+            if entry and entry["expires_at"] - now > self.cache_refresh_margin_seconds:
+                return entry["name"]
+            if cache_key in self._cache_in_progress:
+                # 다른 호출이 연장/생성 중: 아직 유효한 캐시가 있으면 쓰고, 없으면 기다리지 않고 캐시 없이 호출
+                return entry["name"] if entry and entry["expires_at"] > now else None
+            self._cache_in_progress.add(cache_key)
+
+        try:
+            return self._refresh_prompt_cache(client, model, cache_key, entry, system_prompt)
+        finally:
+            with self._cache_lock:
+                self._cache_in_progress.discard(cache_key)
+
+    def _refresh_prompt_cache(
+        self, client, model: str, cache_key: tuple, entry: Optional[dict], system_prompt: str
+    ) -> Optional[str]:
+        """캐시 TTL을 연장하거나 새로 만듭니다. (_get_prompt_cache가 cache_key를 선점한 상태에서 호출)"""
+        from google.genai import types
+
+        now = time.time()
+        ttl = f"{self.cache_ttl_seconds}s"
+        if entry:
+            try:
+                cached = client.caches.update(
+                    name=entry["name"], config=types.UpdateCachedContentConfig(ttl=ttl)
+                )
+                with self._cache_lock:
+                    entry["expires_at"] = _expires_at(cached, now, self.cache_ttl_seconds)
+                self._record_usage(None, cache_refresh=True)
+                logger.info(f"컨텍스트 캐시 TTL 연장: {entry['name']}")
+                return entry["name"]
+            except Exception as e:
+                logger.warning(f"컨텍스트 캐시 연장 실패, 새로 생성합니다: {e}")
+                with self._cache_lock:
+                    if self._prompt_caches.get(cache_key) is entry:
+                        del self._prompt_caches[cache_key]
+
+        try:
+            cached = client.caches.create(
+                model=model,
+                config=types.CreateCachedContentConfig(
+                    system_instruction=system_prompt,
+                    display_name=f"evaluation-prompt-{cache_key[1]}",
+                    ttl=ttl,
+                ),
+            )
+        except Exception as e:
+            # 최소 토큰 수 미달, 권한 문제 등: 10분 동안은 캐시 없이 호출
+            logger.warning(f"컨텍스트 캐시 생성 실패, 캐시 없이 호출합니다: {e}")
+            with self._cache_lock:
+                self._cache_retry_after[cache_key] = now + 600
+            return None
+
+        with self._cache_lock:
+            self._prompt_caches[cache_key] = {
+                "name": cached.name,
+                "expires_at": _expires_at(cached, now, self.cache_ttl_seconds),
+            }
+        self._record_usage(None, cache_create=True)
+        logger.info(f"컨텍스트 캐시 생성: {cached.name} (프롬프트 버전 {cache_key[1]})")
+        return cached.name
+
+    def _invalidate_prompt_cache(self, slot: KeySlot, system_prompt: str, name: str):
+        with self._cache_lock:
+            cache_key = (slot.name, prompt_version(system_prompt))
+            entry = self._prompt_caches.get(cache_key)
+            if entry and entry["name"] == name:
+                del self._prompt_caches[cache_key]
+
+    def _record_usage(
+        self,
+        usage_metadata,
+        cache_create: bool = False,
+        cache_refresh: bool = False,
+        cache_miss: bool = False,
+    ):
+        with self._usage_lock:
+            stats = self.usage_stats
+            stats["cache_creates"] += int(cache_create)
+            stats["cache_refreshes"] += int(cache_refresh)
+            stats["cache_misses"] += int(cache_miss)
+            if usage_metadata is None:
+                return
+            stats["calls"] += 1
+            stats["prompt_tokens"] += usage_metadata.prompt_token_count or 0
+            stats["cached_tokens"] += usage_metadata.cached_content_token_count or 0
+            stats["output_tokens"] += usage_metadata.candidates_token_count or 0
+
+    def get_usage_stats(self) -> dict:
+        """토큰 사용량과 컨텍스트 캐시로 절감된 입력 토큰 비율을 반환합니다."""
+        with self._usage_lock:
+            stats = dict(self.usage_stats)
+        prompt_tokens = stats["prompt_tokens"]
+        stats["cached_token_ratio"] = (
+            round(stats["cached_tokens"] / prompt_tokens, 4) if prompt_tokens else 0.0
+        )
+        return stats
+
     async def call_gemini_api_async(
-        self, system_prompt: str, contents: List[Union[str, Image.Image]]
+        self,
+        system_prompt: str,
+        contents: List[Union[str, "Image.Image"]],
+        on_chunk: Optional[Callable[[str], None]] = None,
     ) -> str:
-        """비동기 래퍼"""
-        return await asyncio.to_thread(self.call_gemini_api, system_prompt, contents)
+        """
+        비동기 래퍼 (on_chunk는 호출 스레드에서 실행됨)
+        취소되면 스트리밍 응답은 다음 조각에서 연결을 닫고 on_chunk도 더 부르지 않습니다.
+        동기 SDK 호출은 중간에 멈출 수 없으므로, 스레드가 끝날 때까지 기다린 뒤 취소를 전파합니다.
+        (요청이 나가 있는 동안 호출한 쪽이 슬롯을 먼저 반납하지 않도록)
+        """
+        abandoned = threading.Event()
+        outcome = call_outcome.get()
+
+        def gated_chunk(text: str):
+            if abandoned.is_set():
+                raise CallAbandoned("취소된 호출의 스트리밍 응답을 중단합니다.")
+            on_chunk(text)
+
+        future = asyncio.ensure_future(
+            asyncio.to_thread(
+                self.call_gemini_api,
+                system_prompt,
+                contents,
+                gated_chunk if on_chunk else None,
+            )
+        )
+        if outcome is not None:
+
+            def record_outcome(f: asyncio.Future):
+                error = None if f.cancelled() else f.exception()
+                # 끝까지 받지 않고 끊은 스트리밍 응답은 결과를 알 수 없으므로 기록하지 않음
+                if not isinstance(error, CallAbandoned):
+                    outcome["error"] = error
+
+            future.add_done_callback(record_outcome)
+        try:
+            return await asyncio.shield(future)
+        except asyncio.CancelledError:
+            abandoned.set()
+            while not future.done():
+                try:
+                    await asyncio.wait({future})
+                except asyncio.CancelledError:
+                    continue
+            if not future.cancelled():
+                # 취소된 호출의 결과/오류는 쓰지 않음
+                future.exception()
+            raise
 
-    async def process_with_rate_limit(self, key: str, func, *args, **kwargs):
+    def estimate_wait_seconds(self, position: int | None = None) -> float:
+        """앞선 호출 수(position)를 기준으로 예상 대기 시간(초)을 계산합니다."""
+        if position is None:
+            position = self.pending_calls
+        return self.key_pool.estimate_wait_seconds(position, self.avg_call_seconds)
+
+    async def estimate_requests(
+        self, request_tokens: list[int], pair_count: int, system_prompt: str
+    ) -> dict:
         """
-        세마포어를 사용하여 API 호출 빈도를 제어하는 래퍼 메서드입니다.
-        작업 완료 후 대기하여 분당 요청 횟수(RPM) 제한을 준수합니다.
+        요청별 입력 토큰 목록으로 토큰, 비용, 모델 호출 소요 시간을 추정합니다. (API 호출 없음)
+        소요 시간은 현재 키 풀 설정(RPM/TPM/동시 호출 수), 최근 호출 지연 시간, 앞서 대기 중인
+        호출 수로 계산하고, 오늘 남은 일일 한도를 넘으면 한도 초기화 이후 완료 시각을 돌려줍니다.
         """
-        async with self.api_semaphore:
-            try:
-                logger.info(f"[{key}] 속도 제한 래퍼 진입. 처리 시작...")
-                result = await func(*args, **kwargs)
+        requests = len(request_tokens)
+        content_tokens = sum(request_tokens)
+        prompt_tokens = estimate_prompt_tokens(system_prompt) * requests
+        # 컨텍스트 캐시를 쓰면 시스템 프롬프트는 캐시 단가로 과금됨
+        cached_tokens = prompt_tokens if self.context_cache_enabled else 0
+        input_tokens = content_tokens + prompt_tokens - cached_tokens
+        # 응답 토큰은 최근 호출 평균 (기록이 없으면 설정값)
+        with self._usage_lock:
+            calls, output = self.usage_stats["calls"], self.usage_stats["output_tokens"]
+        output_per_pair = output / calls if calls else app_config.ESTIMATE_OUTPUT_TOKENS_PER_PAIR
+        output_tokens = int(output_per_pair * pair_count)
+        cost = (
+            input_tokens * app_config.GEMINI_INPUT_PRICE_PER_MTOK
+            + cached_tokens * app_config.GEMINI_CACHED_INPUT_PRICE_PER_MTOK
+            + output_tokens * app_config.GEMINI_OUTPUT_PRICE_PER_MTOK
+        ) / 1_000_000
+
+        model_seconds = self.estimate_wait_seconds(self.pending_calls + requests)
+        primaries = [slot for slot in self.key_pool.slots if not slot.is_fallback]
+        if all(slot.tpm for slot in primaries):
+            # TPM 한도가 더 빡빡하면 토큰 처리 속도가 소요 시간을 결정
+            tpm_total = sum(slot.tpm for slot in primaries)
+            model_seconds = max(model_seconds, (content_tokens + prompt_tokens) / tpm_total * 60)
 
-                # API 호출 후 강제 대기 (Gemini Free Tier: 약 10 RPM)
-                logger.info(
-                    f"[{key}] API 호출 완료. Rate Limit 준수를 위해 {self.sleep_time}초 대기..."
+        remaining = await self.refresh_daily_quota()
+        over_quota = max(0, requests - remaining) if remaining is not None else 0
+        expected_completion_at = None
+        if over_quota:
+            per_day = self.daily_quota_per_day()
+            day, position = divmod(over_quota - 1, per_day) if per_day else (0, over_quota - 1)
+            expected_completion_at = format_local_time(
+                next_quota_reset() + day * 86400 + self.estimate_wait_seconds(position + 1)
+            )
+        return {
+            "requests": requests,
+            "input_tokens": input_tokens,
+            "cached_input_tokens": cached_tokens,
+            "output_tokens": output_tokens,
+            "estimated_cost_usd": round(cost, 4),
+            "model_seconds": model_seconds,
+            "avg_call_seconds": round(self.avg_call_seconds, 2),
+            "queued_calls_ahead": self.pending_calls,
+            "daily_quota_remaining": remaining,
+            "requests_over_daily_quota": over_quota,
+            "expected_completion_at": expected_completion_at,
+        }
+
+    def daily_quota_per_day(self) -> Optional[int]:
+        """모든 슬롯의 하루 요청 한도 합계 (한도 없는 슬롯이 있으면 None)"""
+        if any(not slot.rpd for slot in self.key_pool.slots):
+            return None
+        return sum(slot.rpd for slot in self.key_pool.slots)
+
+    async def refresh_daily_quota(self) -> Optional[int]:
+        """
+        DB에 집계된 오늘 사용량으로 한도를 소진한 슬롯을 쉬게 하고, 오늘 남은 요청 수를 반환합니다.
+        (다른 워커 프로세스의 사용량도 반영, 한도 없는 슬롯이 남아 있으면 None)
+        """
+        now = time.time()
+        reset_at = next_quota_reset(now)
+        usage = await asyncio.to_thread(db_utils.get_daily_quota_usage, quota_day(now))
+        remaining, unlimited = 0, False
+        for slot in self.key_pool.slots:
+            slot_usage = usage.get(slot.shared_id, {"used": 0, "exhausted": False})
+            if slot_usage["exhausted"] or (slot.rpd and slot_usage["used"] >= slot.rpd):
+                await self._exhaust_slot(slot, reset_at)
+            elif not slot.rpd:
+                unlimited = True
+            else:
+                remaining += slot.rpd - slot_usage["used"]
+        return None if unlimited else remaining
+
+    def check_daily_quota(self):
+        """모든 슬롯의 일일 한도가 소진되었으면 DailyQuotaExhausted를 던집니다."""
+        resets = [self._quota_exhausted.get(slot.name, 0.0) for slot in self.key_pool.slots]
+        if min(resets) > time.time():
+            raise DailyQuotaExhausted(min(resets))
+
+    async def _exhaust_slot(self, slot: KeySlot, reset_at: float):
+        if self._quota_exhausted.get(slot.name, 0.0) >= reset_at:
+            return
+        self._quota_exhausted[slot.name] = reset_at
+        logger.warning(
+            f"[{slot.name}] 일일 요청 한도 소진, {format_local_time(reset_at)}까지 사용하지 않습니다."
+        )
+        await self.key_pool.suspend(slot, reset_at)
+
+    async def _record_daily_usage(self, slot: KeySlot, error: Optional[Exception] = None):
+        """호출 한 번을 일일 사용량에 반영합니다. (한도가 없는 슬롯은 429 PerDay만 기록)"""
+        if error is not None and is_daily_quota_error(error):
+            await asyncio.to_thread(
+                db_utils.mark_daily_quota_exhausted, quota_day(), slot.shared_id
+            )
+            await self._exhaust_slot(slot, next_quota_reset())
+            return
+        if not slot.rpd:
+            return
+        used = await asyncio.to_thread(
+            db_utils.add_daily_quota_usage, quota_day(), slot.shared_id
+        )
+        if used >= slot.rpd:
+            await self._exhaust_slot(slot, next_quota_reset())
+
+    async def process_with_rate_limit(
+        self,
+        key: str,
+        func,
+        *args,
+        estimated_tokens: int = 0,
+        priority: str = "normal",
+        campus: str = "-",
+        uploader: str = "-",
+        deadline: Optional[float] = None,
+        **kwargs,
+    ):
+        """
+        키 풀에서 여유가 가장 많은 슬롯을 배정받아 API 호출 빈도를 제어하는 래퍼 메서드입니다.
+        슬롯별 RPM 간격(과 TPM 한도)을 지키며, 429/5xx 오류는 다른 키/모델 슬롯으로 넘겨 재시도합니다.
+        모든 슬롯의 일일 한도가 소진되면 DailyQuotaExhausted를 던집니다. (쌍은 실패가 아니라 미뤄짐)
+        키 풀에 들어가기 전에 스케줄러에서 priority(interactive/normal/bulk)와 캠퍼스/업로더 공정 분배에 따라 차례를 기다립니다.
+        deadline(time.monotonic 기준)이 지나도록 호출을 시작하지 못하면 DeadlineExceeded를 던집니다.
+        (차례/회로 복구/속도 제한 대기에만 적용, 이미 시작한 호출은 끝까지 기다림)
+        """
+        self.pending_calls += 1
+        try:
+            async with self.scheduler.slot(priority, campus, uploader, deadline):
+                return await self._call_with_failover(
+                    key, func, args, kwargs, estimated_tokens, deadline
                 )
-                await asyncio.sleep(self.sleep_time)
+        except (DailyQuotaExhausted, DeadlineExceeded):
+            raise
+        except Exception as e:
+            logger.error(f"[{key}] 처리 중 예외 발생: {e}")
+            raise e
+        finally:
+            self.pending_calls -= 1
 
-                return result
+    async def _call_with_failover(
+        self,
+        key: str,
+        func,
+        args: tuple,
+        kwargs: dict,
+        estimated_tokens: int,
+        deadline: Optional[float] = None,
+    ):
+        attempt = 0
+        while True:
+            # 회로가 열려 있으면 재시도 대기 없이 바로 실패하거나, 복구될 때까지 기다림
+            probe = await self.breaker.before_call(deadline)
+            try:
+                slot = await self.key_pool.acquire(
+                    estimated_tokens, self.check_daily_quota, deadline
+                )
+            except BaseException:
+                if probe:
+                    await self.breaker.cancel_probe()
+                raise
+            token = current_slot.set(slot)
+            logger.info(f"[{key}] 속도 제한 래퍼 진입 ({slot.name}). 처리 시작...")
+            started = time.monotonic()
+            # 헤지 후 끝나지 않은 원래 호출을 두고 돌아오면 그 슬롯 반납은 _settle_abandoned가 맡음
+            handoff: list[asyncio.Task] = []
+            try:
+                with tracer.span("model_call", key=key, slot=slot.name, attempt=attempt):
+                    if probe or self.hedge_policy is None:
+                        result = await func(*args, **kwargs)
+                    else:
+                        result = await self._call_hedged(
+                            key, func, args, kwargs, slot, estimated_tokens, started, handoff
+                        )
             except Exception as e:
-                logger.error(f"[{key}] 처리 중 예외 발생: {e}")
-                raise e
+                elapsed = time.monotonic() - started
+                if not handoff:
+                    await self.key_pool.release(slot, elapsed, e)
+                    await self._record_daily_usage(slot, e)
+                await self.breaker.record(e, probe)
+                metrics.MODEL_LATENCY.observe(
+                    elapsed, model=slot.model, outcome=metrics.error_type(e)
+                )
+                metrics.ERRORS_TOTAL.inc(stage="model_call", type=metrics.error_type(e))
+                attempt += 1
+                if is_daily_quota_error(e):
+                    self.check_daily_quota()
+                if is_failover_error(e) and attempt < self.key_pool.max_attempts:
+                    logger.warning(f"[{key}] {slot.name} 호출 실패({e}), 다른 슬롯으로 재시도...")
+                    continue
+                raise
+            except BaseException:
+                # 취소 등: 요청은 이미 나갔으므로 사용량에 포함하고 슬롯을 반납한 뒤 그대로 전파
+                if not handoff:
+                    await self.key_pool.release(slot, time.monotonic() - started)
+                    await self._record_daily_usage(slot)
+                if probe:
+                    await self.breaker.cancel_probe()
+                raise
+            finally:
+                current_slot.reset(token)
+
+            elapsed = time.monotonic() - started
+            if not handoff:
+                await self.key_pool.release(slot, elapsed)
+                await self.breaker.record(probe=probe)
+                await self._record_daily_usage(slot)
+                metrics.MODEL_LATENCY.observe(elapsed, model=slot.model, outcome="success")
+            # 헤지가 이긴 경우 elapsed는 헤지로 줄어든 시간이므로, 원래 호출의 실제 지연은 _settle_abandoned에서 기록
+            if self.hedge_policy and not handoff:
+                self.hedge_policy.record(estimated_tokens, elapsed)
+            self.avg_call_seconds = 0.8 * self.avg_call_seconds + 0.2 * elapsed
+            logger.info(f"[{key}] API 호출 완료 ({slot.name}, {elapsed:.1f}초)")
+            return result
+
+    async def _call_hedged(
+        self,
+        key: str,
+        func,
+        args: tuple,
+        kwargs: dict,
+        slot: KeySlot,
+        estimated_tokens: int,
+        started: float,
+        handoff: list,
+    ):
+        """
+        원래 호출이 헤지 기준 시간(hedge_policy)을 넘기면 바로 쓸 수 있는 다른 슬롯으로 같은 호출을 하나 더 보내고
+        먼저 성공한 결과를 반환합니다. 남은 호출은 취소하며(스트리밍은 다음 조각에서 연결을 닫음),
+        둘 다 실패하면 원래 호출의 오류를 던집니다.
+        슬롯은 각 호출이 실제로 끝난 뒤 반납합니다. 헤지 호출은 _hedge_call에서, 끝나지 않은 원래 호출은
+        handoff에 넣고 _settle_abandoned에서 반납합니다. (handoff가 있으면 호출한 쪽은 반납하지 않음)
+        """
+        delay = self.hedge_policy.delay_for(estimated_tokens)
+        if delay is None:
+            return await func(*args, **kwargs)
+
+        outcome: dict = {}
+        token = call_outcome.set(outcome)
+        try:
+            primary = asyncio.ensure_future(func(*args, **kwargs))
+        finally:
+            call_outcome.reset(token)
+        hedge = None
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=delay)
+            if done:
+                return primary.result()
+            if not self.hedge_policy.try_spend():
+                metrics.HEDGED_CALLS.inc(outcome="no_budget")
+                return await primary
+            hedge_slot = await self.key_pool.try_acquire(estimated_tokens, avoid=slot)
+            if hedge_slot is None:
+                metrics.HEDGED_CALLS.inc(outcome="no_slot")
+                return await primary
+
+            logger.info(f"[{key}] {delay:.1f}초 넘게 응답이 없어 {hedge_slot.name}로 헤지 호출")
+            hedge = asyncio.create_task(
+                self._hedge_call(key, func, args, kwargs, hedge_slot, estimated_tokens)
+            )
+            pending = {primary, hedge}
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in (primary, hedge):
+                    if task in done and not task.cancelled() and task.exception() is None:
+                        metrics.HEDGED_CALLS.inc(
+                            outcome="primary_won" if task is primary else "hedge_won"
+                        )
+                        return task.result()
+            metrics.HEDGED_CALLS.inc(outcome="failed")
+            return primary.result()
+        finally:
+            for task in (primary, hedge):
+                if task is not None and not task.done():
+                    task.cancel()
+                    # 취소가 늦어 예외로 끝나도 "예외를 가져가지 않음" 경고가 나지 않도록 소비
+                    task.add_done_callback(lambda t: t.cancelled() or t.exception())
+            if not primary.done():
+                handoff.append(primary)
+                settle = asyncio.create_task(
+                    self._settle_abandoned(slot, started, primary, outcome, estimated_tokens)
+                )
+                self._settling.add(settle)
+                settle.add_done_callback(self._settling.discard)
+
+    async def _settle_abandoned(
+        self,
+        slot: KeySlot,
+        started: float,
+        task: asyncio.Task,
+        outcome: dict,
+        estimated_tokens: int,
+    ):
+        """
+        버린 원래 호출이 실제로 끝나면 슬롯을 반납하고 일일 사용량에 반영합니다.
+        호출 결과를 알 수 있으면(끝까지 받은 경우) 회로에 기록하고, 성공이면 실제 지연을 헤지 표본에 넣습니다.
+        """
+        await asyncio.wait({task})
+        elapsed = time.monotonic() - started
+        if not task.cancelled():
+            outcome = {"error": task.exception()}
+        error = outcome.get("error")
+        await self.key_pool.release(slot, elapsed, error)
+        await self._record_daily_usage(slot, error)
+        if "error" not in outcome:
+            # 스트리밍을 중간에 끊어 결과를 알 수 없음
+            metrics.MODEL_LATENCY.observe(elapsed, model=slot.model, outcome="abandoned")
+            return
+        await self.breaker.record(error)
+        if error is None:
+            metrics.MODEL_LATENCY.observe(elapsed, model=slot.model, outcome="success")
+            self.hedge_policy.record(estimated_tokens, elapsed)
+        else:
+            metrics.MODEL_LATENCY.observe(
+                elapsed, model=slot.model, outcome=metrics.error_type(error)
+            )
+
+    async def _hedge_call(
+        self, key: str, func, args: tuple, kwargs: dict, slot: KeySlot, estimated_tokens: int
+    ):
+        """헤지 슬롯으로 호출하고 결과를 슬롯/회로/일일 사용량에 반영합니다. (취소돼도 요청은 나갔으므로 사용량에 포함)"""
+        current_slot.set(slot)
+        started = time.monotonic()
+        try:
+            with tracer.span("model_call", key=key, slot=slot.name, hedge=True):
+                result = await func(*args, **kwargs)
+        except Exception as e:
+            elapsed = time.monotonic() - started
+            await self.key_pool.release(slot, elapsed, e)
+            await self.breaker.record(e)
+            await self._record_daily_usage(slot, e)
+            metrics.MODEL_LATENCY.observe(elapsed, model=slot.model, outcome=metrics.error_type(e))
+            logger.warning(f"[{key}] 헤지 호출 실패 ({slot.name}): {e}")
+            raise
+        except BaseException:
+            await self.key_pool.release(slot, time.monotonic() - started)
+            await self._record_daily_usage(slot)
+            raise
+        elapsed = time.monotonic() - started
+        await self.key_pool.release(slot, elapsed)
+        await self.breaker.record()
+        await self._record_daily_usage(slot)
+        metrics.MODEL_LATENCY.observe(elapsed, model=slot.model, outcome="success")
+        return result
+
+
+def _expires_at(cached, now: float, ttl_seconds: int) -> float:
+    """캐시 응답의 만료 시각을 epoch 초로 변환합니다. (없으면 TTL로 계산)"""
+    expire_time = getattr(cached, "expire_time", None)
+    if isinstance(expire_time, datetime.datetime):
+        return expire_time.timestamp()
+    return now + ttl_seconds
@@ -0,0 +1,94 @@
+# hedging.py
+import threading
+from collections import defaultdict, deque
+from typing import Optional
+
+import app_config
+
+
+class HedgePolicy:
+    """
+    느린 모델 호출에 같은 호출을 하나 더 보낼(헤지) 시점과 횟수를 정합니다.
+
+    - 시점: 입력 토큰 수가 비슷한 호출(2의 거듭제곱 구간)의 최근 성공 지연 시간 중 percentile 백분위
+      (구간 표본이 min_samples 미만이면 전체 표본, 그것도 모자라면 헤지하지 않음, 최소 min_delay초)
+    - 예산: 호출 1회마다 budget_ratio씩 적립(최대 max_burst)하고 헤지 1회에 1을 써서,
+      헤지로 늘어나는 요청이 전체 호출의 budget_ratio 비율을 넘지 않게 함
+    """
+
+    def __init__(
+        self,
+        percentile: float = 95.0,
+        budget_ratio: float = 0.05,
+        min_samples: int = 20,
+        min_delay: float = 2.0,
+        window: int = 200,
+        max_burst: float = 3.0,
+    ):
+        self.percentile = min(max(percentile, 0.0), 100.0)
+        self.budget_ratio = budget_ratio
+        self.min_samples = max(1, min_samples)
+        self.min_delay = min_delay
+        self.max_burst = max(1.0, max_burst)
+        self.budget = 1.0
+        self.hedges = 0
+        self._samples: dict[int, deque] = defaultdict(lambda: deque(maxlen=window))
+        self._all_samples: deque = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls) -> Optional["HedgePolicy"]:
+        """설정으로 정책을 만듭니다. (HEDGE_ENABLED=false면 None)"""
+        if not app_config.HEDGE_ENABLED:
+            return None
+        return cls(
+            percentile=app_config.HEDGE_PERCENTILE,
+            budget_ratio=app_config.HEDGE_BUDGET_RATIO,
+            min_samples=app_config.HEDGE_MIN_SAMPLES,
+            min_delay=app_config.HEDGE_MIN_DELAY_SECONDS,
+        )
+
+    @staticmethod
+    def _bucket(estimated_tokens: int) -> int:
+        return max(0, estimated_tokens).bit_length()
+
+    def record(self, estimated_tokens: int, elapsed: float):
+        """성공한 호출의 지연 시간을 표본에 추가합니다."""
+        with self._lock:
+            self._samples[self._bucket(estimated_tokens)].append(elapsed)
+            self._all_samples.append(elapsed)
+
+    def delay_for(self, estimated_tokens: int) -> Optional[float]:
+        """
+        이 호출을 헤지할 기준 시간(초)을 반환하고 호출 1회분 예산을 적립합니다.
+        (표본이 모자라면 None: 헤지하지 않음)
+        """
+        with self._lock:
+            self.budget = min(self.max_burst, self.budget + self.budget_ratio)
+            samples = self._samples.get(self._bucket(estimated_tokens))
+            if not samples or len(samples) < self.min_samples:
+                samples = self._all_samples
+            if len(samples) < self.min_samples:
+                return None
+            ordered = sorted(samples)
+            index = min(len(ordered) - 1, int(len(ordered) * self.percentile / 100))
+            return max(self.min_delay, ordered[index])
+
+    def try_spend(self) -> bool:
+        """헤지 1회분 예산이 있으면 쓰고 True를 반환합니다."""
+        with self._lock:
+            if self.budget < 1.0:
+                return False
+            self.budget -= 1.0
+            self.hedges += 1
+            return True
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "percentile": self.percentile,
+                "budget_ratio": self.budget_ratio,
+                "budget": round(self.budget, 2),
+                "hedges": self.hedges,
+                "samples": len(self._all_samples),
+            }
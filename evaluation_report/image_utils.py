@@ -0,0 +1,235 @@
+# image_utils.py
+import io
+import math
+from typing import TYPE_CHECKING
+
+import app_config
+
+# PIL/numpy는 임포트 비용이 커서 실제로 사용하는 함수 안에서 임포트함
+if TYPE_CHECKING:
+    from PIL import Image
+
+# 콜라주 빈 칸 배경색
+BACKGROUND_COLOR = (245, 245, 245)
+
+# 이 넓이 이상이면 크기 점수 만점 (1024x768)
+_FULL_SCORE_AREA = 1024 * 768
+# 시트 이름에 들어 있으면 증빙 사진이 배치된 시트로 보는 단어
+_EVIDENCE_SHEET_WORDS = ("사진", "증빙", "활동")
+
+
+# --- 지각 해시(dHash) 중복 제거 + 정보량 순위 ---
+def _dhash(gray: "Image.Image") -> bytes:
+    """9x8로 줄인 흑백 이미지에서 가로로 이웃한 픽셀의 밝기 차이로 64비트 해시를 만듭니다."""
+    import numpy as np
+    from PIL import Image
+
+    pixels = np.asarray(gray.resize((9, 8), Image.Resampling.BOX), dtype=np.int16)
+    return np.packbits(pixels[:, 1:] > pixels[:, :-1]).tobytes()
+
+
+def _entropy(gray: "Image.Image") -> float:
+    """흑백 히스토그램의 섀넌 엔트로피 (0~8비트). 로고/단색 장식 이미지는 낮게 나옴"""
+    import numpy as np
+
+    histogram = np.asarray(gray.histogram(), dtype=np.float64)
+    probabilities = histogram[histogram > 0] / histogram.sum()
+    return float(-(probabilities * np.log2(probabilities)).sum())
+
+
+def _sheet_score(entry: dict) -> float:
+    """사진이 배치된 위치 점수: 결과보고서 > 계획서 > 시트에 배치되지 않은 이미지"""
+    sheet = entry.get("sheet")
+    if not sheet:
+        return 0.5
+    score = 1.0 if entry.get("source") == "결과보고서" else 0.8
+    if any(word in sheet for word in _EVIDENCE_SHEET_WORDS):
+        score += 0.2
+    return min(score, 1.0)
+
+
+def photo_features(data: bytes) -> dict | None:
+    """
+    순위/중복 판정에 쓰는 사진 특징: {"width", "height"(원본 크기), "entropy", "dhash"(16진수)}
+    디코딩할 수 없는 이미지면 None
+    """
+    from PIL import Image
+
+    try:
+        image = Image.open(io.BytesIO(data))
+        width, height = image.size
+        # 해시/엔트로피는 작은 흑백 이미지로 충분하므로 JPEG는 축소 디코딩
+        image.draft("L", (64, 64))
+        gray = image.convert("L")
+        gray.thumbnail((64, 64), reducing_gap=2.0)
+    except Exception:
+        return None
+    return {
+        "width": width,
+        "height": height,
+        "entropy": _entropy(gray),
+        "dhash": _dhash(gray).hex(),
+    }
+
+
+def downscale_photo(data: bytes, max_side: int = app_config.EXTRACTION_IMAGE_MAX_SIDE) -> bytes:
+    """
+    긴 변이 max_side보다 큰 사진을 줄여 JPEG로 다시 인코딩합니다. (작거나 디코딩할 수 없으면 원본 그대로)
+    콜라주 타일/모델 입력보다 충분히 크므로 평가에는 영향이 없고, 캐시와 이후 디코딩 비용이 줄어듦
+    """
+    from PIL import Image
+
+    if max_side <= 0:
+        return data
+    try:
+        image = Image.open(io.BytesIO(data))
+        if max(image.size) <= max_side:
+            return data
+        image.draft("RGB", (max_side, max_side))
+        image = image.convert("RGB")
+        image.thumbnail((max_side, max_side), reducing_gap=2.0)
+        buffer = io.BytesIO()
+        image.save(buffer, format="JPEG", quality=85)
+    except Exception:
+        return data
+    return buffer.getvalue()
+
+
+def compact_photo_entries(entries: list[dict]) -> list[dict]:
+    """
+    추출한 이미지 항목마다 원본으로 특징(photo_features)을 계산해 붙이고 사진은 축소합니다.
+    (추출 캐시에 그대로 저장되는 형태, 계획서/보고서 구분(source)은 사용할 때 붙임)
+    """
+    return [
+        {
+            "data": downscale_photo(entry["data"]),
+            "name": entry["name"],
+            "sheet": entry["sheet"],
+            "features": photo_features(entry["data"]),
+        }
+        for entry in entries
+    ]
+
+
+def rank_photos(
+    entries: list[dict],
+    max_distance: int = app_config.IMAGE_DEDUPE_DISTANCE,
+    min_entropy: float = app_config.IMAGE_MIN_ENTROPY,
+) -> tuple[list["Image.Image"], dict]:
+    """
+    계획서/보고서에서 추출한 이미지 항목(file_utils.extract_image_entries_from_excel)을
+    정보량 순으로 정렬하고 중복 사진을 제거합니다.
+
+    - 점수: 흑백 엔트로피 0.4 + 원본 크기 0.3 + 배치된 시트 0.3
+    - 엔트로피가 min_entropy 미만인 이미지(로고, 양식 장식)는 제외
+    - dHash 해밍 거리가 max_distance 이하인 사진은 같은 사진으로 보고 점수가 높은 쪽만 남김
+      (두 파일에 같은 사진을 다시 붙였거나 크기/압축만 바꾼 경우)
+    항목에 "features"(photo_features 결과, 추출 캐시에 저장됨)가 있으면 다시 디코딩하지 않음
+    반환값: (점수 순 고유 사진 목록, {"total", "duplicates", "low_information"})
+    """
+    import numpy as np
+    from PIL import Image
+
+    candidates = []
+    low_information = 0
+    for entry in entries:
+        features = entry.get("features") or photo_features(entry["data"])
+        if features is None:
+            continue
+        if features["entropy"] < min_entropy:
+            low_information += 1
+            continue
+        score = (
+            0.4 * features["entropy"] / 8
+            + 0.3 * min(1.0, (features["width"] * features["height"]) / _FULL_SCORE_AREA)
+            + 0.3 * _sheet_score(entry)
+        )
+        candidates.append((score, bytes.fromhex(features["dhash"]), entry))
+
+    candidates.sort(key=lambda c: c[0], reverse=True)
+    kept_hashes = np.empty((0, 8), dtype=np.uint8)
+    kept = []
+    for _, digest, entry in candidates:
+        bits = np.frombuffer(digest, dtype=np.uint8)
+        if len(kept_hashes):
+            distances = np.unpackbits(kept_hashes ^ bits, axis=1).sum(axis=1)
+            if distances.min() <= max_distance:
+                continue
+        kept_hashes = np.vstack([kept_hashes, bits])
+        kept.append(entry)
+
+    images = [Image.open(io.BytesIO(entry["data"])) for entry in kept]
+    stats = {
+        "total": len(entries),
+        "duplicates": len(candidates) - len(kept),
+        "low_information": low_information,
+    }
+    return images, stats
+
+
+def plan_collages(
+    photo_count: int,
+    max_collages: int = app_config.COLLAGE_MAX_IMAGES,
+    max_photos: int = app_config.COLLAGE_MAX_PHOTOS,
+) -> list[int]:
+    """사진 수에 따른 콜라주별 사진 수 목록 (사진이 한도보다 많으면 앞쪽 사진만 포함)"""
+    selected = min(photo_count, max_collages * max_photos)
+    if not selected:
+        return []
+    count = math.ceil(selected / max_photos)
+    base, extra = divmod(selected, count)
+    return [base + (1 if i < extra else 0) for i in range(count)]
+
+
+def _grid(n: int) -> tuple[int, int]:
+    cols = math.ceil(math.sqrt(n))
+    return cols, math.ceil(n / cols)
+
+
+def _fit_tile(image: "Image.Image", width: int, height: int) -> "Image.Image":
+    """사진을 비율을 유지한 채 칸 크기에 맞게 줄입니다."""
+    # JPEG는 디코딩 단계에서 1/2~1/8로 줄여 읽으므로 큰 사진도 전체 해상도로 풀지 않음
+    image.draft("RGB", (width, height))
+    tile = image.convert("RGB")
+    # reducing_gap: 정수배 축소(box)를 먼저 적용한 뒤 리샘플링하여 비용을 줄임
+    tile.thumbnail((width, height), reducing_gap=2.0)
+    return tile
+
+
+def build_collages(
+    images: list["Image.Image"],
+    size: int = app_config.COLLAGE_SIZE,
+    max_collages: int = app_config.COLLAGE_MAX_IMAGES,
+    max_photos: int = app_config.COLLAGE_MAX_PHOTOS,
+) -> tuple[list["Image.Image"], int]:
+    """
+    사진들을 size×size 이하 격자 콜라주 최대 max_collages장으로 묶습니다.
+    사진이 한도보다 많으면 앞쪽 사진만 포함하므로 rank_photos로 정렬한 목록을 넘깁니다.
+    반환값: (콜라주 목록, 콜라주에 포함된 사진 수)
+    """
+    from PIL import Image
+
+    layout = plan_collages(len(images), max_collages, max_photos)
+    selected = images[: sum(layout)]
+    collages, start = [], 0
+    for n in layout:
+        cols, rows = _grid(n)
+        tile_w, tile_h = size // cols, size // rows
+        canvas = Image.new("RGB", (tile_w * cols, tile_h * rows), BACKGROUND_COLOR)
+        for index, image in enumerate(selected[start : start + n]):
+            try:
+                tile = _fit_tile(image, tile_w - 2, tile_h - 2)
+            except Exception:
+                # 손상된 이미지는 빈 칸으로 둠
+                continue
+            col, row = index % cols, index // cols
+            canvas.paste(
+                tile,
+                (
+                    col * tile_w + (tile_w - tile.width) // 2,
+                    row * tile_h + (tile_h - tile.height) // 2,
+                ),
+            )
+        collages.append(canvas)
+        start += n
+    return collages, len(selected)
@@ -0,0 +1,366 @@
+# job_service.py
+import os
+import time
+import asyncio
+import datetime
+import logging
+import zipfile
+from typing import Optional
+
+from fastapi import UploadFile
+
+import app_config
+import db_utils
+import file_utils
+import metrics
+from blob_store import BlobStore, StoredFile
+from event_bus import EventBus
+from gemini_service import format_local_time, next_quota_reset
+from pipeline import EvaluationPipeline
+
+logger = logging.getLogger(__name__)
+
+
+def _db_time(timestamp: float) -> str:
+    """epoch 초를 DB의 CURRENT_TIMESTAMP와 같은 형식(UTC)으로 변환합니다."""
+    return time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(timestamp))
+
+
+class JobService:
+    """
+    업로드 파일을 저장소에 보관하고 작업(job)/쌍(pair) 상태를 DB에 기록하여,
+    재업로드 없이 실패한 쌍만 다시 처리할 수 있게 합니다.
+    """
+
+    def __init__(
+        self, pipeline: EvaluationPipeline, blob_store: BlobStore, event_bus: EventBus
+    ):
+        self.pipeline = pipeline
+        self.blob_store = blob_store
+        self.event_bus = event_bus
+        # 현재 처리 중인 job_pairs.id (같은 쌍이 동시에 두 번 처리되지 않도록)
+        self._active_pair_ids: set[int] = set()
+
+    async def store_upload(self, file: UploadFile) -> StoredFile:
+        """업로드 파일을 해시 기반 저장소에 스트리밍 저장합니다."""
+        await file.seek(0)
+        sha256, size = await asyncio.to_thread(self.blob_store.put_stream, file.file)
+        return StoredFile(self.blob_store, file.filename, sha256, size)
+
+    async def store_zip(
+        self, archive: UploadFile, kind: Optional[str] = None
+    ) -> dict[str, list]:
+        """
+        ZIP 업로드의 항목들을 메모리에 전체를 올리지 않고 하나씩 저장소로 스트리밍합니다.
+        kind("plan"/"report")가 없으면 경로의 키워드로 계획서/보고서를 구분합니다.
+        반환값: {"plan": [...], "report": [...], "unclassified": [파일명, ...]}
+        """
+        await archive.seek(0)
+        return await asyncio.to_thread(self._store_zip_sync, archive.file, kind)
+
+    def _store_zip_sync(self, stream, kind: Optional[str]) -> dict[str, list]:
+        stored = {"plan": [], "report": [], "unclassified": []}
+        try:
+            # 업로드 파일은 디스크에 스풀되어 있으므로 zipfile이 필요한 부분만 읽음
+            with zipfile.ZipFile(stream) as zip_file:
+                for path, info in file_utils.iter_zip_members(
+                    zip_file,
+                    app_config.ZIP_MAX_UNCOMPRESSED_MB * 1024 * 1024,
+                    app_config.ZIP_MAX_ENTRIES,
+                ):
+                    entry_kind = kind or file_utils.classify_upload_name(path)
+                    filename = os.path.basename(path)
+                    if entry_kind is None:
+                        stored["unclassified"].append(path)
+                        continue
+                    with zip_file.open(info) as entry:
+                        sha256, size = self.blob_store.put_stream(entry)
+                    stored[entry_kind].append(
+                        StoredFile(self.blob_store, filename, sha256, size)
+                    )
+        except zipfile.BadZipFile as e:
+            raise ValueError(f"올바른 ZIP 파일이 아닙니다: {e}")
+        return stored
+
+    async def create_job(
+        self,
+        job_id: str,
+        pairs: list[tuple[str, Optional[StoredFile], Optional[StoredFile]]],
+    ) -> list[dict]:
+        """작업과 쌍별 입력 파일 정보를 DB에 기록합니다."""
+        rows = []
+        for key, plan, report in pairs:
+            rows.append(
+                {
+                    "pair_key": key,
+                    "plan_filename": plan.filename if plan else None,
+                    "plan_sha256": plan.sha256 if plan else None,
+                    "plan_size": plan.size if plan else None,
+                    "report_filename": report.filename if report else None,
+                    "report_sha256": report.sha256 if report else None,
+                    "report_size": report.size if report else None,
+                }
+            )
+        job_pairs = await asyncio.to_thread(db_utils.create_job, job_id, rows)
+        # 저장소 정리는 요청 처리와 무관하므로 백그라운드 스레드에서 실행
+        asyncio.get_running_loop().run_in_executor(None, self.sweep_blobs)
+        return job_pairs
+
+    def sweep_blobs(self) -> int:
+        """처리 대기 중인 쌍의 입력 파일은 남기고 업로드 저장소를 정리합니다."""
+        return self.blob_store.sweep(keep=db_utils.get_pending_blob_hashes())
+
+    async def run_pairs(
+        self,
+        job_id: str,
+        pair_rows: list[dict],
+        system_prompt: str,
+        overwrite_results: bool = False,
+        allow_review: bool = True,
+        priority: str = "bulk",
+        uploader: Optional[str] = None,
+        deadline: Optional[float] = None,
+    ) -> list[dict]:
+        """
+        DB에 기록된 쌍들을 저장소의 입력 파일로 파이프라인에 넣어 처리합니다.
+        priority/uploader는 모델 호출 스케줄링에 쓰입니다. (uploader가 없으면 작업 단위로 공정 분배)
+        deadline(time.monotonic 기준)이 지나도록 모델 호출을 시작하지 못한 쌍은 실패 처리됩니다.
+        처리 도중 취소되면(클라이언트 연결 끊김 등) 끝나지 않은 쌍을 'cancelled'로 기록합니다.
+        """
+        runnable, results = [], []
+        for row in pair_rows:
+            if row["id"] in self._active_pair_ids:
+                results.append(self._skipped(row, "이미 처리 중인 쌍입니다."))
+                continue
+            missing = [
+                row[f"{kind}_filename"]
+                for kind in ("plan", "report")
+                if row[f"{kind}_sha256"] and not self.blob_store.exists(row[f"{kind}_sha256"])
+            ]
+            if missing:
+                error = f"보관 기간이 지나 입력 파일이 삭제되었습니다: {', '.join(missing)}"
+                await asyncio.to_thread(
+                    db_utils.update_job_pair, row["id"], "expired", None, error
+                )
+                results.append(self._skipped(row, error))
+                continue
+            runnable.append(row)
+
+        runnable, deferred = await self._defer_over_daily_quota(runnable)
+        results += deferred
+
+        rows_by_key = {row["pair_key"]: row for row in runnable}
+        pairs = [
+            (
+                row["pair_key"],
+                self._stored_file(row, "plan"),
+                self._stored_file(row, "report"),
+            )
+            for row in runnable
+        ]
+        result_ids = (
+            {row["pair_key"]: row["result_id"] for row in runnable if row["result_id"]}
+            if overwrite_results
+            else None
+        )
+
+        recorded: set[str] = set()
+
+        async def record_result(result: dict):
+            row = rows_by_key[result["key"]]
+            recorded.add(result["key"])
+            scheduled_at = None
+            if result["status"] == "success":
+                status, error = "success", None
+            elif result["status"] == "deferred":
+                # 처리 도중 일일 한도가 소진된 쌍: 한도 초기화 이후 다시 처리
+                status, error = "deferred", result.get("error")
+                scheduled_at = _db_time(
+                    datetime.datetime.fromisoformat(result["scheduled_at"]).timestamp()
+                )
+            elif result["status"] == "review":
+                # 유사 보고서: 검토 후 승인(approve_review)하면 평가
+                status, error = "review", result.get("error")
+            else:
+                status, error = "error", result.get("error")
+            await asyncio.to_thread(
+                db_utils.update_job_pair,
+                row["id"],
+                status,
+                result.get("result_id"),
+                error,
+                scheduled_at,
+            )
+
+        self._active_pair_ids.update(row["id"] for row in runnable)
+        try:
+            gemini_service = self.pipeline.analysis_service.gemini_service
+            self.event_bus.publish(
+                job_id,
+                "job_started",
+                total_pairs=len(pairs),
+                eta_seconds=gemini_service.estimate_wait_seconds(
+                    gemini_service.pending_calls + len(pairs)
+                ),
+                deferred_count=len(deferred),
+                expected_completion_at=max(
+                    (r["expected_completion_at"] for r in deferred), default=None
+                ),
+            )
+            processed = await self.pipeline.run(
+                pairs,
+                system_prompt,
+                job_id=job_id,
+                result_ids=result_ids,
+                on_result=record_result,
+                allow_review=allow_review,
+                priority=priority,
+                uploader=uploader,
+                deadline=deadline,
+            )
+        except asyncio.CancelledError:
+            cancelled = [row for row in runnable if row["pair_key"] not in recorded]
+            logger.warning(f"[{job_id}] 작업이 취소되어 쌍 {len(cancelled)}건의 처리를 중단했습니다.")
+            metrics.DROPPED_PAIRS.inc(len(cancelled), reason="cancelled")
+            await asyncio.to_thread(
+                db_utils.cancel_job_pairs, [row["id"] for row in cancelled]
+            )
+            self.event_bus.publish(job_id, "job_cancelled", cancelled_count=len(cancelled))
+            raise
+        finally:
+            self._active_pair_ids.difference_update(row["id"] for row in runnable)
+
+        success_count = sum(1 for r in processed if r["status"] == "success")
+        self.event_bus.publish(
+            job_id,
+            "job_completed",
+            success_count=success_count,
+            failed_count=len(processed) - success_count,
+        )
+        return results + processed
+
+    async def _defer_over_daily_quota(
+        self, rows: list[dict]
+    ) -> tuple[list[dict], list[dict]]:
+        """
+        오늘 남은 일일 요청 한도로 끝낼 수 없는 쌍은 실패시키지 않고 한도 초기화 이후로 미룹니다.
+        쌍당 요청 1회로 계산합니다. (묶음 모드에서는 실제 요청 수가 더 적으므로 보수적인 추정)
+        반환값: (지금 처리할 쌍, 미룬 쌍의 결과)
+        """
+        gemini_service = self.pipeline.analysis_service.gemini_service
+        remaining = await gemini_service.refresh_daily_quota()
+        if remaining is None or len(rows) <= remaining:
+            return rows, []
+
+        per_day = gemini_service.daily_quota_per_day()
+        reset_at = next_quota_reset()
+        # 이미 미뤄둔 쌍이 먼저 처리되므로 그 뒤 순서로 배정
+        queued_ahead = await asyncio.to_thread(db_utils.count_deferred_pairs)
+        reason = "일일 요청 한도 초과로 한도 초기화 이후로 미뤘습니다."
+        schedules, deferred = [], []
+        for index, row in enumerate(rows[remaining:], start=queued_ahead):
+            # 하루 한도를 넘는 만큼은 그다음 날로 넘김
+            day, position = divmod(index, per_day) if per_day else (0, index)
+            scheduled_at = reset_at + day * 86400
+            expected_at = scheduled_at + gemini_service.estimate_wait_seconds(position + 1)
+            schedules.append((row["id"], _db_time(scheduled_at)))
+            deferred.append(
+                {
+                    "key": row["pair_key"],
+                    "filename": row["report_filename"] or row["plan_filename"],
+                    "status": "deferred",
+                    "error": reason,
+                    "scheduled_at": format_local_time(scheduled_at),
+                    "expected_completion_at": format_local_time(expected_at),
+                }
+            )
+        await asyncio.to_thread(db_utils.defer_job_pairs, schedules, reason)
+        logger.warning(
+            f"일일 요청 한도 부족: {remaining}건만 지금 처리하고 {len(deferred)}건은 "
+            f"{format_local_time(reset_at)} 이후로 미룹니다."
+        )
+        return rows[:remaining], deferred
+
+    async def run_deferred(self, system_prompt: str) -> int:
+        """예정 시각이 지난 미뤄둔 쌍을 작업별로 처리하고 처리한 쌍 수를 반환합니다."""
+        rows = await asyncio.to_thread(db_utils.claim_due_deferred_pairs, _db_time(time.time()))
+        rows_by_job: dict[str, list[dict]] = {}
+        for row in rows:
+            rows_by_job.setdefault(row["job_id"], []).append(row)
+        for job_id, job_rows in rows_by_job.items():
+            logger.info(f"[{job_id}] 미뤄둔 쌍 {len(job_rows)}건 처리 시작")
+            # 재분석 요청이 미뤄진 경우에도 원래 결과 ID에 덮어씀
+            await self.run_pairs(job_id, job_rows, system_prompt, overwrite_results=True)
+        return len(rows)
+
+    async def run_deferred_periodically(self, system_prompt: str, interval: float):
+        """미뤄둔 쌍을 주기적으로 확인하여 예정 시각이 지나면 처리합니다."""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.run_deferred(system_prompt)
+            except Exception as e:
+                logger.error(f"미뤄둔 쌍 처리 실패: {e}")
+
+    async def retry_failed(
+        self, job_id: str, system_prompt: str, deadline: Optional[float] = None
+    ) -> list[dict]:
+        """작업에서 성공하지 못한(취소된 쌍 포함) 쌍만 다시 처리합니다."""
+        pair_rows = await asyncio.to_thread(
+            db_utils.get_job_pairs, job_id, ["error", "queued", "cancelled"]
+        )
+        logger.info(f"[{job_id}] 실패한 쌍 {len(pair_rows)}건 재처리 시작")
+        return await self.run_pairs(
+            job_id, pair_rows, system_prompt, priority="normal", deadline=deadline
+        )
+
+    async def approve_review(
+        self, job_id: str, system_prompt: str, deadline: Optional[float] = None
+    ) -> list[dict]:
+        """유사 보고서로 검토 대기 중인 쌍을 승인하여 평가합니다."""
+        pair_rows = await asyncio.to_thread(db_utils.get_job_pairs, job_id, ["review"])
+        logger.info(f"[{job_id}] 검토 대기 쌍 {len(pair_rows)}건 승인, 평가 시작")
+        return await self.run_pairs(
+            job_id,
+            pair_rows,
+            system_prompt,
+            allow_review=False,
+            priority="normal",
+            deadline=deadline,
+        )
+
+    async def reanalyze_result(
+        self, result_id: int, system_prompt: str, deadline: Optional[float] = None
+    ) -> dict:
+        """저장된 입력 파일로 특정 결과를 다시 분석하여 같은 결과 ID에 덮어씁니다."""
+        row = await asyncio.to_thread(db_utils.get_job_pair_by_result, result_id)
+        if not row:
+            raise FileNotFoundError(f"결과 ID {result_id}의 입력 파일 정보를 찾을 수 없습니다.")
+        # 사용자가 결과를 기다리는 재분석은 대량 업로드보다 먼저 모델 호출 차례를 받음
+        results = await self.run_pairs(
+            row["job_id"],
+            [row],
+            system_prompt,
+            overwrite_results=True,
+            priority="interactive",
+            deadline=deadline,
+        )
+        return results[0]
+
+    def _stored_file(self, row: dict, kind: str) -> Optional[StoredFile]:
+        if not row[f"{kind}_sha256"]:
+            return None
+        return StoredFile(
+            self.blob_store,
+            row[f"{kind}_filename"],
+            row[f"{kind}_sha256"],
+            row[f"{kind}_size"] or 0,
+        )
+
+    def _skipped(self, row: dict, error: str) -> dict:
+        return {
+            "key": row["pair_key"],
+            "filename": row["report_filename"] or row["plan_filename"],
+            "status": "skipped",
+            "error": error,
+        }
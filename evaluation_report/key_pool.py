@@ -0,0 +1,439 @@
+# key_pool.py
+import time
+import asyncio
+import hashlib
+import logging
+import contextvars
+from collections import deque
+from typing import TYPE_CHECKING, Callable, Optional
+
+import app_config
+import metrics
+
+if TYPE_CHECKING:
+    from shared_limiter import SharedRateLimiter
+
+logger = logging.getLogger(__name__)
+
+# 현재 호출에 배정된 슬롯 (asyncio.to_thread로 넘어가는 동기 호출에서도 조회 가능)
+current_slot: contextvars.ContextVar[Optional["KeySlot"]] = contextvars.ContextVar(
+    "current_slot", default=None
+)
+
+
+class DeadlineExceeded(Exception):
+    """처리 기한이 지나 기다리던 호출을 하지 않고 포기함 (이미 시작한 호출은 끝까지 진행)"""
+
+
+def is_failover_error(error: Exception) -> bool:
+    """다른 키/모델로 넘겨 재시도할 만한 오류(429, 5xx)인지 판단합니다."""
+    from google.genai import errors
+
+    code = getattr(error, "code", None)
+    return isinstance(error, errors.APIError) and (code == 429 or (code or 0) >= 500)
+
+
+def reserve_window(
+    next_available: float,
+    tokens: Optional[float],
+    tokens_updated: float,
+    now: float,
+    min_interval: float,
+    estimated_tokens: int,
+    tpm: int,
+) -> tuple[float, float, Optional[float], float]:
+    """
+    RPM 간격과 TPM 토큰 버킷을 함께 적용해 호출 하나를 예약합니다.
+    (프로세스 내부 상태와 공유 상태 모두 이 계산을 사용)
+    반환값: (시작 시각, 다음 시작 가능 시각, 남은 토큰, 토큰 갱신 시각)
+    """
+    start_at = max(now, next_available)
+    if tpm > 0 and estimated_tokens:
+        rate = tpm / 60.0
+        available = tpm if tokens is None else min(tpm, tokens + (now - tokens_updated) * rate)
+        available -= estimated_tokens
+        if available < 0:
+            # 토큰이 모자라면 부족분이 채워질 때까지 시작을 미룸 (음수는 다음 호출이 갚을 빚)
+            start_at = max(start_at, now - available / rate)
+        tokens, tokens_updated = available, now
+    return start_at, start_at + min_interval, tokens, tokens_updated
+
+
+class KeySlot:
+    """API 키와 모델 조합 하나의 속도 제한 상태(RPM 간격, 동시 호출 수, 쿨다운)입니다."""
+
+    def __init__(
+        self,
+        name: str,
+        api_key: Optional[str],
+        model: str,
+        rpm: int,
+        max_concurrency: int = 1,
+        is_fallback: bool = False,
+        tpm: int = 0,
+        rpd: int = 0,
+    ):
+        self.name = name
+        self.api_key = api_key
+        self.model = model
+        self.rpm = rpm
+        self.min_interval = 60.0 / rpm
+        self.max_concurrency = max_concurrency
+        self.is_fallback = is_fallback
+        self.tpm = tpm  # 0이면 토큰 한도 없음
+        self.rpd = rpd  # 0이면 일일 요청 한도 없음
+        # 여러 프로세스가 같은 키/모델을 가리키는지 구분하는 식별자 (키 원문은 남기지 않음)
+        key_hash = hashlib.sha256((api_key or "").encode("utf-8")).hexdigest()[:12]
+        self.shared_id = f"{key_hash}:{model}"
+
+        self.next_available = 0.0
+        self.tokens: Optional[float] = None
+        self.tokens_updated = 0.0
+        self.in_flight = 0
+        self.consecutive_failures = 0
+        self.cooldown_until = 0.0
+
+        # 사용률 지표
+        self.created_at = time.monotonic()
+        self.calls = 0
+        self.errors = 0
+        self.rate_limited = 0
+        self.busy_seconds = 0.0
+        self._recent_starts: deque = deque()
+
+    def is_cooling_down(self, now: float) -> bool:
+        return self.cooldown_until > now
+
+    def can_start(self, now: float) -> bool:
+        return not self.is_cooling_down(now) and self.in_flight < self.max_concurrency
+
+    def start_time(self, now: float) -> float:
+        return max(now, self.next_available)
+
+    def reserve(self, now: float, estimated_tokens: int = 0) -> float:
+        """프로세스 내부 상태로 호출 하나를 예약하고 시작 시각을 반환합니다."""
+        start_at, self.next_available, self.tokens, self.tokens_updated = reserve_window(
+            self.next_available,
+            self.tokens,
+            self.tokens_updated,
+            now,
+            self.min_interval,
+            estimated_tokens,
+            self.tpm,
+        )
+        self.mark_started(start_at)
+        return start_at
+
+    def mark_started(self, start_at: float):
+        self.in_flight += 1
+        self._recent_starts.append(start_at)
+
+    def stats(self, now: float) -> dict:
+        while self._recent_starts and now - self._recent_starts[0] > 60:
+            self._recent_starts.popleft()
+        uptime = max(now - self.created_at, 1e-9)
+        return {
+            "name": self.name,
+            "model": self.model,
+            "fallback": self.is_fallback,
+            "rpm_limit": self.rpm,
+            "tpm_limit": self.tpm,
+            "rpd_limit": self.rpd,
+            "requests_last_minute": len(self._recent_starts),
+            "rpm_utilization": round(len(self._recent_starts) / self.rpm, 3),
+            "busy_ratio": round(min(1.0, self.busy_seconds / (uptime * self.max_concurrency)), 3),
+            "in_flight": self.in_flight,
+            "calls": self.calls,
+            "errors": self.errors,
+            "rate_limited": self.rate_limited,
+            "cooldown_remaining": round(max(0.0, self.cooldown_until - now), 1),
+        }
+
+
+class KeyPool:
+    """
+    여러 API 키/모델 슬롯에 호출을 분배하는 풀입니다.
+    가장 빨리 시작할 수 있는(여유가 가장 많은) 슬롯을 고르고, 429/5xx가 반복되는 슬롯은 쿨다운시킵니다.
+    기본 슬롯이 모두 밀려 있으면 가벼운 폴백 모델 슬롯으로 넘깁니다.
+
+    shared가 있으면 RPM 간격, TPM 토큰, 쿨다운을 같은 호스트의 다른 워커 프로세스와 공유하여
+    `uvicorn --workers N`에서도 전체가 하나의 할당량을 지킵니다. (동시 호출 수는 프로세스별)
+    """
+
+    def __init__(
+        self,
+        slots: list[KeySlot],
+        cooldown_seconds: float = 60.0,
+        failure_threshold: int = 3,
+        fallback_overflow_wait: float = 10.0,
+        shared: Optional["SharedRateLimiter"] = None,
+    ):
+        if not slots:
+            raise ValueError("키 풀에 슬롯이 하나 이상 필요합니다.")
+        self.slots = slots
+        self.cooldown_seconds = cooldown_seconds
+        self.failure_threshold = failure_threshold
+        self.fallback_overflow_wait = fallback_overflow_wait
+        self.shared = shared
+        self._cond = asyncio.Condition()
+
+    @classmethod
+    def from_config(cls) -> "KeyPool":
+        """app_config의 키/모델 목록으로 (키 × 모델) 슬롯과 폴백 슬롯을 만듭니다."""
+        keys = app_config.API_KEYS or [None]
+        slots = [
+            KeySlot(
+                f"key{i + 1}:{model}",
+                api_key,
+                model,
+                app_config.GEMINI_RPM,
+                app_config.KEY_MAX_CONCURRENCY,
+                tpm=app_config.GEMINI_TPM,
+                rpd=app_config.GEMINI_RPD,
+            )
+            for i, api_key in enumerate(keys)
+            for model in app_config.API_MODELS
+        ]
+        if app_config.FALLBACK_MODEL:
+            slots += [
+                KeySlot(
+                    f"key{i + 1}:{app_config.FALLBACK_MODEL}",
+                    api_key,
+                    app_config.FALLBACK_MODEL,
+                    app_config.FALLBACK_RPM,
+                    app_config.KEY_MAX_CONCURRENCY,
+                    is_fallback=True,
+                    tpm=app_config.FALLBACK_TPM,
+                    rpd=app_config.FALLBACK_RPD,
+                )
+                for i, api_key in enumerate(keys)
+            ]
+        shared = None
+        if app_config.RATE_LIMIT_BACKEND == "sqlite":
+            from shared_limiter import SharedRateLimiter
+
+            shared = SharedRateLimiter(app_config.RATE_LIMIT_DB_PATH)
+        return cls(
+            slots,
+            cooldown_seconds=app_config.KEY_COOLDOWN_SECONDS,
+            failure_threshold=app_config.KEY_FAILURE_THRESHOLD,
+            fallback_overflow_wait=app_config.FALLBACK_OVERFLOW_WAIT_SECONDS,
+            shared=shared,
+        )
+
+    @property
+    def default_slot(self) -> KeySlot:
+        return self.slots[0]
+
+    @property
+    def capacity(self) -> int:
+        """동시에 진행될 수 있는 최대 호출 수"""
+        return sum(slot.max_concurrency for slot in self.slots)
+
+    @property
+    def max_attempts(self) -> int:
+        """실패 시 다른 슬롯으로 넘겨 시도하는 최대 횟수"""
+        return min(3, len(self.slots))
+
+    def _pick(self, now: float) -> tuple[Optional[KeySlot], float]:
+        """지금 예약할 슬롯과 시작 시각을 고릅니다. (없으면 (None, 다음 확인 시각))"""
+
+        def best(candidates):
+            ready = [s for s in candidates if s.can_start(now)]
+            if not ready:
+                return None, None
+            slot = min(ready, key=lambda s: (s.start_time(now), s.in_flight))
+            return slot, slot.start_time(now)
+
+        primaries = [s for s in self.slots if not s.is_fallback]
+        primary, primary_start = best(primaries)
+        if primary and primary_start - now <= self.fallback_overflow_wait:
+            return primary, primary_start
+
+        # 기본 슬롯이 모두 쿨다운 중이거나 오래 기다려야 할 때만 폴백 슬롯으로 넘김
+        # (단순히 호출 중이라 바쁜 경우에는 반납을 기다림)
+        all_cooling = all(s.is_cooling_down(now) for s in primaries)
+        if primary or all_cooling:
+            fallback, fallback_start = best(s for s in self.slots if s.is_fallback)
+            if fallback and (primary is None or fallback_start < primary_start):
+                return fallback, fallback_start
+        if primary:
+            return primary, primary_start
+
+        cooldowns = [s.cooldown_until for s in self.slots if s.is_cooling_down(now)]
+        return None, min(cooldowns) if cooldowns else now + 1.0
+
+    async def acquire(
+        self,
+        estimated_tokens: int = 0,
+        check: Optional[Callable[[], None]] = None,
+        deadline: Optional[float] = None,
+    ) -> KeySlot:
+        """
+        슬롯 하나를 예약하고, 해당 슬롯의 RPM 간격(과 TPM 한도)만큼 기다린 뒤 반환합니다.
+        estimated_tokens는 이번 호출의 예상 입력 토큰 수입니다. (TPM 한도가 있을 때만 사용)
+        check는 슬롯을 고르기 전마다 호출되며, 예외를 던지면 기다리지 않고 그대로 전파합니다.
+        deadline(time.monotonic 기준)보다 늦게 시작하게 되면 기다리지 않고 DeadlineExceeded를 던집니다.
+        """
+        requested = time.monotonic()
+        async with self._cond:
+            while True:
+                if check:
+                    check()
+                if self.shared:
+                    # 다른 프로세스의 예약/쿨다운을 반영한 뒤 슬롯을 고름
+                    await self._sync_shared()
+                now = time.monotonic()
+                slot, start_at = self._pick(now)
+                if deadline is not None and (start_at if slot else now) > deadline:
+                    raise DeadlineExceeded("속도 제한 대기 중 처리 기한이 지났습니다.")
+                if slot is not None:
+                    start_at = await self._reserve(slot, now, estimated_tokens)
+                    break
+                # 모든 슬롯이 사용 중이거나 쿨다운: 반납/쿨다운 종료까지 대기
+                try:
+                    wake_at = start_at if deadline is None else min(start_at, deadline)
+                    # wait_for는 깨어나는 순간 취소가 겹치면 취소를 삼키므로 timeout 사용
+                    async with asyncio.timeout(max(0.05, wake_at - now)):
+                        await self._cond.wait()
+                except TimeoutError:
+                    pass
+
+        wait = start_at - time.monotonic()
+        if wait > 0:
+            logger.info(f"[{slot.name}] Rate Limit 준수를 위해 {wait:.1f}초 대기...")
+            try:
+                await asyncio.sleep(wait)
+            except asyncio.CancelledError:
+                # 대기 중 취소되면 예약한 슬롯을 돌려줌
+                await self.cancel(slot)
+                raise
+        metrics.LIMITER_WAIT.observe(time.monotonic() - requested, slot=slot.name)
+        return slot
+
+    async def try_acquire(
+        self, estimated_tokens: int = 0, avoid: Optional[KeySlot] = None
+    ) -> Optional[KeySlot]:
+        """
+        RPM 간격을 기다리지 않고 바로 시작할 수 있는 슬롯이 있으면 예약해 반환합니다. (없으면 None, 헤지 호출용)
+        다른 키/모델의 기본 슬롯 > 폴백 슬롯 > avoid 슬롯(원래 호출의 슬롯) 순으로 고릅니다.
+        """
+        async with self._cond:
+            if self.shared:
+                await self._sync_shared()
+            now = time.monotonic()
+            ready = [s for s in self.slots if s.can_start(now) and s.start_time(now) <= now]
+            if not ready:
+                return None
+            slot = min(ready, key=lambda s: (s is avoid, s.is_fallback, s.in_flight))
+            start_at = await self._reserve(slot, now, estimated_tokens)
+
+        # 공유 상태에서 다른 워커가 먼저 예약했으면 그만큼만 기다림
+        wait = start_at - time.monotonic()
+        if wait > 0:
+            try:
+                await asyncio.sleep(wait)
+            except asyncio.CancelledError:
+                await self.cancel(slot)
+                raise
+        return slot
+
+    async def _reserve(self, slot: KeySlot, now: float, estimated_tokens: int) -> float:
+        if not self.shared:
+            return slot.reserve(now, estimated_tokens)
+        # 공유 상태는 벽시계(time.time) 기준이므로 monotonic 시각으로 변환
+        offset = now - time.time()
+        shared_start, shared_next = await asyncio.to_thread(
+            self.shared.reserve,
+            slot.shared_id,
+            now - offset,
+            slot.min_interval,
+            estimated_tokens,
+            slot.tpm,
+        )
+        start_at = shared_start + offset
+        slot.next_available = max(slot.next_available, shared_next + offset)
+        slot.mark_started(start_at)
+        return start_at
+
+    async def _sync_shared(self):
+        snapshot = await asyncio.to_thread(self.shared.snapshot)
+        offset = time.monotonic() - time.time()
+        for slot in self.slots:
+            state = snapshot.get(slot.shared_id)
+            if state:
+                next_available, cooldown_until = state
+                slot.next_available = max(slot.next_available, next_available + offset)
+                slot.cooldown_until = max(slot.cooldown_until, cooldown_until + offset)
+
+    async def cancel(self, slot: KeySlot):
+        """호출하지 않고 취소된 예약을 반납합니다. (지표에는 반영하지 않음)"""
+        async with self._cond:
+            slot.in_flight -= 1
+            self._cond.notify_all()
+
+    async def release(
+        self, slot: KeySlot, elapsed: float, error: Optional[Exception] = None
+    ):
+        """호출 결과를 슬롯 상태에 반영하고 대기 중인 요청을 깨웁니다."""
+        async with self._cond:
+            now = time.monotonic()
+            slot.in_flight -= 1
+            slot.calls += 1
+            slot.busy_seconds += elapsed
+
+            if error is None:
+                slot.consecutive_failures = 0
+            elif is_failover_error(error):
+                slot.errors += 1
+                slot.consecutive_failures += 1
+                if getattr(error, "code", None) == 429:
+                    # 할당량 소진: 바로 쿨다운
+                    slot.rate_limited += 1
+                    self._cool_down(slot, now)
+                elif slot.consecutive_failures >= self.failure_threshold:
+                    self._cool_down(slot, now)
+                if self.shared and slot.is_cooling_down(now):
+                    # 같은 키/모델을 쓰는 다른 워커도 함께 쉬도록 공유
+                    await asyncio.to_thread(
+                        self.shared.cool_down,
+                        slot.shared_id,
+                        slot.cooldown_until - now + time.time(),
+                    )
+            else:
+                slot.errors += 1
+
+            self._cond.notify_all()
+
+    async def suspend(self, slot: KeySlot, until: float):
+        """일일 한도 소진 등으로 슬롯을 until(벽시계 시각)까지 배정하지 않습니다."""
+        async with self._cond:
+            now = time.monotonic()
+            slot.cooldown_until = max(slot.cooldown_until, until - time.time() + now)
+            if self.shared:
+                await asyncio.to_thread(self.shared.cool_down, slot.shared_id, until)
+            self._cond.notify_all()
+
+    def _cool_down(self, slot: KeySlot, now: float):
+        # 연속 실패가 늘어날수록 쿨다운을 두 배씩 늘림 (최대 8배)
+        # (일일 한도 소진으로 더 길게 쉬는 중이면 줄이지 않음)
+        factor = 2 ** min(3, max(0, slot.consecutive_failures - self.failure_threshold))
+        slot.cooldown_until = max(slot.cooldown_until, now + self.cooldown_seconds * factor)
+        logger.warning(
+            f"[{slot.name}] 연속 실패 {slot.consecutive_failures}회, "
+            f"{self.cooldown_seconds * factor:.0f}초 쿨다운"
+        )
+
+    def estimate_wait_seconds(self, position: int, avg_call_seconds: float) -> float:
+        """앞선 호출 수(position)를 모두 처리하는 데 걸릴 예상 시간(초)"""
+        now = time.monotonic()
+        active = [s for s in self.slots if not s.is_cooling_down(now)] or self.slots
+        throughput = sum(
+            min(1.0 / s.min_interval, s.max_concurrency / max(avg_call_seconds, 0.1))
+            for s in active
+        )
+        return round(position / throughput, 1)
+
+    def stats(self) -> list[dict]:
+        now = time.monotonic()
+        return [slot.stats(now) for slot in self.slots]
@@ -0,0 +1,192 @@
+# local_genai.py
+import re
+import json
+import time
+import uuid
+import datetime
+import threading
+from typing import Optional
+
+from google.genai import errors, types
+
+# 로컬 대체 백엔드가 반환하는 고정 평가 결과 (프롬프트 스키마와 같은 형태)
+SAMPLE_EVALUATION = {
+    "scores_weighted": {
+        "plan_specificity": 8,
+        "plan_feasibility": 8,
+        "plan_measurability": 6,
+        "result_specificity_goal": 16,
+        "team_participation_diversity": 12,
+        "evidence_strength": 14,
+    },
+    "rationale": {"plan_specificity": "로컬 대체 백엔드 응답입니다."},
+    "uncertainties": [],
+    "final_comment": "로컬 대체 백엔드 응답입니다.",
+    "total": 64,
+}
+
+# 스트리밍 응답 조각 크기(글자)와 첫 조각 전에 쓰는 지연 시간 비율
+STREAM_CHUNK_CHARS = 40
+FIRST_CHUNK_SHARE = 0.2
+
+
+class LocalGenAIClient:
+    """
+    google-genai Client의 models/caches 인터페이스를 흉내 내는 로컬 대체 클라이언트입니다.
+    API 키 없이 개발/부하 측정을 하거나 컨텍스트 캐시 생성·갱신·만료 흐름을 확인할 때 사용합니다.
+    (GEMINI_BACKEND=local)
+    """
+
+    def __init__(self, latency_seconds: float = 0.0):
+        self.caches = _LocalCaches()
+        self.models = _LocalModels(self.caches, latency_seconds)
+
+
+class _LocalCaches:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries: dict[str, dict] = {}
+
+    def create(self, *, model: str, config: types.CreateCachedContentConfig):
+        name = f"cachedContents/local-{uuid.uuid4().hex[:12]}"
+        expire_time = _expire_time_from(config.ttl)
+        system_text = _content_text(config.system_instruction)
+        with self._lock:
+            self._entries[name] = {
+                "model": model,
+                "system_text": system_text,
+                "expire_time": expire_time,
+            }
+        return types.CachedContent(
+            name=name,
+            display_name=config.display_name,
+            model=model,
+            expire_time=expire_time,
+        )
+
+    def update(self, *, name: str, config: types.UpdateCachedContentConfig):
+        with self._lock:
+            entry = self._live_entry(name)
+            entry["expire_time"] = _expire_time_from(config.ttl)
+            return types.CachedContent(
+                name=name, model=entry["model"], expire_time=entry["expire_time"]
+            )
+
+    def delete(self, *, name: str):
+        with self._lock:
+            self._entries.pop(name, None)
+
+    def system_text(self, name: str) -> str:
+        with self._lock:
+            return self._live_entry(name)["system_text"]
+
+    def expire(self, name: str):
+        """테스트용: 캐시를 즉시 만료시켜 캐시 미스 흐름을 재현합니다."""
+        with self._lock:
+            if name in self._entries:
+                self._entries[name]["expire_time"] = _now()
+
+    def _live_entry(self, name: str) -> dict:
+        entry = self._entries.get(name)
+        if not entry or entry["expire_time"] <= _now():
+            self._entries.pop(name, None)
+            raise errors.ClientError(
+                404,
+                {
+                    "error": {
+                        "code": 404,
+                        "message": f"CachedContent not found: {name}",
+                        "status": "NOT_FOUND",
+                    }
+                },
+            )
+        return entry
+
+
+class _LocalModels:
+    def __init__(self, caches: _LocalCaches, latency_seconds: float):
+        self.caches = caches
+        self.latency_seconds = latency_seconds
+
+    def generate_content(self, *, model: str, contents, config=None):
+        text, usage_metadata = self._respond(contents, config)
+        if self.latency_seconds:
+            time.sleep(self.latency_seconds)
+        return _response(text, usage_metadata)
+
+    def generate_content_stream(self, *, model: str, contents, config=None):
+        """
+        응답을 STREAM_CHUNK_CHARS자 조각으로 나눠 보냅니다. 지연 시간의 FIRST_CHUNK_SHARE는 첫 조각 전
+        (입력 처리), 나머지는 조각마다 나눠 기다려 실제 API처럼 출력 길이에 따라 응답이 늘어지게 함
+        """
+        text, usage_metadata = self._respond(contents, config)
+        chunks = [
+            text[i : i + STREAM_CHUNK_CHARS] for i in range(0, len(text), STREAM_CHUNK_CHARS)
+        ]
+        first_share = FIRST_CHUNK_SHARE if len(chunks) > 1 else 1.0
+        if self.latency_seconds:
+            time.sleep(self.latency_seconds * first_share)
+        for i, chunk in enumerate(chunks):
+            if i and self.latency_seconds:
+                time.sleep(self.latency_seconds * (1 - first_share) / (len(chunks) - 1))
+            # 사용량은 마지막 조각에만 넣음
+            yield _response(chunk, usage_metadata if i == len(chunks) - 1 else None)
+
+    def _respond(self, contents, config) -> tuple[str, types.GenerateContentResponseUsageMetadata]:
+        from gemini_service import estimate_contents_tokens, estimate_text_tokens
+
+        cached_tokens = 0
+        system_tokens = 0
+        if config is not None and config.cached_content:
+            cached_tokens = estimate_text_tokens(
+                self.caches.system_text(config.cached_content)
+            )
+        elif config is not None and config.system_instruction:
+            system_tokens = estimate_text_tokens(_content_text(config.system_instruction))
+
+        # 묶음(packing) 요청이면 pair_key가 붙은 JSON 배열로 응답
+        first = contents[0] if isinstance(contents, list) and contents else contents
+        packed_keys = re.search(r"대상 키 목록: (\[.*?\])", str(first))
+        if packed_keys:
+            keys = json.loads(packed_keys.group(1))
+            text = json.dumps(
+                [{"pair_key": key, **SAMPLE_EVALUATION} for key in keys],
+                ensure_ascii=False,
+            )
+        else:
+            text = json.dumps(SAMPLE_EVALUATION, ensure_ascii=False)
+        prompt_tokens = estimate_contents_tokens(contents) + system_tokens + cached_tokens
+        output_tokens = estimate_text_tokens(text)
+        return text, types.GenerateContentResponseUsageMetadata(
+            prompt_token_count=prompt_tokens,
+            cached_content_token_count=cached_tokens or None,
+            candidates_token_count=output_tokens,
+            total_token_count=prompt_tokens + output_tokens,
+        )
+
+
+def _response(text: str, usage_metadata) -> types.GenerateContentResponse:
+    return types.GenerateContentResponse(
+        candidates=[
+            types.Candidate(content=types.Content(role="model", parts=[types.Part(text=text)]))
+        ],
+        usage_metadata=usage_metadata,
+    )
+
+
+def _now() -> datetime.datetime:
+    return datetime.datetime.now(datetime.timezone.utc)
+
+
+def _expire_time_from(ttl: Optional[str]) -> datetime.datetime:
+    seconds = float((ttl or "3600s").rstrip("s"))
+    return _now() + datetime.timedelta(seconds=seconds)
+
+
+def _content_text(content) -> str:
+    if content is None:
+        return ""
+    if isinstance(content, str):
+        return content
+    parts = getattr(content, "parts", None) or []
+    return "".join(part.text or "" for part in parts)
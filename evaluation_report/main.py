@@ -1,4 +1,5 @@
 # main.py
+import argparse
 import logging
 from google import genai
 from google.genai import types
@@ -41,6 +42,7 @@ def call_gemini_api(system_prompt: str, content: str) -> str:
 def main():
     """메인 실행 함수"""
     logger.info("프로세스 시작...")
+    app_config.validate_api_settings()
 
     # 1. 시스템 프롬프트 로드
     try:
@@ -97,4 +99,19 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="계획서/보고서 평가")
+    parser.add_argument(
+        "--watch",
+        nargs="?",
+        const=app_config.WATCH_FOLDER_PATH,
+        metavar="DIR",
+        help="폴더를 감시하며 새로 들어온 계획서/보고서를 평가 (기본: WATCH_FOLDER_PATH)",
+    )
+    args = parser.parse_args()
+
+    if args.watch:
+        import watch_daemon
+
+        watch_daemon.run_watch_daemon(args.watch)
+    else:
+        main()
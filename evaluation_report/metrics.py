@@ -0,0 +1,274 @@
+# metrics.py
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+from typing import Callable
+
+# 지연 시간 히스토그램 기본 구간(초)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labelnames: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labelnames: tuple = ()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def header(self) -> list[str]:
+        return [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    """단조 증가 카운터"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labelnames: tuple = ()):
+        super().__init__(name, help_text, labelnames)
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> list[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return self.header() + [
+            f"{self.name}{_format_labels(self.labelnames, key)} {value}" for key, value in items
+        ]
+
+
+class Gauge(_Metric):
+    """
+    현재 값을 나타내는 게이지입니다.
+    set_function으로 콜백을 등록하면 수집 시점에 값을 계산합니다. (큐 길이 등)
+    """
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str, labelnames: tuple = ()):
+        super().__init__(name, help_text, labelnames)
+        self._values: dict[tuple, float] = {}
+        self._functions: list[Callable[[], dict[tuple, float]]] = []
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def set_function(self, fn: Callable[[], dict[tuple, float]]):
+        """{(라벨 값, ...): 값}을 반환하는 콜백을 등록합니다."""
+        self._functions.append(fn)
+
+    def render(self) -> list[str]:
+        with self._lock:
+            values = dict(self._values)
+        for fn in self._functions:
+            for key, value in fn().items():
+                values[key] = values.get(key, 0) + value
+        return self.header() + [
+            f"{self.name}{_format_labels(self.labelnames, key)} {value}"
+            for key, value in values.items()
+        ]
+
+
+class Histogram(_Metric):
+    """고정 구간 히스토그램 (관측 1회당 이진 탐색 + 잠금 1회)"""
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help_text: str,
+        labelnames: tuple = (),
+        buckets: tuple = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # 라벨 값 → [구간별 개수..., 합계, 전체 개수]
+        self._values: dict[tuple, list] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [0] * len(self.buckets) + [0.0, 0]
+            if index < len(self.buckets):
+                entry[index] += 1
+            entry[-2] += value
+            entry[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def render(self) -> list[str]:
+        with self._lock:
+            items = [(key, list(entry)) for key, entry in self._values.items()]
+        lines = self.header()
+        for key, entry in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, entry):
+                cumulative += count
+                le = _format_labels(self.labelnames, key, f'le="{bound}"')
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            inf = _format_labels(self.labelnames, key, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{inf} {entry[-1]}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {entry[-2]}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {entry[-1]}")
+        return lines
+
+
+# --- 지표 정의 ---
+REGISTRY: list[_Metric] = []
+
+
+def _register(metric):
+    REGISTRY.append(metric)
+    return metric
+
+
+QUEUE_DEPTH = _register(
+    Gauge("evaluation_queue_depth", "파이프라인 단계별 대기 중인 항목 수", ("stage",))
+)
+IN_FLIGHT_PAIRS = _register(
+    Gauge("evaluation_in_flight_pairs", "처리 중인 계획서/보고서 쌍 수")
+)
+PAIRS_TOTAL = _register(
+    Counter("evaluation_pairs_total", "처리 완료된 쌍 수 (결과 상태별)", ("status",))
+)
+COALESCED_PAIRS = _register(
+    Counter("evaluation_coalesced_pairs_total", "이미 처리 중인 같은 쌍의 결과를 공유한 쌍 수")
+)
+ERRORS_TOTAL = _register(
+    Counter("evaluation_errors_total", "단계/오류 종류별 실패 수", ("stage", "type"))
+)
+SCHEDULER_QUEUE_DEPTH = _register(
+    Gauge(
+        "evaluation_scheduler_queue_depth",
+        "모델 호출 차례를 기다리는 요청 수 (우선순위 클래스/캠퍼스별)",
+        ("priority", "campus"),
+    )
+)
+SCHEDULER_WAIT = _register(
+    Histogram("evaluation_scheduler_wait_seconds", "모델 호출 차례를 받기까지 대기한 시간", ("priority",))
+)
+CIRCUIT_STATE = _register(
+    Gauge("evaluation_circuit_state", "모델 API 회로 상태 (0: closed, 1: half_open, 2: open)")
+)
+CIRCUIT_REJECTED = _register(
+    Counter("evaluation_circuit_rejected_total", "회로가 열려 있어 바로 실패시킨 모델 호출 수")
+)
+DROPPED_PAIRS = _register(
+    Counter(
+        "evaluation_dropped_pairs_total",
+        "모델을 호출하지 않고 중단한 쌍 수 (deadline: 처리 기한 초과, cancelled: 클라이언트 연결 끊김 등으로 요청 취소)",
+        ("reason",),
+    )
+)
+LIMITER_WAIT = _register(
+    Histogram("evaluation_limiter_wait_seconds", "키 풀 슬롯 배정까지 대기한 시간", ("slot",))
+)
+MODEL_LATENCY = _register(
+    Histogram(
+        "evaluation_model_latency_seconds", "모델 호출 지연 시간", ("model", "outcome")
+    )
+)
+HEDGED_CALLS = _register(
+    Counter(
+        "evaluation_hedged_calls_total",
+        "헤지 기준 시간을 넘긴 모델 호출 수 (hedge_won, primary_won, failed, no_budget, no_slot)",
+        ("outcome",),
+    )
+)
+MODEL_FIRST_BYTE = _register(
+    Histogram(
+        "evaluation_model_first_byte_seconds",
+        "모델 호출 후 첫 응답 조각까지의 시간 (mode=stream, 일반 호출은 mode=unary로 전체 응답 시간)",
+        ("model", "mode"),
+    )
+)
+STREAM_ABORTS = _register(
+    Counter(
+        "evaluation_stream_aborts_total",
+        "점진적 파싱을 중단하고 전체 응답으로 처리한 스트리밍 호출 수 (형식 오류)",
+        ("model",),
+    )
+)
+EXTRACTION_SECONDS = _register(
+    Histogram(
+        "evaluation_extraction_seconds", "파일 추출 시간 (이미지/텍스트/중복 제거/콜라주)", ("kind",)
+    )
+)
+EXTRACTION_CACHE = _register(
+    Counter(
+        "evaluation_extraction_cache_total",
+        "파일별 추출 캐시 조회 수 (memory_hit, disk_hit, miss)",
+        ("outcome",),
+    )
+)
+PROXY_REQUESTS = _register(
+    Counter(
+        "evaluation_proxy_requests_total",
+        "Gemini 프록시 요청 수 (hit: 캐시, coalesced: 동시 요청 합류, miss: 모델 호출, error: 실패,"
+        " rate_limited: 클라이언트 한도 초과)",
+        ("outcome",),
+    )
+)
+DB_LATENCY = _register(
+    Histogram(
+        "evaluation_db_latency_seconds",
+        "DB 함수 실행 시간",
+        ("operation",),
+        buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1),
+    )
+)
+
+
+def error_type(error: BaseException) -> str:
+    """오류 종류 라벨 (API 오류는 상태 코드 포함)"""
+    code = getattr(error, "code", None)
+    name = type(error).__name__
+    return f"{name}_{code}" if isinstance(code, int) else name
+
+
+def render_prometheus() -> str:
+    """등록된 지표를 Prometheus 텍스트 형식으로 변환합니다."""
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,93 @@
+# near_duplicates.py
+import re
+import zlib
+import hashlib
+import unicodedata
+from typing import TYPE_CHECKING
+
+import app_config
+
+# numpy는 임포트 비용이 커서 실제로 사용하는 함수 안에서 임포트함
+if TYPE_CHECKING:
+    import numpy as np
+
+# MinHash 해시 함수 (a*x + b) mod p 의 소수 (2^61 - 1)
+_MERSENNE_PRIME = (1 << 61) - 1
+# 시드를 고정해야 저장된 서명과 새 서명을 비교할 수 있음
+_SEED = 20250901
+# 한 번에 처리하는 슁글 수 (슁글 수 × 해시 함수 수 크기의 임시 배열 메모리 제한)
+_CHUNK = 2048
+
+_WHITESPACE = re.compile(r"\s+")
+_permutations = None
+
+
+def _get_permutations() -> tuple["np.ndarray", "np.ndarray"]:
+    global _permutations
+    if _permutations is None:
+        import numpy as np
+
+        rng = np.random.default_rng(_SEED)
+        _permutations = (
+            rng.integers(1, 1 << 32, size=app_config.MINHASH_NUM_PERM, dtype=np.uint64),
+            rng.integers(0, 1 << 32, size=app_config.MINHASH_NUM_PERM, dtype=np.uint64),
+        )
+    return _permutations
+
+
+def _shingles(text: str, size: int) -> set[int]:
+    """공백을 정규화한 글자 단위 size-gram의 crc32 해시 집합"""
+    normalized = _WHITESPACE.sub(" ", unicodedata.normalize("NFC", text)).strip().lower()
+    if len(normalized) <= size:
+        return {zlib.crc32(normalized.encode("utf-8"))} if normalized else set()
+    return {
+        zlib.crc32(normalized[i : i + size].encode("utf-8"))
+        for i in range(len(normalized) - size + 1)
+    }
+
+
+def text_signature(text: str) -> "np.ndarray | None":
+    """텍스트의 MinHash 서명 (uint64 × MINHASH_NUM_PERM), 텍스트가 비어 있으면 None"""
+    import numpy as np
+
+    shingles = _shingles(text, app_config.MINHASH_SHINGLE_SIZE)
+    if not shingles:
+        return None
+    a, b = _get_permutations()
+    values = np.fromiter(shingles, dtype=np.uint64, count=len(shingles))
+    signature = np.full(len(a), _MERSENNE_PRIME, dtype=np.uint64)
+    for start in range(0, len(values), _CHUNK):
+        chunk = values[start : start + _CHUNK, None]
+        # a, x < 2^32 이므로 a*x + b는 uint64 범위 안에서 계산됨
+        hashed = (chunk * a + b) % _MERSENNE_PRIME
+        np.minimum(signature, hashed.min(axis=0), out=signature)
+    return signature
+
+
+def band_buckets(signature: "np.ndarray") -> list[int]:
+    """
+    LSH 밴드별 버킷 값 목록 (밴드 i의 행들을 해시한 부호 있는 64비트 정수, SQLite INTEGER 범위)
+    자카드 유사도가 높은 두 서명은 적어도 한 밴드의 버킷이 같을 확률이 높음
+    """
+    bands = app_config.MINHASH_BANDS
+    rows = len(signature) // bands
+    raw = signature.tobytes()
+    width = rows * signature.itemsize
+    return [
+        int.from_bytes(
+            hashlib.blake2b(raw[i * width : (i + 1) * width], digest_size=8).digest(),
+            "big",
+            signed=True,
+        )
+        for i in range(bands)
+    ]
+
+
+def similarity(signature: "np.ndarray", other: bytes) -> float:
+    """저장된 서명(bytes)과의 추정 자카드 유사도 (길이가 다르면 0)"""
+    import numpy as np
+
+    other_signature = np.frombuffer(other, dtype=np.uint64)
+    if len(other_signature) != len(signature):
+        return 0.0
+    return float(np.mean(signature == other_signature))
@@ -0,0 +1,505 @@
+# pipeline.py
+import time
+import asyncio
+import logging
+from typing import Awaitable, Callable, Optional
+
+import app_config
+import metrics
+from profiler import profiler
+from analysis_service import AnalysisService
+from gemini_service import prompt_version
+from key_pool import DeadlineExceeded
+
+logger = logging.getLogger(__name__)
+
+# 병합된 쌍의 결과 상태 -> 합류한 작업에 발행할 최종 진행 이벤트
+FOLLOWER_STAGES = {"success": "saved", "deferred": "deferred", "review": "review"}
+
+
+class ByteBudget:
+    """
+    파이프라인 전체가 동시에 메모리에 들고 있을 수 있는 바이트 예산입니다.
+    예산이 부족하면 acquire가 대기하여 앞 단계에 배압(backpressure)을 겁니다.
+    """
+
+    def __init__(self, limit_bytes: int):
+        self.limit_bytes = limit_bytes
+        self.in_use = 0
+        self._cond = asyncio.Condition()
+
+    async def acquire(self, n: int) -> int:
+        """n 바이트를 예약하고 실제 예약된 양을 반환합니다. (예산보다 큰 요청은 예산 전체로 제한)"""
+        n = max(0, min(n, self.limit_bytes))
+        async with self._cond:
+            await self._cond.wait_for(lambda: self.in_use + n <= self.limit_bytes)
+            self.in_use += n
+        return n
+
+    async def release(self, n: int):
+        if n <= 0:
+            return
+        async with self._cond:
+            self.in_use = max(0, self.in_use - n)
+            self._cond.notify_all()
+
+
+class EvaluationPipeline:
+    """
+    추출 → 프롬프트 구성 → 모델 호출 → 저장 단계를 제한된 크기의 큐로 연결한 파이프라인입니다.
+    단계별 워커 수와 전역 바이트 예산으로 동시에 메모리에 올라오는 쌍의 수를 제한하므로
+    배치 크기와 관계없이 메모리 사용량이 일정하게 유지됩니다.
+    """
+
+    def __init__(
+        self,
+        analysis_service: AnalysisService,
+        extract_workers: int = app_config.PIPELINE_EXTRACT_WORKERS,
+        prepare_workers: int = app_config.PIPELINE_PREPARE_WORKERS,
+        model_workers: int = app_config.PIPELINE_MODEL_WORKERS,
+        persist_workers: int = app_config.PIPELINE_PERSIST_WORKERS,
+        queue_size: int = app_config.PIPELINE_QUEUE_SIZE,
+        memory_budget_bytes: int = app_config.PIPELINE_MEMORY_BUDGET_MB * 1024 * 1024,
+    ):
+        self.analysis_service = analysis_service
+        self.extract_workers = extract_workers
+        self.prepare_workers = prepare_workers
+        self.model_workers = model_workers
+        self.persist_workers = persist_workers
+        self.queue_size = queue_size
+        # 여러 배치가 동시에 실행되어도 예산은 프로세스 전체에서 공유
+        self.budget = ByteBudget(memory_budget_bytes)
+        # 실행 중인 배치들의 단계별 큐 (지표 수집 시 길이를 합산)
+        self._active_queues: list[dict[str, asyncio.Queue]] = []
+        # 처리 중인 쌍: 병합 키 -> 결과 Future (같은 쌍이 동시에 들어오면 먼저 시작한 처리 결과를 공유)
+        self._in_flight: dict[str, asyncio.Future] = {}
+        metrics.QUEUE_DEPTH.set_function(self._queue_depths)
+
+    @staticmethod
+    def _coalesce_key(
+        pair: tuple, version: str, result_id: Optional[int], allow_review: bool
+    ) -> Optional[str]:
+        """
+        쌍 병합 키: 매칭 키 + 계획서/보고서 내용 해시 + 프롬프트 버전 (+ 덮어쓸 결과 ID, 검토 승인 여부)
+        매칭 키를 포함하므로 다른 팀이 같은 파일을 낸 경우는 병합하지 않음 (결과 행이 팀별로 남아야 함)
+        내용 해시를 모르는 입력(저장소를 거치지 않은 업로드 파일)은 None
+        """
+        key, plan_file, report_file = pair
+        hashes = [getattr(f, "sha256", None) if f else "-" for f in (plan_file, report_file)]
+        if None in hashes:
+            return None
+        return f"{key}|{hashes[0]}|{hashes[1]}|{version}|{result_id}|{int(allow_review)}"
+
+    def _queue_depths(self) -> dict[tuple, float]:
+        depths: dict[tuple, float] = {
+            (stage,): 0 for stage in ("extract", "prepare", "model", "persist")
+        }
+        for queues in self._active_queues:
+            for stage, queue in queues.items():
+                depths[(stage,)] += queue.qsize()
+        return depths
+
+    async def run(
+        self,
+        pairs: list[tuple],
+        system_prompt: str,
+        job_id: Optional[str] = None,
+        result_ids: Optional[dict[str, int]] = None,
+        on_result: Optional[Callable[[dict], Awaitable[None]]] = None,
+        allow_review: bool = True,
+        priority: str = "bulk",
+        uploader: Optional[str] = None,
+        deadline: Optional[float] = None,
+    ) -> list[dict]:
+        """
+        (key, plan_file, report_file) 목록을 처리하고 입력 순서대로 결과를 반환합니다.
+        result_ids에 key가 있으면 새 결과를 추가하지 않고 해당 결과를 덮어씁니다. (재분석)
+        on_result는 각 쌍의 처리가 끝날 때마다 호출됩니다.
+        allow_review=False이면 유사 보고서도 검토 대기로 두지 않고 평가합니다. (검토 승인)
+        같은 쌍(내용/프롬프트 버전)이 다른 실행에서 처리 중이면 새로 처리하지 않고 그 결과를 공유합니다.
+        모델 호출 차례는 priority와 캠퍼스(파일명)/uploader(없으면 작업 ID) 공정 분배로 정해집니다.
+        각 쌍은 파이프라인에 들어온(추출 큐에 넣은) 뒤 PAIR_DEADLINE_SECONDS(와 요청의 deadline,
+        time.monotonic 기준) 안에 모델 호출을 시작하지 못하면 호출하지 않고 실패 처리됩니다. 실행이 취소되면 처리 중인 쌍도 함께 취소됩니다.
+        """
+        service = self.analysis_service
+        uploader = uploader or job_id or "-"
+
+        def campus_of(meta: dict) -> str:
+            return service.extract_info_from_filename(meta["target_filename"]).get("campus") or "-"
+
+        # 이 실행이 예약한 메모리 예산 (취소되어 큐에 남은 항목의 예산도 끝에서 돌려줌)
+        held = 0
+
+        async def acquire_budget(n: int) -> int:
+            nonlocal held
+            reserved = await self.budget.acquire(n)
+            held += reserved
+            return reserved
+
+        async def release_budget(n: int):
+            nonlocal held
+            held -= max(0, n)
+            await self.budget.release(n)
+
+        def pair_deadline() -> Optional[float]:
+            if app_config.PAIR_DEADLINE_SECONDS <= 0:
+                return deadline
+            limit = time.monotonic() + app_config.PAIR_DEADLINE_SECONDS
+            return limit if deadline is None else min(limit, deadline)
+
+        def expired(at: Optional[float]) -> bool:
+            return at is not None and time.monotonic() >= at
+
+        async def drop_expired(meta: dict, stage: str):
+            await set_result(
+                meta["key"],
+                service.build_error_result(
+                    meta["key"],
+                    meta["target_filename"],
+                    DeadlineExceeded("처리 기한이 지나 모델을 호출하지 않고 중단했습니다."),
+                    job_id,
+                    stage=stage,
+                ),
+            )
+
+        results: dict[str, dict] = {}
+        result_ids = result_ids or {}
+        in_flight = set()
+        # 이 실행이 먼저 시작한 쌍: 매칭 키 -> 병합 키
+        leaders: dict[str, str] = {}
+
+        async def set_result(key: str, result: dict):
+            results[key] = result
+            coalesce_key = leaders.pop(key, None)
+            if coalesce_key:
+                # 같은 쌍을 기다리는 다른 요청에 결과 전달
+                future = self._in_flight.pop(coalesce_key, None)
+                if future and not future.done():
+                    future.set_result(result)
+            metrics.PAIRS_TOTAL.inc(status=result["status"])
+            profiler.pair_finished()
+            if key in in_flight:
+                in_flight.discard(key)
+                metrics.IN_FLIGHT_PAIRS.dec()
+            if on_result:
+                try:
+                    await on_result(result)
+                except Exception as e:
+                    logger.error(f"[{key}] 결과 콜백 처리 실패: {e}")
+
+        extract_q: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        prepare_q: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        # 묶음 모드에서는 한 번에 묶을 수 있을 만큼 모델 큐에 쌓일 수 있어야 함
+        model_q: asyncio.Queue = asyncio.Queue(
+            maxsize=max(self.queue_size, service.packing_max_pairs)
+            if service.packing_enabled
+            else self.queue_size
+        )
+        persist_q: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+
+        async def follow(key: str, future: asyncio.Future):
+            """다른 요청이 처리 중인 같은 쌍의 결과를 기다려 이 작업의 결과로 사용합니다."""
+            logger.info(f"[{key}] 같은 쌍이 이미 처리 중이므로 그 결과를 기다립니다.")
+            metrics.COALESCED_PAIRS.inc()
+            if service.event_bus:
+                service.event_bus.publish(job_id, "coalesced", key=key)
+            result = await asyncio.shield(future)
+            if result is None:
+                # 먼저 시작한 처리가 결과 없이 중단됨 (실패 이벤트는 build_error_result에서 발행)
+                result = service.build_error_result(
+                    key, None, RuntimeError("병합된 처리가 결과 없이 중단되었습니다."), job_id
+                )
+                await set_result(key, dict(result))
+                return
+            await set_result(key, dict(result))
+            # 먼저 시작한 처리는 자기 작업으로만 진행 이벤트를 발행하므로 이 작업에도 최종 단계를 알림
+            if service.event_bus:
+                stage = FOLLOWER_STAGES.get(result["status"], "failed")
+                service.event_bus.publish(
+                    job_id,
+                    stage,
+                    key=key,
+                    filename=result.get("filename"),
+                    result_id=result.get("result_id"),
+                    error=result.get("error"),
+                )
+
+        async def extract_stage(item):
+            # pair_at: 큐에 넣을 때 정한 쌍의 기한 (추출 대기/추출 시간도 기한에 포함)
+            key, plan_file, report_file, pair_at = item
+            in_flight.add(key)
+            metrics.IN_FLIGHT_PAIRS.inc()
+            if expired(pair_at):
+                # 기한이 추출 차례를 기다리는 동안 지남
+                target = (report_file or plan_file).filename
+                await drop_expired({"key": key, "target_filename": target}, "extract")
+                return
+            # 원본 파일 크기의 2배를 추출 중 메모리 사용량으로 추정하여 예약
+            estimate = 2 * sum(getattr(f, "size", None) or 0 for f in (plan_file, report_file) if f)
+            reserved = await acquire_budget(estimate)
+            try:
+                extracted = await service.extract_pair(key, plan_file, report_file, job_id)
+            except Exception as e:
+                await release_budget(reserved)
+                target = (report_file or plan_file).filename
+                await set_result(
+                    key, service.build_error_result(key, target, e, job_id, stage="extract")
+                )
+                return
+            if extracted.get("status") == "error":
+                await release_budget(reserved)
+                await set_result(key, extracted)
+                return
+            extracted["result_id"] = result_ids.get(key)
+            extracted["deadline"] = pair_at
+            try:
+                review = await service.check_near_duplicates(key, extracted, job_id, allow_review)
+            except Exception as e:
+                # 유사 보고서 조회 실패는 평가를 막지 않음
+                logger.error(f"[{key}] 유사 보고서 조회 실패: {e}")
+                review = None
+            if review:
+                await release_budget(reserved)
+                await set_result(key, review)
+                return
+            await prepare_q.put((extracted, reserved))
+
+        async def prepare_stage(item):
+            extracted, reserved = item
+            key = extracted["key"]
+            if expired(extracted["deadline"]):
+                await release_budget(reserved)
+                await drop_expired(extracted, "prepare")
+                return
+            try:
+                prepared = service.prepare_api_contents(key, extracted, job_id)
+            except Exception as e:
+                await release_budget(reserved)
+                await set_result(
+                    key,
+                    service.build_error_result(
+                        key, extracted["target_filename"], e, job_id, stage="prepare"
+                    ),
+                )
+                return
+            # 전송할 페이로드만 남기고, 나머지 이미지/원문 텍스트는 여기서 놓아줌
+            meta = {k: v for k, v in extracted.items() if k not in ("images", "combined_text")}
+            surplus = reserved - prepared["payload_bytes"]
+            if surplus > 0:
+                await release_budget(surplus)
+                reserved -= surplus
+            await model_q.put(
+                (meta, prepared["api_contents"], reserved, prepared["estimated_tokens"])
+            )
+
+        async def model_stage(batch):
+            # 기다리는 동안 기한이 지난 쌍은 호출하지 않고 버림
+            live = []
+            for item in batch:
+                if expired(item[0]["deadline"]):
+                    await release_budget(item[2])
+                    await drop_expired(item[0], "model")
+                else:
+                    live.append(item)
+            batch = live
+            if not batch:
+                return
+            if len(batch) == 1:
+                await model_single(batch[0])
+                return
+
+            keys = [meta["key"] for meta, _, _, _ in batch]
+            try:
+                packed = service.build_packed_contents(
+                    [(meta["key"], api_contents) for meta, api_contents, _, _ in batch]
+                )
+                text = await service.call_model_packed(
+                    keys,
+                    system_prompt,
+                    packed,
+                    job_id,
+                    priority=priority,
+                    campus=campus_of(batch[0][0]),
+                    uploader=uploader,
+                    deadline=min(
+                        (meta["deadline"] for meta, _, _, _ in batch if meta["deadline"]),
+                        default=None,
+                    ),
+                )
+                responses = service.split_packed_response(text, keys)
+            except ValueError as e:
+                # 묶음 응답이 요청과 맞지 않으면 각 쌍을 단건 호출로 다시 처리
+                logger.warning(f"[{'+'.join(keys)}] 묶음 응답 불일치, 단건 호출로 대체: {e}")
+                for item in batch:
+                    await model_single(item)
+                return
+            except Exception as e:
+                for meta, _, reserved, _ in batch:
+                    await release_budget(reserved)
+                    await set_result(
+                        meta["key"],
+                        service.build_error_result(
+                            meta["key"], meta["target_filename"], e, job_id, stage="model"
+                        ),
+                    )
+                return
+
+            logger.info(f"[{'+'.join(keys)}] {len(keys)}건을 한 번의 요청으로 평가 완료")
+            for meta, _, reserved, _ in batch:
+                await release_budget(reserved)
+                await persist_q.put((meta, responses[meta["key"]]))
+
+        async def model_single(item):
+            meta, api_contents, reserved, estimated_tokens = item
+            key = meta["key"]
+            if expired(meta["deadline"]):
+                await release_budget(reserved)
+                await drop_expired(meta, "model")
+                return
+            try:
+                text = await service.call_model(
+                    key,
+                    system_prompt,
+                    api_contents,
+                    job_id,
+                    estimated_tokens,
+                    priority=priority,
+                    campus=campus_of(meta),
+                    uploader=uploader,
+                    deadline=meta["deadline"],
+                )
+            except Exception as e:
+                await set_result(
+                    key,
+                    service.build_error_result(
+                        key, meta["target_filename"], e, job_id, stage="model"
+                    ),
+                )
+                return
+            finally:
+                await release_budget(reserved)
+            await persist_q.put((meta, text))
+
+        async def persist_stage(item):
+            meta, text = item
+            result = await service.persist_result(meta["key"], meta, text, job_id)
+            await set_result(meta["key"], result)
+
+        def packable(item) -> bool:
+            return item[3] <= service.packing_small_pair_tokens
+
+        async def model_worker():
+            """모델 큐 워커: 묶음 모드에서는 작은 쌍을 토큰 예산 안에서 모아 한 번에 처리"""
+            loop = asyncio.get_running_loop()
+            carry = None
+            while True:
+                batch = [carry or await model_q.get()]
+                carry = None
+                if service.packing_enabled and packable(batch[0]):
+                    tokens = batch[0][3]
+                    linger_until = loop.time() + service.packing_linger_seconds
+                    while len(batch) < service.packing_max_pairs:
+                        try:
+                            item = model_q.get_nowait()
+                        except asyncio.QueueEmpty:
+                            remaining = linger_until - loop.time()
+                            if remaining <= 0:
+                                break
+                            try:
+                                item = await asyncio.wait_for(model_q.get(), remaining)
+                            except asyncio.TimeoutError:
+                                break
+                        if not packable(item) or tokens + item[3] > service.packing_token_budget:
+                            # 묶을 수 없는 쌍은 다음 차례에 처리
+                            carry = item
+                            break
+                        batch.append(item)
+                        tokens += item[3]
+                try:
+                    await model_stage(batch)
+                except Exception as e:
+                    logger.error(f"파이프라인 모델 단계 처리 중 예기치 못한 오류: {e}")
+                finally:
+                    for _ in batch:
+                        model_q.task_done()
+
+        async def worker(queue: asyncio.Queue, handler):
+            while True:
+                item = await queue.get()
+                try:
+                    await handler(item)
+                except Exception as e:
+                    logger.error(f"파이프라인 단계 처리 중 예기치 못한 오류: {e}")
+                finally:
+                    queue.task_done()
+
+        stages = [
+            (extract_q, extract_stage, self.extract_workers),
+            (prepare_q, prepare_stage, self.prepare_workers),
+            (model_q, model_stage, self.model_workers),
+            (persist_q, persist_stage, self.persist_workers),
+        ]
+        queues = {
+            "extract": extract_q,
+            "prepare": prepare_q,
+            "model": model_q,
+            "persist": persist_q,
+        }
+        self._active_queues.append(queues)
+        workers = [
+            asyncio.create_task(
+                model_worker() if queue is model_q else worker(queue, handler)
+            )
+            for queue, handler, count in stages
+            for _ in range(max(1, count))
+        ]
+
+        # 같은 쌍이 이미 처리 중이면(다른 업로드/재처리/감시 폴더 작업 포함) 새로 처리하지 않고 합류
+        version = prompt_version(system_prompt)
+        to_run, followers = [], []
+        for pair in pairs:
+            coalesce_key = self._coalesce_key(
+                pair, version, result_ids.get(pair[0]), allow_review
+            )
+            future = self._in_flight.get(coalesce_key) if coalesce_key else None
+            if future is not None:
+                followers.append(asyncio.create_task(follow(pair[0], future)))
+                continue
+            if coalesce_key:
+                self._in_flight[coalesce_key] = asyncio.get_running_loop().create_future()
+                leaders[pair[0]] = coalesce_key
+            to_run.append(pair)
+
+        try:
+            for pair in pairs:
+                if service.event_bus:
+                    service.event_bus.publish(job_id, "queued", key=pair[0])
+            # 제한된 큐에 넣으므로, 앞 단계가 밀리면 여기서 자연스럽게 대기
+            for pair in to_run:
+                await extract_q.put((*pair, pair_deadline()))
+            # 각 단계는 다음 큐에 넣은 뒤 task_done 하므로, 순서대로 join하면 전체 완료
+            for queue, _, _ in stages:
+                await queue.join()
+            await asyncio.gather(*followers)
+        finally:
+            for task in workers + followers:
+                task.cancel()
+            await asyncio.gather(*workers, *followers, return_exceptions=True)
+            self._active_queues.remove(queues)
+            if held > 0:
+                # 취소로 큐에 남은 항목이 예약해 둔 예산
+                await self.budget.release(held)
+            # 결과 없이 끝난 쌍을 기다리는 요청이 멈추지 않도록 정리
+            for coalesce_key in leaders.values():
+                future = self._in_flight.pop(coalesce_key, None)
+                if future and not future.done():
+                    future.set_result(None)
+            # 결과 없이 끝난 쌍이 남아 있으면 게이지를 되돌림
+            if in_flight:
+                metrics.IN_FLIGHT_PAIRS.dec(len(in_flight))
+
+        return [
+            results.get(key)
+            or service.build_error_result(key, None, RuntimeError("처리 결과 없음"), job_id)
+            for key, _, _ in pairs
+        ]
@@ -0,0 +1,227 @@
+# profiler.py
+import os
+import sys
+import json
+import time
+import uuid
+import pstats
+import asyncio
+import cProfile
+import logging
+import threading
+import tracemalloc
+from collections import Counter
+from typing import Optional
+
+import app_config
+
+logger = logging.getLogger(__name__)
+
+# 다운로드 가능한 결과 파일
+ARTIFACTS = {
+    "pstats": "profile.pstats",
+    "collapsed": "stacks.collapsed",
+    "tracemalloc": "tracemalloc.txt",
+    "summary": "summary.json",
+}
+
+# 대기 중인 스레드로 보고 샘플에서 제외할 최하단 프레임 (파일명, 함수명)
+_IDLE_LEAVES = {
+    ("threading.py", "wait"),
+    ("selectors.py", "select"),
+    ("queue.py", "get"),
+    ("thread.py", "_worker"),
+}
+
+
+class _StackSampler(threading.Thread):
+    """
+    모든 스레드의 호출 스택을 일정 간격으로 샘플링하여 collapsed stack 형식으로 집계합니다.
+    (asyncio.to_thread로 넘어간 pandas/PIL/SQLite 작업도 포함)
+    """
+
+    def __init__(self, interval: float):
+        super().__init__(name="profile-sampler", daemon=True)
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._stop_event = threading.Event()
+
+    def run(self):
+        own_id = threading.get_ident()
+        names = {}
+        while not self._stop_event.wait(self.interval):
+            if len(names) != threading.active_count():
+                names = {t.ident: t.name for t in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                code = frame.f_code
+                if thread_id == own_id or (
+                    (os.path.basename(code.co_filename), code.co_name) in _IDLE_LEAVES
+                ):
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(
+                        f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+                    )
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, str(thread_id)))
+                self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+class Profiler:
+    """
+    관리자 요청으로 다음 N개 쌍의 처리 또는 지정한 시간 동안만 프로파일을 수집합니다.
+    세션이 없을 때는 쌍 완료 시 None 확인 한 번만 하므로 평소 비용은 거의 없습니다.
+
+    수집 항목:
+    - cProfile (이벤트 루프 스레드: 프롬프트 구성, JSON 파싱, 비동기 흐름) → pstats
+    - 스택 샘플링 (모든 스레드) → 플레임그래프용 collapsed stacks
+    - tracemalloc 스냅샷 → 메모리 할당 상위 위치
+    """
+
+    def __init__(self, output_dir: str, sample_interval: float, top_allocations: int):
+        self.output_dir = output_dir
+        self.sample_interval = sample_interval
+        self.top_allocations = top_allocations
+        self.session: Optional[dict] = None
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    def start(self, pairs: Optional[int] = None, seconds: Optional[float] = None) -> dict:
+        """
+        프로파일 세션을 시작합니다. 이벤트 루프 스레드에서 호출해야 합니다.
+        pairs를 주면 N개 쌍이 끝날 때까지, seconds를 주면 해당 시간 동안 수집합니다.
+        """
+        if self.session is not None:
+            raise RuntimeError(f"이미 진행 중인 프로파일 세션이 있습니다: {self.session['id']}")
+        if not pairs and not seconds:
+            raise ValueError("pairs 또는 seconds 중 하나를 지정해야 합니다.")
+
+        session_id = time.strftime("%Y%m%d-%H%M%S-") + uuid.uuid4().hex[:6]
+        started_tracemalloc = not tracemalloc.is_tracing()
+        if started_tracemalloc:
+            tracemalloc.start(25)
+        sampler = _StackSampler(self.sample_interval)
+        profile = cProfile.Profile()
+
+        self.session = {
+            "id": session_id,
+            "remaining_pairs": pairs,
+            "seconds": seconds,
+            "started_at": time.time(),
+            "profile": profile,
+            "sampler": sampler,
+            "started_tracemalloc": started_tracemalloc,
+        }
+        sampler.start()
+        profile.enable()
+        if seconds:
+            self._timer = asyncio.get_running_loop().call_later(seconds, self.stop)
+        logger.info(f"[profile {session_id}] 프로파일 시작 (pairs={pairs}, seconds={seconds})")
+        return self.status()
+
+    def pair_finished(self):
+        """쌍 하나의 처리가 끝날 때 호출됩니다. (이벤트 루프 스레드)"""
+        session = self.session
+        if session is None or not session["remaining_pairs"]:
+            return
+        session["remaining_pairs"] -= 1
+        if session["remaining_pairs"] <= 0:
+            self.stop()
+
+    def stop(self) -> Optional[dict]:
+        """세션을 끝내고 결과 파일을 저장합니다. (cProfile은 시작한 스레드에서 멈춰야 함)"""
+        session, self.session = self.session, None
+        if session is None:
+            return None
+        if self._timer:
+            self._timer.cancel()
+            self._timer = None
+
+        session["profile"].disable()
+        session["sampler"].stop()
+        snapshot = tracemalloc.take_snapshot()
+        if session["started_tracemalloc"]:
+            tracemalloc.stop()
+
+        session_dir = os.path.join(self.output_dir, session["id"])
+        os.makedirs(session_dir, exist_ok=True)
+        session["profile"].dump_stats(os.path.join(session_dir, ARTIFACTS["pstats"]))
+
+        with open(os.path.join(session_dir, ARTIFACTS["collapsed"]), "w", encoding="utf-8") as f:
+            for stack, count in session["sampler"].stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+        top_stats = snapshot.filter_traces(
+            [tracemalloc.Filter(False, tracemalloc.__file__)]
+        ).statistics("lineno")[: self.top_allocations]
+        with open(os.path.join(session_dir, ARTIFACTS["tracemalloc"]), "w", encoding="utf-8") as f:
+            for stat in top_stats:
+                f.write(f"{stat}\n")
+
+        stats = pstats.Stats(session["profile"])
+        top_functions = sorted(
+            stats.stats.items(), key=lambda item: item[1][3], reverse=True
+        )[:20]
+        summary = {
+            "id": session["id"],
+            "started_at": session["started_at"],
+            "duration_seconds": round(time.time() - session["started_at"], 2),
+            "samples": session["sampler"].samples,
+            "top_cumulative": [
+                {
+                    "function": f"{os.path.basename(file)}:{line}({name})",
+                    "calls": calls,
+                    "cumulative_seconds": round(cumulative, 4),
+                }
+                for (file, line, name), (_, calls, _, cumulative, _) in top_functions
+            ],
+            "top_allocations": [str(stat) for stat in top_stats[:10]],
+        }
+        with open(os.path.join(session_dir, ARTIFACTS["summary"]), "w", encoding="utf-8") as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+
+        logger.info(f"[profile {session['id']}] 프로파일 저장 완료: {session_dir}")
+        return summary
+
+    def status(self) -> dict:
+        """진행 중인 세션과 저장된 결과 목록"""
+        session = self.session
+        saved = (
+            sorted(os.listdir(self.output_dir), reverse=True)
+            if os.path.isdir(self.output_dir)
+            else []
+        )
+        return {
+            "active": {
+                "id": session["id"],
+                "remaining_pairs": session["remaining_pairs"],
+                "seconds": session["seconds"],
+                "elapsed_seconds": round(time.time() - session["started_at"], 1),
+            }
+            if session
+            else None,
+            "saved_sessions": saved,
+        }
+
+    def artifact_path(self, session_id: str, artifact: str) -> str:
+        """저장된 결과 파일 경로 (경로 조작 방지)"""
+        if artifact not in ARTIFACTS or session_id not in self.status()["saved_sessions"]:
+            raise FileNotFoundError(artifact)
+        path = os.path.join(self.output_dir, session_id, ARTIFACTS[artifact])
+        if not os.path.isfile(path):
+            raise FileNotFoundError(path)
+        return path
+
+
+profiler = Profiler(
+    app_config.PROFILE_OUTPUT_PATH,
+    app_config.PROFILE_SAMPLE_INTERVAL,
+    app_config.PROFILE_TOP_ALLOCATIONS,
+)
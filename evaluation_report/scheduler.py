@@ -0,0 +1,165 @@
+# scheduler.py
+import time
+import asyncio
+import logging
+from collections import deque
+from contextlib import asynccontextmanager
+
+import metrics
+from key_pool import DeadlineExceeded
+
+logger = logging.getLogger(__name__)
+
+# 우선순위 클래스 (앞쪽이 먼저): 대화형 재분석/프록시 > 재처리/검토 승인 > 대량 업로드/감시 폴더/미룬 쌍
+PRIORITIES = ("interactive", "normal", "bulk")
+
+
+def parse_weights(raw: str) -> dict[str, float]:
+    """"서울=2,대전=1" 형식의 가중치 설정을 읽습니다. (잘못된 항목은 무시)"""
+    weights = {}
+    for item in raw.split(","):
+        name, _, value = item.partition("=")
+        try:
+            if name.strip() and float(value) > 0:
+                weights[name.strip()] = float(value)
+        except ValueError:
+            logger.warning(f"가중치 설정을 해석할 수 없어 무시합니다: {item}")
+    return weights
+
+
+class _ClassQueue:
+    """
+    한 우선순위 클래스의 대기열입니다. 캠퍼스 간에는 가중 공정 분배, 캠퍼스 안에서는 업로더 간 공정 분배를 합니다.
+    (그룹마다 가상 시각 태그를 두고 가장 작은 태그의 그룹을 골라 1/가중치만큼 늘리는 방식)
+    """
+
+    def __init__(self, campus_weights: dict[str, float]):
+        self.campus_weights = campus_weights
+        # 캠퍼스 -> 업로더 -> 대기 Future 목록
+        self.waiting: dict[str, dict[str, deque]] = {}
+        self.campus_tags: dict[str, float] = {}
+        self.uploader_tags: dict[tuple[str, str], float] = {}
+        # 마지막으로 처리한 태그 (쉬다가 다시 들어온 그룹이 밀린 몫을 한꺼번에 가져가지 않도록 기준으로 사용)
+        self.clock = 0.0
+        self.uploader_clocks: dict[str, float] = {}
+
+    def push(self, campus: str, uploader: str, future: asyncio.Future):
+        uploaders = self.waiting.setdefault(campus, {})
+        if not uploaders:
+            self.campus_tags[campus] = max(self.campus_tags.get(campus, 0.0), self.clock)
+        if uploader not in uploaders:
+            uploaders[uploader] = deque()
+            key = (campus, uploader)
+            self.uploader_tags[key] = max(
+                self.uploader_tags.get(key, 0.0), self.uploader_clocks.get(campus, 0.0)
+            )
+        uploaders[uploader].append(future)
+
+    def pop(self) -> asyncio.Future | None:
+        while self.waiting:
+            campus = min(self.waiting, key=lambda c: self.campus_tags[c])
+            uploaders = self.waiting[campus]
+            uploader = min(uploaders, key=lambda u: self.uploader_tags[(campus, u)])
+            queue = uploaders[uploader]
+            future = queue.popleft()
+            if not queue:
+                del uploaders[uploader]
+            if not uploaders:
+                del self.waiting[campus]
+            if future.done():
+                # 기다리다 취소된 요청은 몫을 쓰지 않고 건너뜀
+                continue
+            self.clock = self.campus_tags[campus]
+            self.campus_tags[campus] += 1 / self.campus_weights.get(campus, 1.0)
+            self.uploader_clocks[campus] = self.uploader_tags[(campus, uploader)]
+            self.uploader_tags[(campus, uploader)] += 1
+            return future
+        return None
+
+    def depths(self) -> dict[str, int]:
+        return {
+            campus: sum(1 for queue in uploaders.values() for f in queue if not f.done())
+            for campus, uploaders in self.waiting.items()
+        }
+
+
+class FairScheduler:
+    """
+    모델 호출 단계 앞에서 동시에 키 풀에 들어가는 호출 수를 permits개로 제한하고,
+    빈자리가 나면 우선순위가 높은 클래스부터, 같은 클래스 안에서는 캠퍼스/업로더 간 공정하게 다음 호출을 고릅니다.
+
+    키 풀은 요청이 들어온 순서대로 RPM 시작 시각을 예약하므로, 모든 호출이 키 풀에 바로 들어가면
+    먼저 들어온 대량 배치의 예약 뒤로 급한 재분석이 밀립니다. 키 풀이 동시에 처리할 수 있는 만큼만
+    들여보내면 예약이 앞으로 쌓이지 않아 급한 호출이 다음 빈자리를 바로 받습니다.
+    """
+
+    def __init__(self, permits: int, campus_weights: dict[str, float] | None = None):
+        self.permits = max(1, permits)
+        self.active = 0
+        self._classes = {p: _ClassQueue(campus_weights or {}) for p in PRIORITIES}
+        metrics.SCHEDULER_QUEUE_DEPTH.set_function(self._queue_depths)
+
+    def _queue_depths(self) -> dict[tuple, float]:
+        return {
+            (priority, campus): depth
+            for priority, queue in self._classes.items()
+            for campus, depth in queue.depths().items()
+        }
+
+    def _has_waiting(self) -> bool:
+        return any(queue.waiting for queue in self._classes.values())
+
+    def _dispatch(self):
+        while self.active < self.permits:
+            for priority in PRIORITIES:
+                future = self._classes[priority].pop()
+                if future is not None:
+                    break
+            else:
+                return
+            self.active += 1
+            future.set_result(None)
+
+    @asynccontextmanager
+    async def slot(
+        self,
+        priority: str = "normal",
+        campus: str = "-",
+        uploader: str = "-",
+        deadline: float | None = None,
+    ):
+        """
+        호출 한 건의 차례를 기다렸다가, 블록이 끝나면 자리를 반납합니다.
+        deadline(time.monotonic 기준)까지 차례가 오지 않으면 DeadlineExceeded를 던집니다.
+        """
+        if priority not in self._classes:
+            priority = "normal"
+        started = time.monotonic()
+        if self.active < self.permits and not self._has_waiting():
+            self.active += 1
+        else:
+            future = asyncio.get_running_loop().create_future()
+            self._classes[priority].push(campus, uploader, future)
+            # wait_for는 차례를 받는 순간 취소가 겹치면 취소를 삼키므로 timeout 사용
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                async with asyncio.timeout(timeout):
+                    try:
+                        await future
+                    except asyncio.CancelledError:
+                        if future.done() and not future.cancelled():
+                            # 자리를 받은 직후 취소됨: 받은 자리를 다음 요청에 넘김
+                            self.active -= 1
+                            self._dispatch()
+                        else:
+                            # 대기열에서는 건너뛰어짐
+                            future.cancel()
+                        raise
+            except TimeoutError:
+                raise DeadlineExceeded("호출 차례를 기다리는 중 처리 기한이 지났습니다.") from None
+        metrics.SCHEDULER_WAIT.observe(time.monotonic() - started, priority=priority)
+        try:
+            yield
+        finally:
+            self.active -= 1
+            self._dispatch()
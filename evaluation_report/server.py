@@ -1,15 +1,40 @@
+import hmac
 import logging
-from fastapi import FastAPI, UploadFile, File, HTTPException, Query
+import json
+import uuid
+from fastapi import (
+    Depends,
+    FastAPI,
+    UploadFile,
+    File,
+    Header,
+    HTTPException,
+    Query,
+    Request,
+)
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import FileResponse, PlainTextResponse, StreamingResponse
 import asyncio
-from typing import List, Optional
+import time
+from typing import List, Literal, Optional
+from pydantic import BaseModel, ConfigDict, Field
 
 # 로컬 모듈 임포트
 import app_config
 import file_utils
 import db_utils
-from gemini_service import GeminiService
+import metrics
+from tracing import tracer
+from profiler import profiler, ARTIFACTS
+from gemini_service import DailyQuotaExhausted, GeminiService
+from circuit_breaker import CircuitOpen
+from gemini_proxy import GeminiProxy, ProxyRateLimited
 from analysis_service import AnalysisService
+from event_bus import EventBus
+from pipeline import EvaluationPipeline
+from blob_store import BlobStore
+from extraction_cache import ExtractionCache
+from job_service import JobService
 
 
 # --- 로깅 설정 ---
@@ -41,8 +66,30 @@ app.add_middleware(
 
 # --- 서비스 초기화 ---
 gemini_service = GeminiService()
-analysis_service = AnalysisService(gemini_service)
+event_bus = EventBus()
+analysis_service = AnalysisService(
+    gemini_service, event_bus, extraction_cache=ExtractionCache.from_config()
+)
+# 모델 단계 워커는 키 풀이 동시에 처리할 수 있는 호출 수보다 하나 많게 유지
+pipeline = EvaluationPipeline(
+    analysis_service,
+    model_workers=max(
+        app_config.PIPELINE_MODEL_WORKERS, gemini_service.key_pool.capacity + 1
+    ),
+)
+blob_store = BlobStore(
+    app_config.UPLOAD_STORE_PATH,
+    app_config.UPLOAD_RETENTION_DAYS,
+    app_config.UPLOAD_STORE_MAX_MB,
+)
+job_service = JobService(pipeline, blob_store, event_bus)
+# study-plan-page의 Gemini 호출 프록시 (평가 파이프라인과 키 풀/속도 제한 공유)
+gemini_proxy = GeminiProxy(gemini_service)
+# 키 풀 배정을 기다리거나 호출 중인 모델 요청 수
+metrics.QUEUE_DEPTH.set_function(lambda: {("model_quota",): gemini_service.pending_calls})
 SYSTEM_PROMPT = "ERROR: PROMPT NOT LOADED"
+# 프록시용 시스템 프롬프트 (prompt_id -> 내용, 시작 시 로드)
+PROXY_PROMPTS: dict[str, str] = {}
 
 
 # --- FastAPI 이벤트 핸들러 (DB 초기화) ---
@@ -50,26 +97,60 @@ SYSTEM_PROMPT = "ERROR: PROMPT NOT LOADED"
 def startup_event():
     global SYSTEM_PROMPT
     logger.info("서버 시작... 시스템 프롬프트 로드 및 DB 초기화 중...")
+    # API 키가 없으면 서버를 시작하지 않음 (임포트 시점이 아니라 시작 시점에 확인)
+    app_config.validate_api_settings()
     try:
         SYSTEM_PROMPT = file_utils.load_system_prompt(app_config.SYSTEM_PROMPT_PATH)
         logger.info("시스템 프롬프트 로드 완료")
     except Exception as e:
         logger.critical(f"서버 시작 실패: 시스템 프롬프트 로드 중 오류 발생 - {e}")
         SYSTEM_PROMPT = "ERROR: PROMPT NOT LOADED"
+    for prompt_id, path in app_config.PROXY_PROMPT_PATHS.items():
+        try:
+            PROXY_PROMPTS[prompt_id] = file_utils.load_system_prompt(path)
+        except Exception as e:
+            # 해당 prompt_id의 프록시 요청만 실패 (평가 서버는 계속 시작)
+            logger.error(f"프록시 프롬프트 '{prompt_id}' 로드 실패: {e}")
 
     db_utils.init_db()
 
 
+def _log_background_failure(task: asyncio.Task):
+    """백그라운드 작업이 예외로 끝나면 기록합니다. (취소는 정상 종료)"""
+    if not task.cancelled() and task.exception():
+        logger.error(f"백그라운드 작업 {task.get_name()} 비정상 종료: {task.exception()!r}")
+
+
+@app.on_event("startup")
+async def start_deferred_scheduler():
+    # 일일 한도 초과로 미룬 쌍을 한도 초기화 이후 자동으로 처리
+    # (작업 참조를 app.state에 보관해야 가비지 컬렉션되지 않음)
+    task = asyncio.create_task(
+        job_service.run_deferred_periodically(SYSTEM_PROMPT, app_config.DEFERRED_POLL_SECONDS),
+        name="deferred-scheduler",
+    )
+    task.add_done_callback(_log_background_failure)
+    app.state.deferred_task = task
+
+
+@app.on_event("shutdown")
+async def stop_deferred_scheduler():
+    task = getattr(app.state, "deferred_task", None)
+    if task and not task.done():
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+
 @app.get("/")
 def read_root():
     return {"message": "Gemini 분석 API 서버"}
 
 
-# --- (수정) 파일 업로드 API ---
-@app.post("/upload-and-analyze")
-async def upload_and_analyze(
-    plan_files: List[UploadFile] = File(...), report_files: List[UploadFile] = File(...)
-):
+def match_pairs(plan_files: list, report_files: list) -> tuple[list[tuple], list, list]:
+    """계획서/보고서를 매칭 키로 짝지어 (쌍 목록, 매칭 불가 계획서, 매칭 불가 보고서)를 반환합니다."""
     plans_map, reports_map = {}, {}
     all_keys = set()
 
@@ -84,36 +165,381 @@ async def upload_and_analyze(
             reports_map[key] = file
             all_keys.add(key)
 
-    tasks = []
-    for key in all_keys:
-        tasks.append(
-            analysis_service.process_single_pair(
-                key,
-                plans_map.get(key),
-                reports_map.get(key),
-                SYSTEM_PROMPT,
-            )
-        )
+    pairs = [(key, plans_map.get(key), reports_map.get(key)) for key in all_keys]
+    unmatchable_plans = [
+        f.filename
+        for f in plan_files
+        if analysis_service.get_matching_key(f.filename) not in all_keys
+    ]
+    unmatchable_reports = [
+        f.filename
+        for f in report_files
+        if analysis_service.get_matching_key(f.filename) not in all_keys
+    ]
+    return pairs, unmatchable_plans, unmatchable_reports
+
+
+# 클라이언트 연결 끊김을 확인하는 주기(초)
+DISCONNECT_POLL_SECONDS = 1.0
+
+
+def request_deadline(timeout_seconds: Optional[float]) -> Optional[float]:
+    """X-Deadline-Seconds 헤더(요청 시점부터 기다릴 수 있는 초)를 time.monotonic 기준 기한으로 변환"""
+    if timeout_seconds is None or timeout_seconds <= 0:
+        return None
+    return time.monotonic() + timeout_seconds
 
-    # 모든 작업 비동기 실행
-    processing_results = await asyncio.gather(*tasks)
+
+async def cancel_on_disconnect(request: Request, coro):
+    """
+    처리 코루틴을 실행하면서 클라이언트 연결이 끊기면 취소합니다.
+    (끊긴 요청의 쌍이 계속 모델 호출 차례를 차지하지 않도록, 취소된 쌍은 실패 쌍 재처리로 다시 실행)
+    """
+    task = asyncio.create_task(coro)
+    if not app_config.CANCEL_ON_DISCONNECT:
+        return await task
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_SECONDS)
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                logger.warning(f"클라이언트 연결이 끊겨 처리를 취소합니다: {request.url.path}")
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+                # 받을 클라이언트가 없으므로 응답 내용은 의미 없음 (499: Client Closed Request)
+                raise HTTPException(status_code=499, detail="클라이언트 연결이 끊겨 처리를 취소했습니다.")
+    except asyncio.CancelledError:
+        task.cancel()
+        raise
+
+
+async def analyze_stored_files(
+    job_id: str,
+    plan_files: list,
+    report_files: list,
+    extra_summary: Optional[dict] = None,
+    uploader: Optional[str] = None,
+    deadline: Optional[float] = None,
+) -> dict:
+    """
+    저장소에 보관된 계획서/보고서를 매칭하여 작업으로 등록하고 분석합니다.
+    uploader가 같은 업로드끼리는 모델 호출 차례를 나눠 받습니다. (없으면 작업 단위)
+    """
+    pairs, unmatchable_plans, unmatchable_reports = match_pairs(plan_files, report_files)
+    pair_rows = await job_service.create_job(job_id, pairs)
+
+    # 단계별 파이프라인으로 실행 (제한된 큐와 메모리 예산으로 배압 적용)
+    processing_results = await job_service.run_pairs(
+        job_id, pair_rows, SYSTEM_PROMPT, uploader=uploader, deadline=deadline
+    )
+    deferred = [r for r in processing_results if r["status"] == "deferred"]
 
     summary = {
         "total_plans": len(plan_files),
         "total_reports": len(report_files),
         "processed_count": len(processing_results),
-        "unmatchable_plans": [
-            f.filename
-            for f in plan_files
-            if analysis_service.get_matching_key(f.filename) not in all_keys
-        ],
-        "unmatchable_reports": [
-            f.filename
-            for f in report_files
-            if analysis_service.get_matching_key(f.filename) not in all_keys
-        ],
+        "unmatchable_plans": unmatchable_plans,
+        "unmatchable_reports": unmatchable_reports,
+        # 일일 요청 한도 초과로 미룬 쌍과 전체 완료 예상 시각
+        "deferred_count": len(deferred),
+        "expected_completion_at": max(
+            (r.get("expected_completion_at") or r["scheduled_at"] for r in deferred),
+            default=None,
+        ),
+        **(extra_summary or {}),
     }
-    return {"summary": summary, "results": processing_results}
+    return {"job_id": job_id, "summary": summary, "results": processing_results}
+
+
+# --- (수정) 파일 업로드 API ---
+@app.post("/upload-and-analyze")
+async def upload_and_analyze(
+    request: Request,
+    plan_files: List[UploadFile] = File(...),
+    report_files: List[UploadFile] = File(...),
+    job_id: Optional[str] = Query(None),
+    x_uploader: Optional[str] = Header(None),
+    x_deadline_seconds: Optional[float] = Header(None),
+):
+    # 진행 상황 구독(/jobs/{job_id}/events)을 위해 클라이언트가 job_id를 미리 정할 수 있음
+    job_id = job_id or uuid.uuid4().hex
+
+    # 업로드 파일은 해시 기반 저장소에 보관 (실패 쌍 재처리 시 재업로드 불필요)
+    stored_plans = [await job_service.store_upload(f) for f in plan_files]
+    stored_reports = [await job_service.store_upload(f) for f in report_files]
+    return await cancel_on_disconnect(
+        request,
+        analyze_stored_files(
+            job_id,
+            stored_plans,
+            stored_reports,
+            uploader=x_uploader,
+            deadline=request_deadline(x_deadline_seconds),
+        ),
+    )
+
+
+# --- ZIP 업로드 API (ZIP 하나 또는 계획서 ZIP + 보고서 ZIP) ---
+@app.post("/upload-zip-and-analyze")
+async def upload_zip_and_analyze(
+    request: Request,
+    archive: Optional[UploadFile] = File(None),
+    plan_archive: Optional[UploadFile] = File(None),
+    report_archive: Optional[UploadFile] = File(None),
+    job_id: Optional[str] = Query(None),
+    x_uploader: Optional[str] = Header(None),
+    x_deadline_seconds: Optional[float] = Header(None),
+):
+    if not archive and not (plan_archive and report_archive):
+        raise HTTPException(
+            status_code=400,
+            detail="archive 하나 또는 plan_archive와 report_archive를 함께 업로드해주세요.",
+        )
+    job_id = job_id or uuid.uuid4().hex
+
+    plan_files, report_files, unclassified = [], [], []
+    try:
+        if archive:
+            # 하나의 ZIP: 경로/파일명의 '계획서'/'보고서' 키워드로 구분
+            stored = await job_service.store_zip(archive)
+            plan_files += stored["plan"]
+            report_files += stored["report"]
+            unclassified += stored["unclassified"]
+        if plan_archive and report_archive:
+            plan_files += (await job_service.store_zip(plan_archive, "plan"))["plan"]
+            report_files += (await job_service.store_zip(report_archive, "report"))[
+                "report"
+            ]
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return await cancel_on_disconnect(
+        request,
+        analyze_stored_files(
+            job_id,
+            plan_files,
+            report_files,
+            {"unclassified_files": unclassified},
+            uploader=x_uploader,
+            deadline=request_deadline(x_deadline_seconds),
+        ),
+    )
+
+
+# --- 사전 비용/시간 추정 API (드라이런: 추출/토큰 추정만 하고 모델은 호출하지 않음) ---
+@app.post("/estimate")
+async def estimate_batch(
+    plan_files: Optional[List[UploadFile]] = File(None),
+    report_files: Optional[List[UploadFile]] = File(None),
+):
+    plan_files, report_files = plan_files or [], report_files or []
+    if not plan_files and not report_files:
+        raise HTTPException(status_code=400, detail="추정할 계획서/보고서 파일을 업로드해주세요.")
+    pairs, unmatchable_plans, unmatchable_reports = match_pairs(plan_files, report_files)
+    estimate = await analysis_service.estimate_batch(
+        pairs, SYSTEM_PROMPT, concurrency=app_config.PIPELINE_EXTRACT_WORKERS
+    )
+    return {
+        **estimate,
+        "unmatchable_plans": unmatchable_plans,
+        "unmatchable_reports": unmatchable_reports,
+    }
+
+
+# --- 토큰 사용량 API (컨텍스트 캐시 절감량 포함) ---
+@app.get("/usage")
+async def get_usage():
+    return {**gemini_service.get_usage_stats(), "proxy": gemini_proxy.stats()}
+
+
+# --- Gemini 프록시 API (study-plan-page가 브라우저의 API 키 대신 사용) ---
+class ProxyGenerateRequest(BaseModel):
+    # 시스템 프롬프트는 서버에 등록된 것(PROXY_PROMPT_PATHS)의 ID로만 지정 (system_prompt 등 다른 필드는 거부)
+    model_config = ConfigDict(extra="forbid")
+
+    prompt: str = Field(..., min_length=1, max_length=app_config.PROXY_MAX_PROMPT_CHARS)
+    prompt_id: Literal[tuple(app_config.PROXY_PROMPT_PATHS)] = "evaluation"
+
+
+def require_proxy_token(x_proxy_token: Optional[str] = Header(None)):
+    if not app_config.PROXY_TOKEN:
+        return
+    if not x_proxy_token or not hmac.compare_digest(x_proxy_token, app_config.PROXY_TOKEN):
+        raise HTTPException(status_code=403, detail="프록시 호출 권한이 없습니다.")
+
+
+def proxy_client(request: Request) -> str:
+    """프록시 호출 한도를 셀 클라이언트 (PROXY_CLIENT_HEADER가 있으면 그 헤더, 없으면 접속 IP)"""
+    if app_config.PROXY_CLIENT_HEADER:
+        value = request.headers.get(app_config.PROXY_CLIENT_HEADER)
+        if value:
+            # X-Forwarded-For의 앞부분은 클라이언트가 조작할 수 있으므로 마지막 프록시가 덧붙인 주소 사용
+            return value.split(",")[-1].strip()
+    return request.client.host if request.client else "-"
+
+
+@app.post("/proxy/generate", dependencies=[Depends(require_proxy_token)])
+async def proxy_generate(request: ProxyGenerateRequest, http_request: Request):
+    system_prompt = PROXY_PROMPTS.get(request.prompt_id)
+    if system_prompt is None:
+        raise HTTPException(
+            status_code=503, detail=f"프록시 프롬프트 '{request.prompt_id}'를 불러오지 못했습니다."
+        )
+    try:
+        return await gemini_proxy.generate(
+            system_prompt, request.prompt, client=proxy_client(http_request)
+        )
+    except ProxyRateLimited as e:
+        raise HTTPException(
+            status_code=429,
+            detail=str(e),
+            headers={"Retry-After": str(max(1, int(e.retry_after + 0.999)))},
+        )
+    except DailyQuotaExhausted as e:
+        raise HTTPException(
+            status_code=429,
+            detail=str(e),
+            headers={"Retry-After": str(max(1, int(e.reset_at - time.time())))},
+        )
+    except CircuitOpen as e:
+        raise HTTPException(
+            status_code=503,
+            detail=str(e),
+            headers={"Retry-After": str(max(1, int(e.retry_after)))},
+        )
+    except Exception as e:
+        raise HTTPException(status_code=502, detail=f"모델 호출 실패: {e}")
+
+
+# --- 키/모델 풀 사용률 API ---
+@app.get("/key-pool")
+async def get_key_pool_stats():
+    return {
+        "slots": gemini_service.key_pool.stats(),
+        "circuit": gemini_service.breaker.stats(),
+        "hedging": gemini_service.hedge_policy.stats() if gemini_service.hedge_policy else None,
+    }
+
+
+# --- 관측 API (Prometheus 지표, 쌍 단위 트레이스) ---
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    return PlainTextResponse(
+        metrics.render_prometheus(), media_type="text/plain; version=0.0.4"
+    )
+
+
+@app.get("/traces")
+async def get_traces(job_id: Optional[str] = None, key: Optional[str] = None):
+    if not tracer.enabled:
+        raise HTTPException(status_code=404, detail="트레이스가 비활성화되어 있습니다. (TRACE_ENABLED)")
+    return {"spans": tracer.get_spans(job_id, key)}
+
+
+# --- 관리자 API: 프로파일링 (X-Admin-Token 헤더 필요) ---
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    if not app_config.ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="관리자 API가 비활성화되어 있습니다.")
+    if not x_admin_token or not hmac.compare_digest(x_admin_token, app_config.ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="관리자 권한이 없습니다.")
+
+
+@app.post("/admin/profile", dependencies=[Depends(require_admin)])
+async def start_profile(
+    pairs: Optional[int] = Query(None, ge=1), seconds: Optional[float] = Query(None, gt=0)
+):
+    """다음 N개 쌍(pairs) 또는 지정한 시간(seconds) 동안 프로파일을 수집합니다."""
+    try:
+        return profiler.start(pairs=pairs, seconds=seconds)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+
+@app.get("/admin/profile", dependencies=[Depends(require_admin)])
+async def get_profile_status():
+    return profiler.status()
+
+
+@app.delete("/admin/profile", dependencies=[Depends(require_admin)])
+async def stop_profile():
+    """진행 중인 세션을 바로 끝내고 결과를 저장합니다."""
+    summary = profiler.stop()
+    if summary is None:
+        raise HTTPException(status_code=404, detail="진행 중인 프로파일 세션이 없습니다.")
+    return summary
+
+
+@app.get(
+    "/admin/profile/{session_id}/{artifact}", dependencies=[Depends(require_admin)]
+)
+async def download_profile_artifact(session_id: str, artifact: str):
+    """저장된 결과 다운로드 (artifact: pstats, collapsed, tracemalloc, summary)"""
+    try:
+        path = profiler.artifact_path(session_id, artifact)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="프로파일 결과를 찾을 수 없습니다.")
+    return FileResponse(path, filename=f"{session_id}-{ARTIFACTS[artifact]}")
+
+
+# --- 작업 상태 조회 API ---
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    pairs = await asyncio.to_thread(db_utils.get_job_pairs, job_id)
+    if not pairs:
+        raise HTTPException(status_code=404, detail=f"작업 {job_id}를 찾을 수 없습니다.")
+    return {"job_id": job_id, "pairs": pairs}
+
+
+# --- 실패 쌍 재처리 API (저장된 입력 파일 사용, 재업로드 불필요) ---
+@app.post("/jobs/{job_id}/retry-failed")
+async def retry_failed_pairs(
+    job_id: str, request: Request, x_deadline_seconds: Optional[float] = Header(None)
+):
+    results = await cancel_on_disconnect(
+        request,
+        job_service.retry_failed(
+            job_id, SYSTEM_PROMPT, request_deadline(x_deadline_seconds)
+        ),
+    )
+    return {"job_id": job_id, "retried_count": len(results), "results": results}
+
+
+# --- 유사 보고서 검토 승인 API (검토 대기 쌍을 모델로 평가) ---
+@app.post("/jobs/{job_id}/approve-review")
+async def approve_review_pairs(
+    job_id: str, request: Request, x_deadline_seconds: Optional[float] = Header(None)
+):
+    results = await cancel_on_disconnect(
+        request,
+        job_service.approve_review(
+            job_id, SYSTEM_PROMPT, request_deadline(x_deadline_seconds)
+        ),
+    )
+    return {"job_id": job_id, "approved_count": len(results), "results": results}
+
+
+# --- 진행 상황 스트리밍 API (Server-Sent Events) ---
+@app.get("/jobs/{job_id}/events")
+async def stream_job_events(job_id: str, request: Request):
+    async def event_stream():
+        # 프록시가 연결을 끊지 않도록 15초마다 하트비트(주석 라인) 전송
+        async for event in event_bus.subscribe(job_id, heartbeat_seconds=15):
+            if await request.is_disconnected():
+                break
+            if event is None:
+                yield ": keep-alive\n\n"
+                continue
+            data = json.dumps(event, ensure_ascii=False)
+            yield f"event: {event['type']}\ndata: {data}\n\n"
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 # --- 게시판 목록 API ---
@@ -154,6 +580,22 @@ async def get_result_detail(result_id: int):
         raise HTTPException(status_code=500, detail=f"Internal server error: {e}")
 
 
+# --- 재분석 API (저장된 입력 파일로 다시 분석하여 같은 결과 ID에 덮어씀) ---
+@app.post("/results/{result_id}/reanalyze")
+async def reanalyze_result(
+    result_id: int, request: Request, x_deadline_seconds: Optional[float] = Header(None)
+):
+    try:
+        return await cancel_on_disconnect(
+            request,
+            job_service.reanalyze_result(
+                result_id, SYSTEM_PROMPT, request_deadline(x_deadline_seconds)
+            ),
+        )
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+
 if __name__ == "__main__":
     import uvicorn
 
@@ -0,0 +1,114 @@
+# shared_limiter.py
+import sqlite3
+import logging
+
+from key_pool import reserve_window
+
+logger = logging.getLogger(__name__)
+
+
+class SharedRateLimiter:
+    """
+    SQLite 파일 하나로 같은 호스트의 여러 워커 프로세스가 키/모델 슬롯별
+    RPM 간격, TPM 토큰 버킷, 쿨다운 상태를 공유합니다.
+    예약 한 번은 짧은 쓰기 트랜잭션(BEGIN IMMEDIATE) 하나이므로 조율 비용이 작습니다.
+    (시각은 프로세스 간에 비교할 수 있도록 벽시계 time.time() 기준)
+    """
+
+    def __init__(self, path: str, busy_timeout: float = 5.0):
+        self.path = path
+        self.busy_timeout = busy_timeout
+        conn = self._connect()
+        # WAL 모드는 DB 파일에 기록되므로 한 번만 설정하면 됨
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS rate_slots (
+                slot_id TEXT PRIMARY KEY,
+                next_available REAL NOT NULL DEFAULT 0,
+                tokens REAL,
+                tokens_updated REAL NOT NULL DEFAULT 0,
+                cooldown_until REAL NOT NULL DEFAULT 0
+            )
+            """
+        )
+        conn.close()
+
+    def _connect(self) -> sqlite3.Connection:
+        # 자동 커밋 모드로 열고 트랜잭션은 직접 관리
+        conn = sqlite3.connect(self.path, timeout=self.busy_timeout, isolation_level=None)
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def reserve(
+        self,
+        slot_id: str,
+        now: float,
+        min_interval: float,
+        estimated_tokens: int,
+        tpm: int,
+    ) -> tuple[float, float]:
+        """공유 상태에서 호출 하나를 예약하고 (시작 시각, 다음 시작 가능 시각)을 반환합니다."""
+        conn = self._connect()
+        try:
+            # 쓰기 잠금을 먼저 잡아 다른 프로세스와 읽기-수정-쓰기가 겹치지 않게 함
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT next_available, tokens, tokens_updated FROM rate_slots WHERE slot_id = ?",
+                (slot_id,),
+            ).fetchone()
+            next_available, tokens, tokens_updated = row or (0.0, None, 0.0)
+            start_at, next_available, tokens, tokens_updated = reserve_window(
+                next_available,
+                tokens,
+                tokens_updated,
+                now,
+                min_interval,
+                estimated_tokens,
+                tpm,
+            )
+            conn.execute(
+                """
+                INSERT INTO rate_slots (slot_id, next_available, tokens, tokens_updated)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT(slot_id) DO UPDATE SET
+                    next_available = excluded.next_available,
+                    tokens = excluded.tokens,
+                    tokens_updated = excluded.tokens_updated
+                """,
+                (slot_id, next_available, tokens, tokens_updated),
+            )
+            conn.execute("COMMIT")
+            return start_at, next_available
+        except Exception:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def cool_down(self, slot_id: str, until: float):
+        """슬롯을 until(벽시계 시각)까지 쉬게 합니다. (이미 더 길게 쉬는 중이면 유지)"""
+        conn = self._connect()
+        try:
+            conn.execute(
+                """
+                INSERT INTO rate_slots (slot_id, cooldown_until) VALUES (?, ?)
+                ON CONFLICT(slot_id) DO UPDATE SET
+                    cooldown_until = MAX(cooldown_until, excluded.cooldown_until)
+                """,
+                (slot_id, until),
+            )
+        finally:
+            conn.close()
+
+    def snapshot(self) -> dict[str, tuple[float, float]]:
+        """모든 슬롯의 {slot_id: (다음 시작 가능 시각, 쿨다운 종료 시각)}"""
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                "SELECT slot_id, next_available, cooldown_until FROM rate_slots"
+            ).fetchall()
+        finally:
+            conn.close()
+        return {slot_id: (next_available, cooldown) for slot_id, next_available, cooldown in rows}
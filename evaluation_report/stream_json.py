@@ -0,0 +1,137 @@
+# stream_json.py
+import re
+import json
+
+# 최상위 값의 시작 / 문자열 밖에서 의미가 있는 문자 / 문자열 안에서 의미가 있는 문자
+_ROOT = re.compile(r"[{\[]")
+_STRUCTURAL = re.compile(r'[{}\[\]",]')
+_IN_STRING = re.compile(r'["\\]')
+_CLOSERS = {"{": "}", "[": "]"}
+# 최상위 배열로 볼 '[' 다음 문자 (그 밖이면 "[분석 결과]" 같은 설명문의 대괄호로 보고 건너뜀)
+_ARRAY_START = re.compile(r'[{\["\]\d-]')
+
+
+class StreamParseError(ValueError):
+    """스트리밍 응답이 끝나기 전에 JSON 형식이 깨진 것을 발견함 (나머지 응답을 기다리지 않고 실패)"""
+
+
+class IncrementalJSONParser:
+    """
+    모델 응답 조각을 받는 대로 JSON 구조를 따라가며, 최상위 객체의 필드(또는 최상위 배열의 항목)가
+    완성될 때마다 반환합니다. 응답 전체를 다시 파싱하지 않고 완성된 항목 하나만 json.loads로 확인합니다.
+
+    - 앞부분 설명문/코드 펜스는 허용하되, max_preamble_chars 안에 '{'나 '['가 없으면 형식 오류
+      ('['는 다음 문자가 값의 시작('{', '[', '"', 숫자, '-')이거나 ']'일 때만 최상위 배열로 봄)
+    - 괄호 짝이 맞지 않거나 완성된 항목이 JSON이 아니면 바로 StreamParseError
+    - 최상위 값이 닫힌 뒤의 내용(닫는 코드 펜스 등)은 무시
+    """
+
+    def __init__(self, max_preamble_chars: int = 512):
+        self.max_preamble_chars = max_preamble_chars
+        self.done = False
+        self.received = 0
+        self._text = ""
+        self._pos = 0
+        self._root: str | None = None
+        self._stack: list[str] = []
+        self._in_string = False
+        self._escape = False
+        self._member_start = 0
+        self._index = 0
+
+    def feed(self, chunk: str) -> list[tuple]:
+        """
+        조각을 이어 붙여 파싱하고, 이번 조각으로 완성된 항목 목록을 반환합니다.
+        객체면 [(필드 이름, 값)], 배열이면 [(항목 순번, 값)]
+        """
+        self.received += len(chunk)
+        if self.done:
+            return []
+        self._text += chunk
+        text = self._text
+        completed = []
+        pos = self._pos
+
+        if self._root is None:
+            while True:
+                match = _ROOT.search(text, pos)
+                if match is None:
+                    if len(text) > self.max_preamble_chars:
+                        raise StreamParseError(
+                            f"응답 앞 {self.max_preamble_chars}자 안에 JSON이 없습니다: {text[:80]!r}"
+                        )
+                    self._pos = len(text)
+                    return completed
+                if match.group() == "[":
+                    rest = text[match.end() :].lstrip()
+                    if not rest:
+                        # '[' 다음 문자가 아직 오지 않음: 다음 조각에서 다시 판단
+                        self._pos = match.start()
+                        return completed
+                    if not _ARRAY_START.match(rest):
+                        pos = match.end()
+                        continue
+                break
+            pos = match.end()
+            self._root = match.group()
+            self._stack.append(_CLOSERS[self._root])
+            self._member_start = pos
+
+        while True:
+            if self._in_string:
+                if self._escape:
+                    if pos >= len(text):
+                        break
+                    self._escape = False
+                    pos += 1
+                match = _IN_STRING.search(text, pos)
+                if match is None:
+                    pos = len(text)
+                    break
+                pos = match.end()
+                if match.group() == "\\":
+                    self._escape = True
+                else:
+                    self._in_string = False
+                continue
+
+            match = _STRUCTURAL.search(text, pos)
+            if match is None:
+                pos = len(text)
+                break
+            ch, pos = match.group(), match.end()
+            if ch == '"':
+                self._in_string = True
+            elif ch in _CLOSERS:
+                self._stack.append(_CLOSERS[ch])
+            elif ch == ",":
+                if len(self._stack) == 1:
+                    completed.extend(self._member(text[self._member_start : pos - 1]))
+                    self._member_start = pos
+            else:
+                if self._stack.pop() != ch:
+                    raise StreamParseError(f"응답의 괄호 짝이 맞지 않습니다. (위치 {pos - 1})")
+                if not self._stack:
+                    completed.extend(self._member(text[self._member_start : pos - 1], last=True))
+                    self.done = True
+                    break
+
+        self._pos = pos
+        return completed
+
+    def _member(self, member: str, last: bool = False) -> list[tuple]:
+        if not member.strip():
+            # 빈 객체/배열은 허용, 연속된 쉼표나 끝의 쉼표는 형식 오류
+            if last and self._index == 0:
+                return []
+            raise StreamParseError("응답에 빈 항목(연속된 쉼표)이 있습니다.")
+        try:
+            if self._root == "{":
+                value = json.loads("{" + member + "}")
+                items = list(value.items())
+            else:
+                items = [(self._index, json.loads(member))]
+        except json.JSONDecodeError as e:
+            raise StreamParseError(f"응답의 JSON 항목을 파싱할 수 없습니다: {e}") from e
+        self._index += 1
+        return items
@@ -0,0 +1,13 @@
+# conftest.py
+import os
+import sys
+
+# 테스트는 API 키 없이 로컬 대체 백엔드로 실행 (app_config가 임포트될 때 읽으므로 먼저 설정)
+os.environ["GEMINI_BACKEND"] = "local"
+os.environ["CONTEXT_CACHE_ENABLED"] = "true"
+os.environ["CONTEXT_CACHE_TTL_SECONDS"] = "60"
+os.environ["STREAMING_ENABLED"] = "false"
+os.environ["HEDGE_ENABLED"] = "false"
+
+# 서버와 같이 evaluation_report 폴더의 모듈을 최상위 이름으로 임포트
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
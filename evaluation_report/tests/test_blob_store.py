@@ -0,0 +1,73 @@
+# test_blob_store.py
+"""업로드 저장소 정리가 저장 중인 임시 파일과 처리 대기 중인 쌍의 입력을 지우지 않는지 확인"""
+import io
+import os
+import time
+
+import db_utils
+import blob_store as blob_store_module
+from blob_store import BlobStore
+from job_service import JobService
+
+
+def _age(path: str, seconds: float):
+    past = time.time() - seconds
+    os.utime(path, (past, past))
+
+
+def test_sweep_keeps_recent_part_files(tmp_path):
+    store = BlobStore(str(tmp_path), retention_days=0, max_total_mb=0)
+    writing = tmp_path / "upload-writing.part"
+    writing.write_bytes(b"x" * 10)
+    stale = tmp_path / "upload-stale.part"
+    stale.write_bytes(b"x" * 10)
+    _age(str(stale), blob_store_module.PART_GRACE_SECONDS + 60)
+
+    assert store.sweep() == 1
+    assert writing.exists()
+    assert not stale.exists()
+
+
+def test_capacity_sweep_keeps_pending_pair_inputs(tmp_path, monkeypatch):
+    monkeypatch.setattr(db_utils, "DATABASE_URL", str(tmp_path / "test.db"))
+    db_utils.init_db()
+    # 용량 한도(1MB)를 넘도록 400KB 파일 3개 저장
+    store = BlobStore(str(tmp_path / "blobs"), retention_days=1, max_total_mb=1)
+    hashes = []
+    for index, marker in enumerate(b"abc"):
+        sha256, size = store.put_stream(io.BytesIO(bytes([marker]) * 400 * 1024))
+        _age(store.path_for(sha256), 300 - index * 100)
+        hashes.append((sha256, size))
+    oldest, middle, newest = hashes
+
+    db_utils.create_job(
+        "job-pending",
+        [
+            {
+                "pair_key": "서울_1반_홍길동",
+                "report_filename": "서울_1반_홍길동_결과보고서.xlsx",
+                "report_sha256": oldest[0],
+                "report_size": oldest[1],
+            }
+        ],
+    )
+    done = db_utils.create_job(
+        "job-done",
+        [
+            {
+                "pair_key": "서울_1반_김철수",
+                "report_filename": "서울_1반_김철수_결과보고서.xlsx",
+                "report_sha256": middle[0],
+                "report_size": middle[1],
+            }
+        ],
+    )
+    db_utils.update_job_pair(done[0]["id"], "success")
+
+    removed = JobService(None, store, None).sweep_blobs()
+
+    # 가장 오래됐어도 처리 대기 중인 쌍의 입력은 남고, 처리가 끝난 쌍의 입력부터 삭제됨
+    assert removed == 1
+    assert store.exists(oldest[0])
+    assert not store.exists(middle[0])
+    assert store.exists(newest[0])
@@ -0,0 +1,89 @@
+# test_context_cache.py
+"""시스템 프롬프트 컨텍스트 캐시의 생성/재사용/연장/미스 대응과 사용량 집계 (GEMINI_BACKEND=local)"""
+import pytest
+
+from gemini_service import GeminiService, estimate_text_tokens, prompt_version
+
+SYSTEM_PROMPT = "스터디 계획서와 결과보고서를 평가하여 JSON으로만 응답하세요. " * 20
+
+
+@pytest.fixture
+def service():
+    # 서비스마다 클라이언트(로컬 캐시 저장소)를 새로 만들어 테스트끼리 캐시를 공유하지 않음
+    return GeminiService()
+
+
+def only_entry(service: GeminiService) -> dict:
+    assert len(service._prompt_caches) == 1
+    return next(iter(service._prompt_caches.values()))
+
+
+def test_first_call_creates_cache_and_next_call_reuses_it(service):
+    service.call_gemini_api(SYSTEM_PROMPT, ["첫 번째 쌍"])
+    name = only_entry(service)["name"]
+    service.call_gemini_api(SYSTEM_PROMPT, ["두 번째 쌍"])
+
+    assert only_entry(service)["name"] == name
+    stats = service.get_usage_stats()
+    assert stats["calls"] == 2
+    assert stats["cache_creates"] == 1
+    assert stats["cache_refreshes"] == 0
+
+
+def test_cache_is_refreshed_before_expiry(service):
+    service.call_gemini_api(SYSTEM_PROMPT, ["쌍"])
+    entry = only_entry(service)
+    name, expires_at = entry["name"], entry["expires_at"]
+    # 만료까지 남은 시간이 갱신 여유(cache_refresh_margin_seconds)보다 짧아지도록 당김
+    entry["expires_at"] -= 50
+
+    service.call_gemini_api(SYSTEM_PROMPT, ["쌍"])
+
+    entry = only_entry(service)
+    assert entry["name"] == name
+    assert entry["expires_at"] >= expires_at - 1
+    stats = service.get_usage_stats()
+    assert stats["cache_refreshes"] == 1
+    assert stats["cache_creates"] == 1
+
+
+def test_provider_side_cache_miss_falls_back_and_recreates(service):
+    service.call_gemini_api(SYSTEM_PROMPT, ["쌍"])
+    name = only_entry(service)["name"]
+    # 공급자 쪽에서 캐시가 사라짐 (로컬 대체 백엔드는 404를 던짐)
+    service.get_client().caches.expire(name)
+
+    assert service.call_gemini_api(SYSTEM_PROMPT, ["쌍"])
+    stats = service.get_usage_stats()
+    assert stats["cache_misses"] == 1
+    assert stats["calls"] == 2
+    assert service._prompt_caches == {}
+
+    service.call_gemini_api(SYSTEM_PROMPT, ["쌍"])
+    assert only_entry(service)["name"] != name
+    assert service.get_usage_stats()["cache_creates"] == 2
+
+
+def test_usage_stats_report_cached_token_savings(service):
+    for i in range(3):
+        service.call_gemini_api(SYSTEM_PROMPT, [f"쌍 {i}"])
+
+    stats = service.get_usage_stats()
+    assert stats["cached_tokens"] == 3 * estimate_text_tokens(SYSTEM_PROMPT)
+    assert stats["prompt_tokens"] > stats["cached_tokens"]
+    assert stats["cached_token_ratio"] == round(stats["cached_tokens"] / stats["prompt_tokens"], 4)
+    assert 0 < stats["cached_token_ratio"] < 1
+
+
+def test_call_without_cache_when_another_call_is_creating_it(service):
+    slot = service.key_pool.default_slot
+    client = service.get_client(slot.api_key)
+    # 다른 호출이 이 캐시를 만드는 중이면 기다리지 않고 캐시 없이 호출
+    service._cache_in_progress.add((slot.name, prompt_version(SYSTEM_PROMPT)))
+    assert service._get_prompt_cache(client, slot, SYSTEM_PROMPT) is None
+
+    service.call_gemini_api(SYSTEM_PROMPT, ["쌍"])
+    stats = service.get_usage_stats()
+    assert stats["calls"] == 1
+    assert stats["cached_tokens"] == 0
+    assert stats["cache_creates"] == 0
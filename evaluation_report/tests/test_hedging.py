@@ -0,0 +1,95 @@
+# test_hedging.py
+"""헤지가 이긴 뒤 버린 원래 호출의 슬롯 반납, 일일 사용량, 회로, 지연 표본 반영 (GEMINI_BACKEND=local)"""
+import time
+import asyncio
+
+import pytest
+
+import local_genai
+from gemini_service import GeminiService
+from hedging import HedgePolicy
+from key_pool import KeyPool, KeySlot
+
+PRIMARY_SECONDS = 0.6
+
+
+@pytest.fixture
+def service(monkeypatch):
+    service = GeminiService()
+    # 헤지 호출이 바로 쓸 수 있도록 슬롯 두 개
+    service.key_pool = KeyPool(
+        [KeySlot(f"key{i}", None, "gemini-2.5-flash", 6000) for i in (1, 2)]
+    )
+    service.hedge_policy = HedgePolicy(
+        percentile=50, budget_ratio=1.0, min_samples=1, min_delay=0.05
+    )
+    service.hedge_policy.record(100, 0.05)
+    service.daily_usage = []
+
+    async def record_daily_usage(slot, error=None):
+        service.daily_usage.append((slot.name, error))
+
+    monkeypatch.setattr(service, "_record_daily_usage", record_daily_usage)
+    return service
+
+
+def slow_first_call(monkeypatch, primary_error=None):
+    """첫 호출(원래 호출)만 느리게 끝나고, 헤지 호출은 바로 응답"""
+    generate = local_genai._LocalModels.generate_content
+    calls = []
+
+    def fake_generate(self, **kwargs):
+        calls.append(time.monotonic())
+        if len(calls) == 1:
+            time.sleep(PRIMARY_SECONDS)
+            if primary_error:
+                raise primary_error
+        return generate(self, **kwargs)
+
+    monkeypatch.setattr(local_genai._LocalModels, "generate_content", fake_generate)
+    return calls
+
+
+def run_hedged(service: GeminiService) -> str:
+    async def scenario():
+        async def call():
+            return await service.call_gemini_api_async("JSON으로만 응답하세요.", ["쌍"])
+
+        text = await service.process_with_rate_limit("k", call, estimated_tokens=100)
+        # 버린 원래 호출이 끝나 슬롯을 반납할 때까지 기다림
+        await asyncio.gather(*service._settling)
+        return text
+
+    return asyncio.run(scenario())
+
+
+def test_abandoned_primary_is_settled_with_its_real_latency(service, monkeypatch):
+    calls = slow_first_call(monkeypatch)
+    started = time.monotonic()
+
+    assert run_hedged(service)
+
+    assert len(calls) == 2
+    assert [slot.in_flight for slot in service.key_pool.slots] == [0, 0]
+    assert sum(slot.calls for slot in service.key_pool.slots) == 2
+    assert sorted(name for name, _ in service.daily_usage) == ["key1", "key2"]
+    # 헤지로 줄어든 시간이 아니라 원래 호출의 실제 지연이 표본에 들어감
+    samples = list(service.hedge_policy._all_samples)
+    assert len(samples) == 2
+    assert samples[-1] >= PRIMARY_SECONDS
+    assert time.monotonic() - started >= PRIMARY_SECONDS
+    assert service.hedge_policy.hedges == 1
+
+
+def test_abandoned_primary_failure_reaches_circuit_breaker(service, monkeypatch):
+    slow_first_call(monkeypatch, ConnectionError("연결 끊김"))
+
+    assert run_hedged(service)
+
+    assert service.breaker.consecutive_failures == 1
+    errors = [error for _, error in service.daily_usage]
+    assert len(errors) == 2
+    assert sum(isinstance(error, ConnectionError) for error in errors) == 1
+    assert [slot.in_flight for slot in service.key_pool.slots] == [0, 0]
+    # 실패한 호출의 지연은 표본에 넣지 않음
+    assert len(service.hedge_policy._all_samples) == 1
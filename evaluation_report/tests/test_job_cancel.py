@@ -0,0 +1,74 @@
+# test_job_cancel.py
+"""작업이 취소되면 진행 이벤트 구독이 끝나고 보관 기간 뒤 이력이 정리되는지 확인"""
+import io
+import asyncio
+import types
+
+import pytest
+
+import db_utils
+from blob_store import BlobStore
+from event_bus import EventBus
+from gemini_service import GeminiService
+from job_service import JobService
+
+
+class HangingPipeline:
+    """모델 호출 중에 멈춘 것처럼 취소될 때까지 끝나지 않는 파이프라인"""
+
+    def __init__(self):
+        self.analysis_service = types.SimpleNamespace(gemini_service=GeminiService())
+        self.started = asyncio.Event()
+
+    async def run(self, pairs, system_prompt, **kwargs):
+        self.started.set()
+        await asyncio.Event().wait()
+
+
+@pytest.fixture
+def job_service(tmp_path, monkeypatch):
+    monkeypatch.setattr(db_utils, "DATABASE_URL", str(tmp_path / "test.db"))
+    db_utils.init_db()
+    blob_store = BlobStore(str(tmp_path / "blobs"), retention_days=1, max_total_mb=10)
+    return JobService(HangingPipeline(), blob_store, EventBus(retention_seconds=0))
+
+
+def test_cancelled_job_ends_subscribers_and_is_pruned(job_service):
+    sha256, size = job_service.blob_store.put_stream(io.BytesIO(b"report"))
+    rows = db_utils.create_job(
+        "job-1",
+        [
+            {
+                "pair_key": "서울_1반_홍길동",
+                "report_filename": "서울_1반_홍길동_결과보고서.xlsx",
+                "report_sha256": sha256,
+                "report_size": size,
+            }
+        ],
+    )
+    event_bus = job_service.event_bus
+
+    async def scenario():
+        pipeline = job_service.pipeline
+        run = asyncio.create_task(job_service.run_pairs("job-1", rows, "시스템 프롬프트"))
+        await pipeline.started.wait()
+
+        async def collect():
+            return [event["type"] async for event in event_bus.subscribe("job-1", 0.05) if event]
+
+        subscriber = asyncio.create_task(collect())
+        await asyncio.sleep(0.1)
+        run.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await run
+        # 취소 이벤트를 받으면 하트비트만 보내며 남아 있지 않고 끝나야 함
+        return await asyncio.wait_for(subscriber, 1)
+
+    received = asyncio.run(scenario())
+
+    assert received == ["job_started", "job_cancelled"]
+    assert db_utils.get_job_pairs("job-1")[0]["status"] == "cancelled"
+    # 보관 기간(0초)이 지난 취소 작업 이력은 다음 발행 때 정리됨
+    event_bus.publish("job-2", "job_started", total_pairs=0)
+    assert "job-1" not in event_bus._history
+    assert "job-1" not in event_bus._finished_at
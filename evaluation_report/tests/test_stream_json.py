@@ -0,0 +1,46 @@
+# test_stream_json.py
+"""스트리밍 응답의 점진적 JSON 파싱과 형식 오류 시 전체 응답으로 처리하는 동작"""
+import json
+
+import pytest
+
+from gemini_service import GeminiService
+from stream_json import IncrementalJSONParser, StreamParseError
+
+
+def feed_all(parser: IncrementalJSONParser, chunks: list[str]) -> list[tuple]:
+    return [item for chunk in chunks for item in parser.feed(chunk)]
+
+
+def test_bracketed_preamble_is_not_taken_as_root():
+    parser = IncrementalJSONParser()
+    assert parser.feed('[분석 결과]\n{"a": 1}') == [("a", 1)]
+    assert parser.done
+
+
+def test_array_root_split_right_after_bracket():
+    parser = IncrementalJSONParser()
+    items = feed_all(parser, ["```json\n[", '\n  {"pair_key": "k1"}', ', {"pair_key": "k2"}]'])
+    assert items == [(0, {"pair_key": "k1"}), (1, {"pair_key": "k2"})]
+
+
+def test_mismatched_brackets_still_raise():
+    with pytest.raises(StreamParseError):
+        IncrementalJSONParser().feed('{"a": [1}')
+
+
+def test_stream_parse_error_falls_back_to_full_response():
+    service = GeminiService()
+    service.streaming_enabled = True
+    received = []
+
+    def on_chunk(text: str):
+        received.append(text)
+        raise StreamParseError("테스트용 형식 오류")
+
+    text = service.call_gemini_api("JSON으로만 응답하세요.", ["쌍"], on_chunk)
+
+    # 첫 조각 이후로는 콜백을 부르지 않지만 응답은 끝까지 받음
+    assert len(received) == 1
+    assert json.loads(text)
+    assert service.get_usage_stats()["calls"] == 1
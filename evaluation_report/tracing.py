@@ -0,0 +1,79 @@
+# tracing.py
+import time
+import uuid
+import logging
+import threading
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+from typing import Optional
+
+import app_config
+
+logger = logging.getLogger(__name__)
+
+# 현재 진행 중인 스팬 (중첩된 스팬의 부모로 사용)
+_current_span: contextvars.ContextVar[Optional[dict]] = contextvars.ContextVar(
+    "current_span", default=None
+)
+
+
+class Tracer:
+    """
+    쌍(pair) 단위 처리 구간을 작업 ID(job_id)에 묶어 기록하는 가벼운 트레이서입니다.
+    완료된 스팬은 고정 크기 링 버퍼에만 보관하므로 운영 중에도 켜 둘 수 있습니다.
+    """
+
+    def __init__(self, enabled: bool, buffer_size: int):
+        self.enabled = enabled
+        self._spans: deque = deque(maxlen=buffer_size)
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name: str, job_id: Optional[str] = None, key: Optional[str] = None, **attrs):
+        """구간을 기록합니다. job_id/key가 없으면 부모 스팬의 값을 물려받습니다."""
+        if not self.enabled:
+            yield None
+            return
+
+        parent = _current_span.get()
+        span = {
+            "trace_id": job_id or (parent and parent["trace_id"]) or "-",
+            "span_id": uuid.uuid4().hex[:16],
+            "parent_id": parent["span_id"] if parent else None,
+            "name": name,
+            "key": key or (parent and parent["key"]),
+            "attributes": attrs,
+            "start_time": time.time(),
+            "status": "ok",
+        }
+        token = _current_span.set(span)
+        started = time.perf_counter()
+        try:
+            yield span
+        except BaseException as e:
+            span["status"] = "error"
+            span["error"] = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            _current_span.reset(token)
+            span["duration_ms"] = round((time.perf_counter() - started) * 1000, 2)
+            with self._lock:
+                self._spans.append(span)
+            logger.debug(
+                f"[trace {span['trace_id']}] {span['key']} {name} {span['duration_ms']}ms"
+            )
+
+    def get_spans(self, job_id: Optional[str] = None, key: Optional[str] = None) -> list[dict]:
+        """보관 중인 스팬을 작업 ID/쌍 키로 필터링해 반환합니다."""
+        with self._lock:
+            spans = list(self._spans)
+        return [
+            span
+            for span in spans
+            if (job_id is None or span["trace_id"] == job_id)
+            and (key is None or key in (span["key"] or "").split("+"))
+        ]
+
+
+tracer = Tracer(app_config.TRACE_ENABLED, app_config.TRACE_BUFFER_SIZE)
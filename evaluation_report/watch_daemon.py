@@ -0,0 +1,255 @@
+# watch_daemon.py
+import os
+import time
+import uuid
+import asyncio
+import logging
+from typing import Optional
+
+import app_config
+import db_utils
+import file_utils
+from blob_store import BlobStore, StoredFile
+
+logger = logging.getLogger(__name__)
+
+
+class WatchFolderDaemon:
+    """
+    드롭 폴더를 감시하여 새로 생기거나 바뀐 계획서/보고서를 분석 파이프라인에 넣습니다.
+
+    - 쓰기가 끝나지 않은 파일은 크기/수정 시각이 settle_seconds 동안 변하지 않을 때까지 기다림
+    - 파일은 내용 해시로 식별 (크기/수정 시각이 체크포인트와 같으면 다시 해시하지 않음)
+    - 같은 키의 계획서와 보고서가 모이면 처리, 짝이 pair_timeout_seconds 안에 오지 않으면 단독 처리
+    - 처리 결과는 DB 체크포인트에 기록하여, 재시작해도 같은 내용의 쌍은 다시 평가하지 않음
+      (내용이 바뀐 쌍은 기존 결과 ID에 덮어씀)
+    """
+
+    def __init__(
+        self,
+        watch_dir: str,
+        job_service,
+        system_prompt: str,
+        settle_seconds: float = app_config.WATCH_SETTLE_SECONDS,
+        pair_timeout_seconds: float = app_config.WATCH_PAIR_TIMEOUT_SECONDS,
+    ):
+        self.watch_dir = os.path.abspath(watch_dir)
+        self.job_service = job_service
+        self.analysis_service = job_service.pipeline.analysis_service
+        self.blob_store: BlobStore = job_service.blob_store
+        self.system_prompt = system_prompt
+        self.settle_seconds = settle_seconds
+        self.pair_timeout_seconds = pair_timeout_seconds
+
+        # 안정화 대기 중인 파일: 경로 -> (크기, 수정 시각, 마지막으로 바뀐 시각)
+        self._pending: dict[str, tuple[int, int, float]] = {}
+        # 짝을 기다리는 파일: 매칭 키 -> {"plan"/"report": StoredFile, "since": 시각}
+        self._staged: dict[str, dict] = {}
+        # 처리 중인 매칭 키와 배치 작업
+        self._running_keys: set[str] = set()
+        self._tasks: set[asyncio.Task] = set()
+
+    async def run(self):
+        from watchfiles import Change, awatch
+
+        os.makedirs(self.watch_dir, exist_ok=True)
+        logger.info(f"감시 폴더 모니터링 시작: {self.watch_dir}")
+
+        # 일일 한도 초과로 미룬 쌍은 한도 초기화 이후 자동으로 처리
+        deferred_task = asyncio.create_task(
+            self.job_service.run_deferred_periodically(
+                self.system_prompt, app_config.DEFERRED_POLL_SECONDS
+            )
+        )
+        self._tasks.add(deferred_task)
+
+        # 꺼져 있는 동안 들어온 파일도 처리 (처리 완료된 쌍은 체크포인트로 건너뜀)
+        for root, _, files in os.walk(self.watch_dir):
+            for name in files:
+                self._mark_changed(os.path.join(root, name))
+
+        # 변경이 없어도 주기적으로 깨어나 안정화된 파일/짝 대기 시간을 확인
+        async for changes in awatch(
+            self.watch_dir,
+            debounce=int(self.settle_seconds * 1000 / 2),
+            rust_timeout=int(self.settle_seconds * 1000),
+            yield_on_timeout=True,
+        ):
+            for change, path in changes:
+                if change == Change.deleted:
+                    self._pending.pop(path, None)
+                else:
+                    self._mark_changed(path)
+            await self._process_settled()
+            self._dispatch_ready_pairs()
+
+    def _mark_changed(self, path: str):
+        if not file_utils.is_analysis_candidate(os.path.basename(path)):
+            return
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return
+        self._pending[path] = (stat.st_size, stat.st_mtime_ns, time.monotonic())
+
+    async def _process_settled(self):
+        """크기/수정 시각이 settle_seconds 동안 그대로인 파일을 저장소에 넣고 짝 대기열에 올립니다."""
+        now = time.monotonic()
+        for path, (size, mtime_ns, changed_at) in list(self._pending.items()):
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                del self._pending[path]
+                continue
+            if (stat.st_size, stat.st_mtime_ns) != (size, mtime_ns):
+                # 아직 쓰는 중
+                self._pending[path] = (stat.st_size, stat.st_mtime_ns, now)
+                continue
+            if now - changed_at < self.settle_seconds:
+                continue
+
+            del self._pending[path]
+            try:
+                await self._stage_file(path, stat)
+            except Exception as e:
+                logger.error(f"감시 파일 처리 실패 ({path}): {e}")
+
+    async def _stage_file(self, path: str, stat: os.stat_result):
+        relative = os.path.relpath(path, self.watch_dir)
+        kind = file_utils.classify_upload_name(relative)
+        key = self.analysis_service.get_matching_key(os.path.basename(path))
+        if kind is None or key is None:
+            logger.warning(f"계획서/보고서를 구분할 수 없어 건너뜁니다: {relative}")
+            return
+
+        checkpoint = await asyncio.to_thread(db_utils.get_watch_file, path)
+        if (
+            checkpoint
+            and (checkpoint["size"], checkpoint["mtime_ns"]) == (stat.st_size, stat.st_mtime_ns)
+            and self.blob_store.exists(checkpoint["sha256"])
+        ):
+            sha256, size = checkpoint["sha256"], checkpoint["size"]
+        else:
+            sha256, size = await asyncio.to_thread(self._store_file, path)
+            await asyncio.to_thread(
+                db_utils.save_watch_file, path, stat.st_size, stat.st_mtime_ns, sha256
+            )
+
+        staged = self._staged.setdefault(key, {"since": time.monotonic()})
+        staged[kind] = StoredFile(self.blob_store, os.path.basename(path), sha256, size)
+        logger.info(f"[{key}] 감시 폴더 파일 감지: {relative}")
+
+    def _store_file(self, path: str) -> tuple[str, int]:
+        with open(path, "rb") as f:
+            return self.blob_store.put_stream(f)
+
+    def _dispatch_ready_pairs(self):
+        """짝이 모였거나 짝 대기 시간이 지난 쌍을 하나의 작업으로 묶어 백그라운드에서 처리합니다."""
+        now = time.monotonic()
+        ready = []
+        for key, staged in list(self._staged.items()):
+            if key in self._running_keys:
+                continue
+            complete = "plan" in staged and "report" in staged
+            if complete or now - staged["since"] >= self.pair_timeout_seconds:
+                del self._staged[key]
+                ready.append((key, staged.get("plan"), staged.get("report")))
+        if not ready:
+            return
+
+        self._running_keys.update(key for key, _, _ in ready)
+        task = asyncio.create_task(self._run_pairs(ready))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run_pairs(self, pairs: list[tuple]):
+        try:
+            # 같은 내용으로 이미 성공했거나 일일 한도로 미뤄둔 쌍은 건너뛰고,
+            # 내용이 바뀐 쌍은 기존 결과에 덮어씀
+            runnable, previous_results = [], {}
+            for key, plan, report in pairs:
+                checkpoint = await asyncio.to_thread(db_utils.get_watch_pair, key)
+                hashes = (plan.sha256 if plan else None, report.sha256 if report else None)
+                if (
+                    checkpoint
+                    and checkpoint["status"] in ("success", "deferred")
+                    and hashes == (checkpoint["plan_sha256"], checkpoint["report_sha256"])
+                ):
+                    logger.info(f"[{key}] 이미 같은 내용으로 처리되어 건너뜁니다. ({checkpoint['status']})")
+                    continue
+                if checkpoint and checkpoint["result_id"]:
+                    previous_results[key] = checkpoint["result_id"]
+                runnable.append((key, plan, report))
+            if not runnable:
+                return
+
+            job_id = f"watch-{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}"
+            logger.info(f"[{job_id}] 감시 폴더 쌍 {len(runnable)}건 평가 시작")
+            pair_rows = await self.job_service.create_job(job_id, runnable)
+            for row in pair_rows:
+                row["result_id"] = previous_results.get(row["pair_key"])
+            results = await self.job_service.run_pairs(
+                job_id,
+                pair_rows,
+                self.system_prompt,
+                overwrite_results=True,
+                uploader="watch-folder",
+            )
+
+            files_by_key = {key: (plan, report) for key, plan, report in runnable}
+            for result in results:
+                plan, report = files_by_key[result["key"]]
+                await asyncio.to_thread(
+                    db_utils.save_watch_pair,
+                    result["key"],
+                    plan.sha256 if plan else None,
+                    report.sha256 if report else None,
+                    result["status"],
+                    result.get("result_id"),
+                    job_id,
+                )
+            success_count = sum(1 for r in results if r["status"] == "success")
+            logger.info(f"[{job_id}] 감시 폴더 평가 완료: 성공 {success_count}/{len(results)}")
+        except Exception as e:
+            logger.error(f"감시 폴더 작업 처리 실패: {e}")
+        finally:
+            self._running_keys.difference_update(key for key, _, _ in pairs)
+
+
+def run_watch_daemon(watch_dir: Optional[str] = None):
+    """감시 폴더 데몬을 실행합니다. (서버와 같은 파이프라인/저장소/DB 사용)"""
+    from gemini_service import GeminiService
+    from analysis_service import AnalysisService
+    from pipeline import EvaluationPipeline
+    from event_bus import EventBus
+    from job_service import JobService
+    from extraction_cache import ExtractionCache
+
+    app_config.validate_api_settings()
+    system_prompt = file_utils.load_system_prompt(app_config.SYSTEM_PROMPT_PATH)
+    db_utils.init_db()
+
+    gemini_service = GeminiService()
+    event_bus = EventBus()
+    pipeline = EvaluationPipeline(
+        AnalysisService(
+            gemini_service, event_bus, extraction_cache=ExtractionCache.from_config()
+        ),
+        model_workers=max(
+            app_config.PIPELINE_MODEL_WORKERS, gemini_service.key_pool.capacity + 1
+        ),
+    )
+    blob_store = BlobStore(
+        app_config.UPLOAD_STORE_PATH,
+        app_config.UPLOAD_RETENTION_DAYS,
+        app_config.UPLOAD_STORE_MAX_MB,
+    )
+    daemon = WatchFolderDaemon(
+        watch_dir or app_config.WATCH_FOLDER_PATH,
+        JobService(pipeline, blob_store, event_bus),
+        system_prompt,
+    )
+    try:
+        asyncio.run(daemon.run())
+    except KeyboardInterrupt:
+        logger.info("감시 폴더 모니터링 종료")
@@ -8,6 +8,83 @@ const resultContainer = document.getElementById("resultContainer");
 // (참고: 로컬에서 실행시 http://127.0.0.1:8000 로 변경)
 const BASE_URL = "http://127.0.0.1:8000";
 const UPLOAD_URL = `${BASE_URL}/upload-and-analyze`;
+const JOB_EVENTS_URL = (jobId) => `${BASE_URL}/jobs/${jobId}/events`;
+
+// 쌍(pair)별 진행 단계 한글 매핑
+const PROGRESS_LABELS = {
+  queued: "대기열 등록",
+  extracting: "파일 추출 중",
+  waiting_for_quota: "호출 한도 대기 중",
+  calling_model: "AI 분석 중",
+  coalesced: "같은 쌍 처리 결과 대기 중",
+  saved: "저장 완료",
+  failed: "실패",
+  deferred: "한도 초기화 이후로 미룸",
+  review: "유사 보고서 검토 대기",
+};
+
+// 더 이상 진행되지 않는 단계 (완료 건수에 포함)
+const FINAL_STAGES = new Set(["saved", "failed", "deferred", "review"]);
+
+// ✨ (신규) 서버가 보내는 진행 이벤트(SSE)를 구독하여 상태 영역에 표시합니다.
+function subscribeJobProgress(jobId) {
+  const source = new EventSource(JOB_EVENTS_URL(jobId));
+  const pairStages = {};
+  let totalPairs = 0;
+  let etaSeconds = null;
+
+  const render = () => {
+    const stages = Object.values(pairStages);
+    const done = stages.filter((s) => FINAL_STAGES.has(s)).length;
+    const failed = stages.filter((s) => s === "failed").length;
+    const waiting = stages.filter((s) => s === "deferred" || s === "review").length;
+    const waitingText = waiting > 0 ? `, 미룸/검토 대기 ${waiting}건` : "";
+    const etaText =
+      etaSeconds !== null ? `, 예상 대기 약 ${Math.ceil(etaSeconds)}초` : "";
+    statusDiv.textContent = `분석 진행 중... ${done}/${totalPairs}건 완료 (실패 ${failed}건${waitingText}${etaText})`;
+  };
+
+  const onPairEvent = (event) => {
+    const data = JSON.parse(event.data);
+    pairStages[data.key] = data.type;
+    if (data.eta_seconds !== undefined) {
+      etaSeconds = data.eta_seconds;
+    }
+    console.log(`[${data.key}] ${PROGRESS_LABELS[data.type] || data.type}`);
+    render();
+  };
+
+  source.addEventListener("job_started", (event) => {
+    const data = JSON.parse(event.data);
+    totalPairs = data.total_pairs;
+    etaSeconds = data.eta_seconds;
+    render();
+  });
+  Object.keys(PROGRESS_LABELS).forEach((type) =>
+    source.addEventListener(type, onPairEvent)
+  );
+  // 유사 보고서 표시 (평가는 계속 진행되므로 진행 단계는 바꾸지 않음)
+  source.addEventListener("near_duplicate", (event) => {
+    const data = JSON.parse(event.data);
+    console.log(`[${data.key}] 유사 보고서 ${data.near_duplicates.length}건 발견`);
+  });
+  // 스트리밍 응답에서 먼저 완성된 필드 (진행 단계는 바꾸지 않음)
+  source.addEventListener("partial", (event) => {
+    const data = JSON.parse(event.data);
+    if (data.field === "total") {
+      console.log(`[${data.key}] 총점 ${data.value}점 수신, 나머지 응답 대기 중`);
+    }
+  });
+  source.addEventListener("job_completed", () => source.close());
+  // 작업이 취소되면 완료 이벤트 없이 끝나므로 여기서 구독 종료
+  source.addEventListener("job_cancelled", (event) => {
+    const data = JSON.parse(event.data);
+    statusDiv.textContent = `작업이 취소되었습니다. (처리하지 못한 쌍 ${data.cancelled_count}건)`;
+    source.close();
+  });
+
+  return source;
+}
 
 // ✨ (중요) 이 함수는 detail.js에서도 재사용됩니다.
 function renderResultHTML(data, filename) {
@@ -121,11 +198,19 @@ if (uploadForm) {
     // ✨ (수정) resultContainer.innerHTML = ""; 를 try 블록 내부로 이동
     // resultContainer.innerHTML = ""; // <-- 이 줄을 삭제
 
+    // ✨ (신규) 업로드 전에 job_id를 정하고 진행 이벤트 구독을 시작합니다.
+    const jobId = crypto.randomUUID().replace(/-/g, "");
+    const progressSource = subscribeJobProgress(jobId);
+
     try {
-      const response = await fetch(UPLOAD_URL, {
-        method: "POST",
-        body: formData,
-      });
+      const response = await fetch(
+        `${UPLOAD_URL}?job_id=${encodeURIComponent(jobId)}`,
+        {
+          method: "POST",
+          body: formData,
+        }
+      );
+      progressSource.close();
 
       if (response.ok) {
         const responseData = await response.json();
@@ -217,6 +302,7 @@ if (uploadForm) {
         statusDiv.textContent = `❌ 업로드 실패: ${response.statusText}`;
       }
     } catch (error) {
+      progressSource.close();
       console.error("업로드 중 오류 발생:", error);
       // ✨ (수정) 오류 발생 시에도 '업로드 중' 메시지를 덮어씁니다.
       statusDiv.textContent = `❌ 오류 발생: ${error.message}`;
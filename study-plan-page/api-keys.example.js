@@ -1,3 +0,0 @@
-// API Keys Configuration Template
-// Copy this file to api-keys.js and add your actual API keys
-export const GEMINI_API_KEY = "YOUR_GEMINI_API_KEY_HERE";
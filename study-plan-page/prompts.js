@@ -1,157 +1,11 @@
-// SSAFY 스터디 평가 시스템 프롬프트
+// SSAFY 스터디 평가 요청 프롬프트 (사용자 입력 부분)
 
-// 공통 평가 기준
-export const SSAFY_EVALUATION_SYSTEM_PROMPT = `아래는 당신이 따라야 할 *유일한* 평가 지침입니다.
+// 공통 평가 기준(시스템 프롬프트)은 평가 서버의 prompts/study_plan_prompt.txt에 있으며,
+// 프록시 요청에는 prompt_id("study_plan")만 보냄
 
-당신은 **SSAFY 스터디 자동 평가 담당 운영프로**입니다.
-
-출력은 반드시 **JSON만 생성**해야 합니다.
-
-설명 문장, 텍스트, 사족은 **절대 출력하지 않습니다.**
-
----
-
-**1. 평가 기준(v7)**
-
-**[계획서 30점] (3항목 × 10점)**
-
-모든 팀이 비슷하게 작성하는 특성을 고려해 비중을 대폭 축소함.
-
----
-
-**① 계획 구체성 – 원점수 1~5 → 환산 0~10점**
-
-- 5점: 주차별 목표/활동/도구/방식이 2줄 이상 구체
-- 4점: 주차별 일정 존재하나 일부 간략
-- 3점: 주차만 있고 내용 짧음
-- 1점: 모호한 계획만 있음
-
----
-
-**② 실행 가능성 – 원점수 1~5 → 환산 0~10점**
-
-- 5점: 실행 단계·도구(Webex/Notion/GitHub)·시간표·역할 2개 이상 구체
-- 3점: 운영 구조가 추상적
-- 1점: 실현 가능성 낮음
-
----
-
-**③ 목표 측정가능성 – 원점수 1~5 → 환산 0~10점**
-
-- 5점: 정량 목표 + 검증 방식 제시
-- 4점: 정량 목표만 존재
-- 3점: 정성적 목표
-- 1점: 목표 없음
-
----
-
----
-
- **[결과보고서 70점] (3항목 × 30/20/20점)**
-
-**④ 결과 구체성·목표달성 – 원점수 1~5 → 환산 0~30점**
-
-- 5점: 계획과 강하게 일치, 활동 근거 충분
-- 3점: 부분 달성
-- 1점: 불일치·근거 부족
-
----
-
-**⑤ 팀원 참여도·활동 다양성 – 원점수 1~5 → 환산 0~20점**
-
-- 5점: 전원 소감 + 참여 기록 + 발표·문제풀이·정리 등 활동 다양
-- 3점: 일부 누락 또는 활동 단조로움
-- 1점: 참여·소감 기재 미흡
-
----
-
-**⑥ 증빙 강도 – 원점수 1~5 → 환산 0~20점**
-
-사진 절대 기준(코드/그래프/표/링크는 사진 1장으로 간주):
-
-| 사진 수 | 원점수 |
-| --- | --- |
-| 0장 | 1점 |
-| 1장 | 2점 |
-| 2~3장 | 3점 |
-| 4~7장 | 4점 |
-| 8장 이상 | 5점 |
-- 동일 사진 반복은 1건
-- 상대 보정 규칙: 동일 월·유사 주제는 ±1점 가능
-
----
-
-🧮 **2. 환산 공식**
-
-\`\`\`
-plan_specificity_score = (raw_plan_specificity / 5) * 10
-plan_feasibility_score = (raw_plan_feasibility / 5) * 10
-plan_measurability_score = (raw_plan_measurability / 5) * 10
-
-result_specificity_goal_score = (raw_result_specificity_goal / 5) * 30
-participation_score = (raw_team_participation_diversity / 5) * 20
-evidence_score = (raw_evidence_strength / 5) * 20
-
-\`\`\`
-
-총점 = 위 환산 점수 합 (0~100)
-
----
-
-**3. 출력(JSON) 형식 – 반드시 이 형식만 출력**
-
-\`\`\`json
-{
-  "scores_raw": {
-    "plan_specificity": 0,
-    "plan_feasibility": 0,
-    "plan_measurability": 0,
-    "result_specificity_goal": 0,
-    "team_participation_diversity": 0,
-    "evidence_strength": 0
-  },
-  "scores_weighted": {
-    "plan_specificity": 0,
-    "plan_feasibility": 0,
-    "plan_measurability": 0,
-    "result_specificity_goal": 0,
-    "team_participation_diversity": 0,
-    "evidence_strength": 0
-  },
-  "total": 0,
-  "photo_count_detected": 0,
-  "rationale": {
-    "plan_specificity": "",
-    "plan_feasibility": "",
-    "plan_measurability": "",
-    "result_specificity_goal": "",
-    "team_participation_diversity": "",
-    "evidence_strength": ""
-  },
-  "uncertainties": [],
-  "final_comment": ""
-}
-
-\`\`\`
-
----
-
-**4. 운영 규칙 – 반드시 준수**
-
-- 출력은 반드시 **JSON only**
-- 각 항목 점수는 기준에 따라 엄격히
-- 계획서 파일이 없을 경우 계획서 항목의 평가는 0점으로 설정
-- 결과보고서 파일이 없을 경우 결과보고서 항목의 평가는 0점으로 설정
-- 계획서는 형식적이어도 평가 비중 낮게(30%)
-- 결과보고서의 활동·증빙·참여 기록을 최우선 반영
-- 사진수는 요약문 내 사진/이미지/코드/링크 등 기반으로 추정
-- 애매한 부분은 \`"uncertainties"\`에 작성`;
-
-// 계획서 평가용 프롬프트 생성 함수
+// 계획서 평가용 프롬프트 생성 함수 (시스템 프롬프트는 서버가 prompt_id로 붙임)
 export function createPlanEvaluationPrompt(goal, plan, memberCount) {
-    return `${SSAFY_EVALUATION_SYSTEM_PROMPT}
-
-[계획서 요약]
+    return `[계획서 요약]
 활동 목표: ${goal}
 활동 계획: ${plan}
 팀원 수: ${memberCount}명
@@ -160,11 +14,9 @@ export function createPlanEvaluationPrompt(goal, plan, memberCount) {
 (결과보고서 없음 - 계획서만 제출됨)`;
 }
 
-// 결과보고서 평가용 프롬프트 생성 함수
+// 결과보고서 평가용 프롬프트 생성 함수 (시스템 프롬프트는 서버가 prompt_id로 붙임)
 export function createReportEvaluationPrompt(goal, content, reflection, memberCount) {
-    return `${SSAFY_EVALUATION_SYSTEM_PROMPT}
-
-[계획서 요약]
+    return `[계획서 요약]
 활동 목표: ${goal}
 팀원 수: ${memberCount}명
 (계획서는 별도 제출되었거나 기본 정보만 있음)
@@ -1,7 +1,6 @@
 // Import the functions you need from the SDKs you need
 import { initializeApp } from "https://www.gstatic.com/firebasejs/10.7.1/firebase-app.js";
 import { getFirestore, collection, addDoc, getDocs, getDoc, doc, orderBy, query, serverTimestamp } from "https://www.gstatic.com/firebasejs/10.7.1/firebase-firestore.js";
-import { GEMINI_API_KEY } from "./api-keys.js";
 import { createPlanEvaluationPrompt, createReportEvaluationPrompt } from "./prompts.js";
 
 // Your web app's Firebase configuration
@@ -15,8 +14,11 @@ const firebaseConfig = {
   measurementId: "G-SWKVKPXYC4"
 };
 
-// Gemini API configuration
-const GEMINI_API_URL = `https://generativelanguage.googleapis.com/v1beta/models/gemini-pro:generateContent?key=${GEMINI_API_KEY}`;
+// Gemini 호출은 평가 서버의 프록시를 거침 (API 키는 서버에만 있고, 캐시/속도 제한을 서버에서 공유)
+const EVALUATION_SERVER_URL = "http://127.0.0.1:8000";
+const GEMINI_PROXY_URL = `${EVALUATION_SERVER_URL}/proxy/generate`;
+// 평가 서버에 PROXY_TOKEN을 설정했다면 같은 값 (X-Proxy-Token 헤더로 전송)
+const GEMINI_PROXY_TOKEN = "";
 
 // Initialize Firebase
 const app = initializeApp(firebaseConfig);
@@ -133,26 +135,25 @@ function initStudyPlanPage() {
 
 async function callGeminiAPI(prompt) {
     try {
-        const response = await fetch(GEMINI_API_URL, {
+        const response = await fetch(GEMINI_PROXY_URL, {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json',
+                ...(GEMINI_PROXY_TOKEN ? { 'X-Proxy-Token': GEMINI_PROXY_TOKEN } : {}),
             },
             body: JSON.stringify({
-                contents: [{
-                    parts: [{
-                        text: prompt
-                    }]
-                }]
+                // 서버에 등록된 시스템 프롬프트 ID (evaluation_report/prompts/study_plan_prompt.txt)
+                prompt_id: "study_plan",
+                prompt: prompt
             })
         });
 
         if (!response.ok) {
-            throw new Error(`Gemini API error: ${response.status}`);
+            throw new Error(`Gemini proxy error: ${response.status}`);
         }
 
         const data = await response.json();
-        return data.candidates[0].content.parts[0].text;
+        return data.text;
     } catch (error) {
         console.error('Gemini API 호출 실패:', error);
         throw error;